@@ -0,0 +1,18 @@
+"""
+ASGI config for benniewilliams project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Gunicorn serves it with uvicorn workers when ``SERVER_MODE=asgi`` (see
+``gunicorn.conf.py``).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benniewilliams.settings.dev")
+
+application = get_asgi_application()
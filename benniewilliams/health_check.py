@@ -1,99 +1,145 @@
 """
 Health check views for monitoring deployment status
+
+``/health/`` is a liveness probe: it answers from memory and touches neither
+the database nor the cache, so load balancers can poll it as often as they
+like. ``/ready/`` reports the dependency checks that a background thread in
+each process runs every ``HEALTH_CHECK_INTERVAL`` seconds, with the time
+each check took, and is not ready until a recent round has passed. Both
+views are async, so under ASGI they answer from the event loop even while
+every thread is busy.
 """
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db import connection
-from django.core.cache import cache
-import logging
 
 logger = logging.getLogger(__name__)
 
+APPLICATION = "benniewilliams-wagtail"
 
-@csrf_exempt
-@require_http_methods(["GET"])
-def health_check(request):
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def check_cache():
+    # A read is enough to prove the backend answers, and writes nothing
+    cache.get("readiness_check")
+
+
+def check_static_files():
+    if not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+        raise FileNotFoundError(f"STATIC_ROOT {settings.STATIC_ROOT!r} does not exist")
+
+
+CHECKS = {
+    "database": check_database,
+    "cache": check_cache,
+    "static_files": check_static_files,
+}
+
+
+class HealthMonitor:
     """
-    Simple health check endpoint for load balancers and monitoring
-    Returns JSON with system status
+    Runs ``CHECKS`` on a daemon thread and keeps the latest results in memory
+
+    The thread is started by the first readiness probe in each process
+    (after any pre-fork), so management commands never start one.
     """
-    try:
-        # Check database connectivity
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            db_status = "healthy"
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        db_status = "unhealthy"
-
-    # Check cache connectivity (Redis or database cache)
-    try:
-        cache.set('health_check', 'ok', 10)
-        cache_result = cache.get('health_check')
-        cache_status = "healthy" if cache_result == 'ok' else "unhealthy"
-    except Exception as e:
-        logger.error(f"Cache health check failed: {e}")
-        cache_status = "unhealthy"
-
-    overall_status = "healthy" if (db_status == "healthy" and cache_status == "healthy") else "unhealthy"
 
-    response_data = {
-        "status": overall_status,
-        "database": db_status,
-        "cache": cache_status,
-        "application": "benniewilliams-wagtail"
-    }
+    def __init__(self, checks):
+        self.checks = checks
+        self.results = {}
+        self.completed_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
 
-    status_code = 200 if overall_status == "healthy" else 503
-    return JsonResponse(response_data, status=status_code)
+    def run_checks(self):
+        """Run every check once and store ``{'status', 'duration_ms', 'checked_at'[, 'error']}`` for each"""
+        results = {}
+        for name, check in self.checks.items():
+            started = time.perf_counter()
+            try:
+                check()
+            except Exception as e:
+                logger.error(f"{name} readiness check failed: {e}")
+                result = {"status": "not_ready", "error": str(e)}
+            else:
+                result = {"status": "ready"}
+            result["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            result["checked_at"] = time.time()
+            results[name] = result
+        self.results = results
+        self.completed_at = time.monotonic()
+        return results
+
+    def _run(self):
+        while True:
+            # This thread's connection lives as long as CONN_MAX_AGE allows
+            close_old_connections()
+            try:
+                self.run_checks()
+            except Exception:
+                logger.exception("Readiness checks failed to run")
+            time.sleep(settings.HEALTH_CHECK_INTERVAL)
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+                self._thread.start()
+
+    def is_stale(self):
+        # A hung check must not leave an old pass standing
+        max_age = settings.HEALTH_CHECK_INTERVAL * settings.HEALTH_CHECK_STALE_AFTER
+        return self.completed_at is None or time.monotonic() - self.completed_at > max_age
+
+
+monitor = HealthMonitor(CHECKS)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+async def health_check(request):
+    """
+    Liveness probe for load balancers and monitoring
+    Answers without any database or cache access
+    """
+    return JsonResponse({"status": "healthy", "application": APPLICATION})
 
 
 @csrf_exempt
-@require_http_methods(["GET"])
-def readiness_check(request):
+@require_http_methods(["GET", "HEAD"])
+async def readiness_check(request):
     """
     Readiness check for deployment orchestration
-    More comprehensive than health check
+    Reports the background thread's latest dependency checks
     """
-    checks = {}
-
-    # Database check
-    try:
-        from django.contrib.auth.models import User
-        User.objects.exists()  # Test actual query
-        checks["database"] = "ready"
-    except Exception as e:
-        logger.error(f"Database readiness failed: {e}")
-        checks["database"] = "not_ready"
-
-    # Static files check
-    try:
-        from django.conf import settings
-        import os
-        static_dir_exists = os.path.exists(settings.STATIC_ROOT) if settings.STATIC_ROOT else False
-        checks["static_files"] = "ready" if static_dir_exists else "not_ready"
-    except Exception as e:
-        logger.error(f"Static files check failed: {e}")
-        checks["static_files"] = "not_ready"
-
-    # Cache check
-    try:
-        cache.set('readiness_check', 'ready', 10)
-        cache_result = cache.get('readiness_check')
-        checks["cache"] = "ready" if cache_result == 'ready' else "not_ready"
-    except Exception as e:
-        logger.error(f"Cache readiness failed: {e}")
-        checks["cache"] = "not_ready"
-
-    all_ready = all(status == "ready" for status in checks.values())
-    overall_status = "ready" if all_ready else "not_ready"
+    monitor.ensure_started()
+    checks = monitor.results
+    if monitor.is_stale():
+        overall_status = "starting" if monitor.completed_at is None else "stale"
+    else:
+        overall_status = "ready" if all(check["status"] == "ready" for check in checks.values()) else "not_ready"
 
     response_data = {
         "status": overall_status,
         "checks": checks,
-        "application": "benniewilliams-wagtail"
+        "application": APPLICATION,
     }
 
-    status_code = 200 if all_ready else 503
-    return JsonResponse(response_data, status=status_code)
\ No newline at end of file
+    status_code = 200 if overall_status == "ready" else 503
+    return JsonResponse(response_data, status=status_code)
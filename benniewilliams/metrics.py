@@ -0,0 +1,270 @@
+"""
+Prometheus metrics for requests, database queries, caches and templates
+
+``MetricsMiddleware`` (first in MIDDLEWARE) times each request and labels it
+with the resolved view and, for Wagtail pages, the page type; it counts the
+queries run during the request, on any connection and in any thread the
+request hands work to (e.g. ``sync_to_async`` under ASGI). Database
+connections get an ``execute_wrapper`` as they are created that reports to
+the observers of the current context (see ``observe_queries``). Cache
+backends are wrapped as they are created so every ``get``/``get_many``
+counts hits and misses per alias, and Django template rendering is timed per
+top-level template.
+
+Under gunicorn each worker writes to files in ``PROMETHEUS_MULTIPROC_DIR``
+(set in the Dockerfile; ``gunicorn.conf.py`` cleans up after exited
+workers), and ``/metrics`` merges them, so any worker answers for all of
+them. Without that variable the metrics are kept in process memory.
+
+``/metrics`` only answers clients in ``METRICS_ALLOWED_NETWORKS`` or that
+send ``Authorization: Bearer <METRICS_TOKEN>``; anyone else gets a 403.
+"""
+import functools
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import CacheHandler, caches
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import Template
+from django.urls import Resolver404, resolve
+from django.views.decorators.http import require_http_methods
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+REQUEST_LATENCY = Histogram(
+    "django_request_duration_seconds",
+    "Request latency by resolved view and Wagtail page type",
+    ["view", "page_type", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "django_request_db_queries",
+    "Database queries run per request",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_DURATION = Histogram(
+    "django_request_db_duration_seconds",
+    "Time spent in database queries per request",
+    ["view"],
+)
+CACHE_REQUESTS = Counter(
+    "django_cache_requests",
+    "Cache lookups by alias and result (hit or miss)",
+    ["alias", "result"],
+)
+TEMPLATE_RENDER_DURATION = Histogram(
+    "django_template_render_duration_seconds",
+    "Render time of templates rendered by views",
+    ["template"],
+)
+
+_missing = object()
+
+# Execute wrappers the queries of the current request (or other unit of
+# work) are passed through; copied into threads along with the context
+_query_observers = ContextVar("query_observers", default=())
+
+
+class _QueryStats:
+    """Query count and time for one request, fed by the connections' execute wrappers"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def _observed_execute(execute, sql, params, many, context):
+    for observer in reversed(_query_observers.get()):
+        execute = functools.partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+def _instrument_connection(connection):
+    if _observed_execute not in connection.execute_wrappers:
+        # First, so wrappers pushed and popped with execute_wrapper() stay on top
+        connection.execute_wrappers.insert(0, _observed_execute)
+    return connection
+
+
+def _instrument_databases():
+    if getattr(ConnectionHandler.create_connection, "instrumented", False):
+        return
+    create_connection = ConnectionHandler.create_connection
+
+    def instrumented_create_connection(self, alias):
+        return _instrument_connection(create_connection(self, alias))
+
+    instrumented_create_connection.instrumented = True
+    ConnectionHandler.create_connection = instrumented_create_connection
+    for connection in connections.all(initialized_only=True):
+        # Connections this thread already created
+        _instrument_connection(connection)
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Pass every query run in this context, and in threads started from it,
+    through ``observer``, an ``execute_wrapper`` callable
+    """
+    _instrument_databases()
+    token = _query_observers.set((*_query_observers.get(), observer))
+    try:
+        yield observer
+    finally:
+        _query_observers.reset(token)
+
+
+def _instrument_cache(backend, alias):
+    if getattr(backend, "_metrics_alias", None) is not None:
+        return backend
+    backend._metrics_alias = alias
+    hits = CACHE_REQUESTS.labels(alias, "hit")
+    misses = CACHE_REQUESTS.labels(alias, "miss")
+    cache_get, cache_get_many = backend.get, backend.get_many
+
+    def get(key, default=None, version=None):
+        value = cache_get(key, _missing, version=version)
+        if value is _missing:
+            misses.inc()
+            return default
+        hits.inc()
+        return value
+
+    def get_many(keys, version=None):
+        keys = list(keys)
+        values = cache_get_many(keys, version=version)
+        hits.inc(len(values))
+        misses.inc(len(keys) - len(values))
+        return values
+
+    backend.get = get
+    if type(backend).get_many is not BaseCache.get_many:
+        # The default get_many calls get, which already counts
+        backend.get_many = get_many
+    return backend
+
+
+def _timed_render(render):
+    def timed(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            TEMPLATE_RENDER_DURATION.labels(self.template.name or "<string>").observe(time.perf_counter() - started)
+
+    timed.instrumented = True
+    return timed
+
+
+def instrument():
+    """Wrap database connections, cache backends and template rendering; safe to call more than once"""
+    _instrument_databases()
+    if getattr(CacheHandler.create_connection, "instrumented", False):
+        return
+    create_connection = CacheHandler.create_connection
+
+    def instrumented_create_connection(self, alias):
+        return _instrument_cache(create_connection(self, alias), alias)
+
+    instrumented_create_connection.instrumented = True
+    CacheHandler.create_connection = instrumented_create_connection
+    for alias in caches:
+        # Backends this thread already created
+        _instrument_cache(caches[alias], alias)
+
+    Template.render = _timed_render(Template.render)
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Answered by middleware (e.g. the page cache) before URL resolution
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return "<unresolved>"
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """Record latency, query count and query time for every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrument()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _QueryStats()
+        started = time.perf_counter()
+        with observe_queries(stats):
+            response = self.get_response(request)
+        self.observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = _QueryStats()
+        started = time.perf_counter()
+        with observe_queries(stats):
+            response = await self.get_response(request)
+        self.observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, stats, duration):
+        view = _view_label(request)
+        page_type = getattr(request, "metrics_page_type", "")
+        REQUEST_LATENCY.labels(view, page_type, request.method, str(response.status_code)).observe(duration)
+        REQUEST_DB_QUERIES.labels(view).observe(stats.count)
+        REQUEST_DB_DURATION.labels(view).observe(stats.duration)
+
+
+def get_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def may_scrape(request):
+    """Whether the request comes from an allowed network or carries the metrics token"""
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Metrics of every worker in the Prometheus text format"""
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     "search",
     "wagtail.contrib.forms",
     "wagtail.contrib.redirects",
+    "wagtail.contrib.search_promotions",
     "wagtail.embeds",
     "wagtail.sites",
     "wagtail.users",
@@ -46,10 +47,16 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # After wagtail.snippets, whose ready() registers the snippet models
+    "home.snippet_receivers",
 ]
 
 MIDDLEWARE = [
+    "benniewilliams.metrics.MetricsMiddleware",
+    "home.profiling.QueryProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
+    "home.middleware.PageCacheMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -179,3 +186,75 @@ WAGTAILADMIN_BASE_URL = "http://example.com"
 # if untrusted users are allowed to upload files -
 # see https://docs.wagtail.org/en/stable/advanced_topics/deploying.html#user-uploaded-files
 WAGTAILDOCS_EXTENSIONS = ['csv', 'docx', 'key', 'odt', 'pdf', 'pptx', 'rtf', 'txt', 'xlsx', 'zip']
+
+# Tags that differ only in case are the same tag, so each has one listing
+TAGGIT_CASE_INSENSITIVE = True
+
+# Page cache
+# Anonymous responses from Wagtail's page serving view are cached in this
+# cache alias until a publish, unpublish, move or delete invalidates them
+PAGE_CACHE_ALIAS = "default"
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+PAGE_CACHE_VARY_HEADERS = ["Accept-Language"]
+# Paths that never serve pages, so are not looked up in the cache (with a
+# database cache backend, every lookup is a query)
+PAGE_CACHE_EXEMPT_PATHS = ["/health/", "/ready/", "/metrics", "/search/"]
+
+# Static export
+# Output directory for `python manage.py export_static`
+STATIC_EXPORT_ROOT = os.path.join(BASE_DIR, "static_export")
+
+# Benchmarks
+# Where `python manage.py benchmark_site` saves its timestamped JSON results
+BENCHMARK_RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks")
+
+# Rendition warm-up
+# Filter specs generated in the background, with their responsive sets, when an
+# image is uploaded or a page referencing it is published; keep in step with
+# the image tags in the templates. RENDITION_WARMUP_WORKERS = 0 generates them
+# in-process instead.
+RENDITION_WARMUP_FILTERS = ["fill-1920x1080", "fill-1200x600", "fill-500x500", "fill-400x300"]
+RENDITION_WARMUP_WORKERS = 1
+
+# Responsive images
+# {% responsive_image %} serves each spec at these widths (up to the spec's own)
+# in these formats, falling back to the original format; AVIF is skipped when
+# Pillow cannot write it
+RESPONSIVE_IMAGE_WIDTHS = [240, 320, 480, 800, 1200, 1600]
+RESPONSIVE_IMAGE_FORMATS = ["avif", "webp"]
+
+# Search autocomplete
+# Seconds a process serves its in-memory prefix index before checking the
+# shared version again
+SEARCH_AUTOCOMPLETE_RECHECK = 1.0
+
+# Search pagination
+# "count_free" fetches one result beyond the current page to decide whether
+# there is a next one; "numbered" counts every match up front
+SEARCH_PAGINATION = "count_free"
+
+# Search hit logging
+# Search hits are buffered per process and written to the promoted search
+# results tables once this many have built up, or after this many seconds
+SEARCH_HIT_FLUSH_THRESHOLD = 100
+SEARCH_HIT_FLUSH_INTERVAL = 60
+
+# Health checks
+# /ready/ reports dependency checks run by a background thread every
+# HEALTH_CHECK_INTERVAL seconds, and stops reporting ready when the last
+# completed round is older than HEALTH_CHECK_STALE_AFTER intervals
+HEALTH_CHECK_INTERVAL = 15
+HEALTH_CHECK_STALE_AFTER = 3
+
+# Metrics
+# /metrics answers clients in METRICS_ALLOWED_NETWORKS, or any client that
+# sends "Authorization: Bearer <METRICS_TOKEN>" when a token is set
+METRICS_ALLOWED_NETWORKS = ["127.0.0.1/32", "::1/128"]
+METRICS_TOKEN = None
+
+# Query profiling
+# Set QUERY_PROFILING = True (e.g. in settings/local.py) to log every request's
+# queries and add an X-Query-Profile header; query shapes run at least
+# QUERY_PROFILING_REPEAT_THRESHOLD times in one request are flagged as N+1
+QUERY_PROFILING = False
+QUERY_PROFILING_REPEAT_THRESHOLD = 3
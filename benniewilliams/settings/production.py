@@ -57,7 +57,20 @@ MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
 
 # Use whitenoise for serving static files
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+
+# Serve one site's static page export (python manage.py export_static) ahead of
+# Django, e.g. STATIC_EXPORT_SERVE_DIR=/app/static_export/benniewilliams.com
+STATIC_EXPORT_ROOT = os.environ.get('STATIC_EXPORT_ROOT', os.path.join(BASE_DIR, 'static_export'))
+STATIC_EXPORT_SERVE_DIR = os.environ.get('STATIC_EXPORT_SERVE_DIR')
+if STATIC_EXPORT_SERVE_DIR:
+    MIDDLEWARE.insert(MIDDLEWARE.index('home.middleware.PageCacheMiddleware'), 'home.middleware.StaticExportMiddleware')
+
+# Prometheus metrics: behind a reverse proxy every request comes from the
+# proxy's address, so no network is allowed unless listed, e.g.
+# METRICS_ALLOWED_NETWORKS=10.0.0.0/8; scrapers can send METRICS_TOKEN instead
+METRICS_ALLOWED_NETWORKS = [network for network in os.environ.get('METRICS_ALLOWED_NETWORKS', '').split(',') if network]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 # ManifestStaticFilesStorage for production
 STORAGES["staticfiles"]["BACKEND"] = "whitenoise.storage.CompressedManifestStaticFilesStorage"
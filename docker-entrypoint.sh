@@ -38,6 +38,12 @@ if [ "$DJANGO_COLLECT_STATIC" = "true" ]; then
     python manage.py collectstatic --noinput
 fi
 
+# Start each run with empty metrics files for the workers to share
+if [ "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # Start server
 echo "Starting Gunicorn..."
 exec "$@"
\ No newline at end of file
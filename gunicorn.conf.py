@@ -0,0 +1,33 @@
+"""
+Gunicorn settings read from the working directory, alongside the options in
+the Dockerfile CMD
+
+``SERVER_MODE`` picks the application and worker type: ``wsgi`` (the
+default) serves the WSGI handler from sync workers with two threads each;
+``asgi`` serves the ASGI application from uvicorn workers, where the async
+views (search, autocomplete, health and readiness) wait on a slow search or
+database without holding a worker.
+"""
+import os
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "benniewilliams.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+elif SERVER_MODE == "wsgi":
+    wsgi_app = "benniewilliams.wsgi:application"
+    worker_class = "sync"
+    threads = 2
+else:
+    raise RuntimeError(f"SERVER_MODE must be 'wsgi' or 'asgi', not {SERVER_MODE!r}")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live-process metric files from /metrics
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,599 @@
+"""
+Load and latency benchmarks over a synthetic content tree
+
+``seed_tree`` adds a blog and a project listing under the default site's
+home page and fills them, through the bulk loader, with generated posts and
+projects: StreamField bodies with headings, paragraphs, code, quotes and
+images, project galleries, and tags and technologies drawn from a skewed
+pool, so a few are common and most are rare. The content is reproducible for
+a given seed.
+
+``run_benchmark`` drives ``benniewilliams.wsgi.application``, the handler
+and middleware gunicorn serves, with plain WSGI calls: first in-process, one
+request at a time, then from ``concurrency`` spawned worker processes. For
+each endpoint it reports latency percentiles, throughput and the queries run
+per request. ``compare`` lines a result up against an earlier one.
+
+``run_server_comparison`` serves the same requests through the WSGI
+application, at most ``slots`` at a time as the sync gunicorn workers do,
+and through the ASGI application, from many concurrent clients while every
+database query is held up as a slow database would hold it. Both run in this
+process, so they share the CPU alike; what differs is how many requests can
+wait on the database at once.
+"""
+import asyncio
+import datetime
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import urlencode
+
+import django
+import wagtail
+from django.conf import settings
+from django.db import connection, connections
+from wagtail.images import get_image_model
+from wagtail.models import Page, Site
+
+from benniewilliams.metrics import _QueryStats, observe_queries
+
+from . import page_cache
+from .bulk_load import BulkPageLoader
+from .models import BlogIndexPage, BlogPage, BlogPageTag, ProjectIndexPage, ProjectPage
+
+BLOG_SLUG = 'benchmark-blog'
+PROJECTS_SLUG = 'benchmark-projects'
+IMAGE_TITLE_PREFIX = 'Benchmark image'
+
+ENDPOINTS = ('home', 'blog_index', 'blog_detail', 'search', 'health')
+
+SERVER_MODES = ('wsgi', 'asgi')
+SERVER_ENDPOINTS = ('search', 'blog_detail', 'health')
+
+TOPICS = [
+    'Kubernetes', 'Python', 'Django', 'Wagtail', 'PostgreSQL', 'Redis', 'Docker', 'Terraform', 'AWS', 'Azure',
+    'Ansible', 'Linux', 'Networking', 'Security', 'Observability', 'Prometheus', 'Grafana', 'CI/CD', 'GitHub Actions',
+    'Machine Learning', 'LLMs', 'Automation', 'Healthcare IT', 'Data Centers', 'VMware', 'Backups', 'Go', 'Rust',
+    'JavaScript', 'React',
+]
+
+WORDS = (
+    'cluster deployment latency cache query index migration pipeline container service network storage backup '
+    'monitoring alert dashboard rollout capacity failover replica shard throughput budget incident runbook '
+    'automation inventory compliance patch upgrade workload scheduler gateway certificate identity policy '
+    'infrastructure consultant hospital datacenter strategy roadmap vendor contract outage recovery'
+).split()
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _sentence(rng):
+    return _words(rng, rng.randint(8, 18)).capitalize() + '.'
+
+
+def _paragraph(rng, topic=None):
+    sentences = [_sentence(rng) for _ in range(rng.randint(3, 6))]
+    if topic:
+        sentences.insert(rng.randrange(len(sentences)), f'This is where {topic} earns its place.')
+    return '<p>' + ' '.join(sentences) + '</p>'
+
+
+def _topics(rng, count):
+    """Distinct topics, weighted so the first few in ``TOPICS`` turn up most"""
+    chosen = []
+    while len(chosen) < count:
+        topic = TOPICS[min(int(rng.paretovariate(1.2)) - 1, len(TOPICS) - 1)]
+        if topic not in chosen:
+            chosen.append(topic)
+    return chosen
+
+
+def _image_file(rng, number):
+    from PIL import Image as PILImage
+
+    from django.core.files.images import ImageFile
+
+    colour = tuple(rng.randrange(256) for _ in range(3))
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (1600, 1000), colour).save(buffer, 'PNG')
+    return ImageFile(buffer, name=f'benchmark-{number}.png')
+
+
+def seed_images(count, rng):
+    """At least ``count`` benchmark images, creating the ones missing"""
+    image_model = get_image_model()
+    images = list(image_model.objects.filter(title__startswith=IMAGE_TITLE_PREFIX).order_by('pk')[:count])
+    for number in range(len(images), count):
+        images.append(image_model.objects.create(
+            title=f'{IMAGE_TITLE_PREFIX} {number}', file=_image_file(rng, number),
+        ))
+    return images
+
+
+def _blog_post(rng, number, images, tags):
+    topics = _topics(rng, rng.randint(2, 5))
+    body = [('heading', f'{topics[0]} in practice')]
+    for _ in range(rng.randint(3, 8)):
+        body.append(('paragraph', _paragraph(rng, rng.choice(topics))))
+        roll = rng.random()
+        if roll < 0.3:
+            body.append(('image', rng.choice(images)))
+        elif roll < 0.45:
+            body.append(('code', '\n'.join(f'$ {_words(rng, 4)}' for _ in range(rng.randint(2, 8)))))
+        elif roll < 0.55:
+            body.append(('quote', _sentence(rng)))
+    post = BlogPage(
+        title=f'{topics[0]} notes {number}: {_words(rng, 3)}',
+        slug=f'post-{number}',
+        date=datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(2000)),
+        intro=_sentence(rng)[:250],
+        featured_image=rng.choice(images),
+        body=body,
+    )
+    post.tags.add(*(tags[topic] for topic in topics))
+    return post
+
+
+def _project(rng, number, images, tags=None):
+    technologies = _topics(rng, rng.randint(2, 6))
+    content = [
+        ('overview', _paragraph(rng, technologies[0])),
+        ('features', [_words(rng, rng.randint(3, 7)).capitalize() for _ in range(rng.randint(3, 8))]),
+        ('gallery', [rng.choice(images) for _ in range(rng.randint(2, 8))]),
+    ]
+    if rng.random() < 0.5:
+        content.append(('code_snippet', {'language': 'python', 'code': f'import {rng.choice(WORDS)}'}))
+    if rng.random() < 0.3:
+        content.append(('testimonial', {'quote': _sentence(rng), 'author': _words(rng, 2).title()}))
+    return ProjectPage(
+        title=f'{technologies[0]} {_words(rng, 2)} {number}',
+        slug=f'project-{number}',
+        summary=_sentence(rng),
+        client=_words(rng, 2).title(),
+        technologies=', '.join(technologies),
+        featured_image=rng.choice(images),
+        content=content,
+    )
+
+
+def _get_or_add_index(parent, model, slug, title):
+    index = model.objects.child_of(parent).filter(slug=slug).first()
+    if index is None:
+        index = model(title=title, slug=slug)
+        parent.add_child(instance=index)
+    return index
+
+
+def _topic_tags():
+    """Tag objects for every topic, so adding them to a post needs no lookups"""
+    tag_model = BlogPageTag.tag_model()
+    return {
+        topic: tag_model.objects.filter(name__iexact=topic).first() or tag_model.objects.create(name=topic)
+        for topic in TOPICS
+    }
+
+
+def load_synthetic(parent, count, images=12, seed=0, batch_size=500, revisions=True, log=None):
+    """
+    Add ``count`` generated posts to a blog index, or projects to a project
+    index, with the bulk loader, numbered after its existing children;
+    returns the number of pages added
+    """
+    parent = parent.specific
+    if isinstance(parent, BlogIndexPage):
+        build = _blog_post
+    elif isinstance(parent, ProjectIndexPage):
+        build = _project
+    else:
+        raise ValueError(f'{parent.title} is neither a blog index nor a project index')
+    rng = random.Random(seed)
+    image_pool = seed_images(images, rng)
+    tags = _topic_tags() if build is _blog_post else None
+
+    loader = BulkPageLoader(batch_size=batch_size, revisions=revisions, log=log)
+    start = parent.get_children_count()
+    for number in range(start, start + count):
+        loader.add(build(rng, number, image_pool, tags), parent)
+    return loader.finish()
+
+
+def seed_tree(posts, projects, images=12, seed=0, batch_size=500, revisions=True, log=None):
+    """
+    Add ``posts`` blog posts and ``projects`` projects to the benchmark
+    listings, creating the listings and images as needed; returns the two
+    listings. Running it again adds more pages after the existing ones.
+    """
+    home = Site.objects.get(is_default_site=True).root_page.specific
+    blog_index = _get_or_add_index(home, BlogIndexPage, BLOG_SLUG, 'Benchmark blog')
+    project_index = _get_or_add_index(home, ProjectIndexPage, PROJECTS_SLUG, 'Benchmark projects')
+    for index, count in ((blog_index, posts), (project_index, projects)):
+        load_synthetic(index, count, images, seed, batch_size, revisions, log)
+    return blog_index, project_index
+
+
+def _page_path(page):
+    return page.get_url_parts()[2]
+
+
+def endpoint_paths(requests, seed=0):
+    """``{endpoint: [path, ...]}`` with ``requests`` paths each, cycling through the candidates"""
+    rng = random.Random(seed)
+    blog_index = (
+        BlogIndexPage.objects.live().filter(slug=BLOG_SLUG).first()
+        or BlogIndexPage.objects.live().order_by('path').first()
+    )
+    if blog_index is None:
+        raise ValueError('There is no live blog index; run seed_benchmark_tree first')
+    post_ids = list(BlogPage.objects.live().child_of(blog_index).values_list('pk', flat=True))
+    if not post_ids:
+        raise ValueError(f'{blog_index.title} has no live posts; run seed_benchmark_tree first')
+    posts = BlogPage.objects.filter(pk__in=rng.sample(post_ids, min(requests, len(post_ids))))
+
+    candidates = {
+        'home': ['/'],
+        'blog_index': [_page_path(blog_index)],
+        'blog_detail': [_page_path(post) for post in posts],
+        'search': ['/search/?' + urlencode({'query': topic}) for topic in TOPICS],
+        'health': ['/health/'],
+    }
+    for paths in candidates.values():
+        rng.shuffle(paths)
+    return {name: list(itertools.islice(itertools.cycle(paths), requests)) for name, paths in candidates.items()}
+
+
+def _environ(path, host):
+    path_info, _, query_string = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query_string,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def _serve_wsgi(application, path, host):
+    status = []
+    result = application(_environ(path, host), lambda line, headers, exc_info=None: status.append(line))
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0])
+
+
+def run_requests(paths, host, warmup=()):
+    """
+    Serve each path through the WSGI application, returning
+    ``(started, finished, [(status, seconds, queries), ...])``; the
+    ``warmup`` paths are served first and not recorded
+    """
+    from benniewilliams.wsgi import application
+
+    for path in warmup:
+        _serve_wsgi(application, path, host)
+
+    samples = []
+    started = time.time()
+    for path in paths:
+        stats = _QueryStats()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(stats))
+            request_started = time.perf_counter()
+            status = _serve_wsgi(application, path, host)
+            duration = time.perf_counter() - request_started
+        samples.append((status, duration, stats.count))
+    return started, time.time(), samples
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``"""
+    if not values:
+        return None
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(duration * 1000 for _, duration, _ in samples)
+    queries = sorted(count for _, _, count in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _, _ in samples if status >= 400),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'p95': percentile(queries, 95),
+            'max': queries[-1],
+        },
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'wagtail': wagtail.__version__,
+        'database': connection.vendor,
+        'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+        'git_commit': _git_commit(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def _tree():
+    return {
+        'blog_posts': BlogPage.objects.live().count(),
+        'projects': ProjectPage.objects.live().count(),
+        'images': get_image_model().objects.count(),
+    }
+
+
+def _run_concurrent(executor, paths, host, concurrency, warmup):
+    """Split ``paths`` across worker processes; the span runs from the first start to the last finish"""
+    chunks = [paths[worker::concurrency] for worker in range(concurrency)]
+    futures = [executor.submit(run_requests, chunk, host, warmup) for chunk in chunks if chunk]
+    results = [future.result() for future in futures]
+    samples = [sample for _, _, chunk_samples in results for sample in chunk_samples]
+    return summarize(samples, max(finished for _, finished, _ in results) - min(started for started, _, _ in results))
+
+
+def run_benchmark(requests=200, concurrency=4, warmup=5, host=None, endpoints=ENDPOINTS, seed=0, log=None):
+    """
+    Benchmark each endpoint serially and, when ``concurrency`` is above 1,
+    from that many worker processes; returns the result as a JSON-ready dict
+    """
+    if concurrency > 1 and any(conn.vendor == 'sqlite' and conn.is_in_memory_db() for conn in connections.all()):
+        raise ValueError('Worker processes cannot share an in-memory SQLite database; use a concurrency of 1')
+    host = host or Site.objects.get(is_default_site=True).hostname
+    paths = endpoint_paths(requests, seed)
+    result = {
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'tree': _tree(),
+        'options': {'requests': requests, 'concurrency': concurrency, 'warmup': warmup, 'host': host, 'seed': seed},
+        'phases': {'serial': {}},
+    }
+
+    for name in endpoints:
+        started, finished, samples = run_requests(paths[name], host, paths[name][:warmup])
+        result['phases']['serial'][name] = summarize(samples, finished - started)
+        if log:
+            log('serial', name, result['phases']['serial'][name])
+
+    if concurrency > 1:
+        result['phases']['concurrent'] = {}
+        # Workers open their own database connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        try:
+            for name in endpoints:
+                result['phases']['concurrent'][name] = _run_concurrent(
+                    executor, paths[name], host, concurrency, paths[name][:warmup],
+                )
+                if log:
+                    log('concurrent', name, result['phases']['concurrent'][name])
+        finally:
+            executor.shutdown()
+    return result
+
+
+class _QueryDelay:
+    """An execute wrapper that holds each query up, as a slow or distant database would"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+
+def _run_wsgi_clients(paths, host, clients, slots, query_delay):
+    """
+    Serve ``paths`` from ``clients`` threads through a first-come,
+    first-served pool of ``slots`` threads; latency includes the wait for a
+    slot, as behind gunicorn
+    """
+    from benniewilliams.wsgi import application
+
+    def serve(path, queued):
+        stats = _QueryStats()
+        with observe_queries(_QueryDelay(query_delay)), observe_queries(stats):
+            status = _serve_wsgi(application, path, host)
+        connections.close_all()
+        return status, time.perf_counter() - queued, stats.count
+
+    pending = iter(paths)
+    samples = []
+    with ThreadPoolExecutor(max_workers=slots) as server:
+        def client():
+            for path in pending:
+                samples.append(server.submit(serve, path, time.perf_counter()).result())
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        finished = time.time()
+    return started, finished, samples
+
+
+async def _serve_asgi(application, path, host):
+    path_info, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path_info,
+        'raw_path': path_info.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': [(b'host', host.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (host, 80),
+    }
+    body = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if body:
+            return body.pop()
+        # The client stays connected until the response is complete
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def _run_asgi_clients(paths, host, clients, query_delay):
+    """Serve ``paths`` from ``clients`` concurrent tasks on one event loop, with no limit on requests in flight"""
+    from benniewilliams.asgi import application
+
+    async def run():
+        pending = iter(paths)
+        samples = []
+
+        async def client():
+            for path in pending:
+                stats = _QueryStats()
+                request_started = time.perf_counter()
+                with observe_queries(stats):
+                    status = await _serve_asgi(application, path, host)
+                samples.append((status, time.perf_counter() - request_started, stats.count))
+
+        # Threads the requests hand work to inherit the delay with the context
+        with observe_queries(_QueryDelay(query_delay)):
+            started = time.time()
+            await asyncio.gather(*(client() for _ in range(clients)))
+        return started, time.time(), samples
+
+    return asyncio.run(run())
+
+
+def _reset_caches():
+    """Start each server on cold page and search caches, as the other one did"""
+    page_cache.bump_versions([
+        page_cache.tree_version_key(Page.get_first_root_node().path), page_cache.search_version_key(),
+    ])
+
+
+def run_server_comparison(requests=200, clients=32, slots=8, query_delay_ms=50, warmup=5, host=None,
+                          endpoints=SERVER_ENDPOINTS, seed=0, log=None):
+    """
+    Benchmark each endpoint through the WSGI application with ``slots``
+    requests in flight (gunicorn's 4 sync workers x 2 threads by default)
+    and through the ASGI application, from ``clients`` concurrent clients
+    while every query takes ``query_delay_ms`` longer; returns the result
+    as a JSON-ready dict with a phase per server mode
+    """
+    host = host or Site.objects.get(is_default_site=True).hostname
+    paths = endpoint_paths(requests, seed)
+    # Searches for a topic and a word, so most miss the results cache
+    rng = random.Random(seed)
+    paths['search'] = [
+        '/search/?' + urlencode({'query': f'{rng.choice(TOPICS)} {rng.choice(WORDS)}'}) for _ in range(requests)
+    ]
+    result = {
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'tree': _tree(),
+        'options': {
+            'requests': requests, 'clients': clients, 'slots': slots, 'query_delay_ms': query_delay_ms,
+            'warmup': warmup, 'host': host, 'seed': seed,
+        },
+        'phases': {mode: {} for mode in SERVER_MODES},
+    }
+
+    query_delay = query_delay_ms / 1000
+    for name in endpoints:
+        for mode in SERVER_MODES:
+            warmup_paths = paths[name][:warmup]
+            if mode == 'wsgi':
+                _run_wsgi_clients(warmup_paths, host, 1, 1, 0)
+                _reset_caches()
+                started, finished, samples = _run_wsgi_clients(paths[name], host, clients, slots, query_delay)
+            else:
+                _run_asgi_clients(warmup_paths, host, 1, 0)
+                _reset_caches()
+                started, finished, samples = _run_asgi_clients(paths[name], host, clients, query_delay)
+            result['phases'][mode][name] = summarize(samples, finished - started)
+            if log:
+                log(mode, name, result['phases'][mode][name])
+    return result
+
+
+def compare(current, previous):
+    """
+    ``(phase, endpoint, metric, previous, current, change)`` for the latency
+    percentiles, throughput and mean queries both results have
+    """
+    rows = []
+    for phase, endpoints in current['phases'].items():
+        for name, stats in endpoints.items():
+            before = previous.get('phases', {}).get(phase, {}).get(name)
+            if before is None:
+                continue
+            pairs = [
+                (f'{percent} ms', before['latency_ms'][percent], stats['latency_ms'][percent])
+                for percent in ('p50', 'p95', 'p99')
+            ]
+            pairs.append(('rps', before['throughput_rps'], stats['throughput_rps']))
+            pairs.append(('queries', before['queries']['mean'], stats['queries']['mean']))
+            for metric, old, new in pairs:
+                change = (new - old) / old * 100 if old else None
+                rows.append((phase, name, metric, old, new, change))
+    return rows
@@ -0,0 +1,70 @@
+"""
+Render cache for StreamField blocks
+
+A block's rendered HTML is cached under a hash of its block type, stored
+value and the page it is rendered on (its id and locale, so a template that
+reads ``page`` or the parent context never serves one page's HTML on
+another). Entries also record version tokens for every image and page the
+value references, so replacing an image or publishing a linked page
+invalidates the fragments that use them. Only use this for blocks rendered
+through ``render`` / ``include_block`` whose templates depend on nothing in
+the context beyond the page.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from wagtail import blocks
+from wagtail.models import Page
+
+from . import page_cache
+
+
+def reference_version_keys(block, value):
+    """Version keys for the images, pages and snippets referenced by a block value"""
+    keys = set()
+    for model, object_id, _, _ in block.extract_references(value):
+        if issubclass(model, Page):
+            model = Page
+        keys.add(page_cache.object_version_key(model, object_id))
+    return sorted(keys)
+
+
+def _page_of(context):
+    """``[id, locale id]`` of the page a block is rendered on, if the context has one"""
+    page = (context or {}).get('page')
+    if page is None:
+        return None
+    return [page.pk, getattr(page, 'locale_id', None)]
+
+
+def block_cache_key(block, value, context=None):
+    block_class = type(block)
+    payload = json.dumps(
+        [f'{block_class.__module__}.{block_class.__qualname__}', block.get_template(value),
+         block.get_prep_value(value), _page_of(context)],
+        cls=DjangoJSONEncoder,
+        sort_keys=True,
+    )
+    return 'blockcache:render:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CachedRenderMixin:
+    """Serve ``render`` from the page cache backend when the value and page are unchanged"""
+
+    def render(self, value, context=None):
+        cache = page_cache.get_cache()
+        key = block_cache_key(self, value, context)
+        entry = cache.get(key)
+        if entry is not None and (not entry['versions'] or page_cache.versions_match(entry['versions'])):
+            return entry['html']
+
+        version_keys = reference_version_keys(self, value)
+        versions = page_cache.snapshot_versions(version_keys) if version_keys else {}
+        html = super().render(value, context=context)
+        cache.set(key, {'html': html, 'versions': versions}, page_cache.PAGE_CACHE_TIMEOUT)
+        return html
+
+
+class CachedStructBlock(CachedRenderMixin, blocks.StructBlock):
+    pass
@@ -0,0 +1,342 @@
+"""
+Bulk page loading
+
+``BulkPageLoader`` creates pages without calling ``add_child`` and ``save``
+once per page. The treebeard path, depth and child count and the Wagtail URL
+path of each page are worked out in memory as it is added, and pages are
+written ``batch_size`` at a time, in a transaction per batch. Each batch
+takes one INSERT per table: the base ``Page`` rows, then the specific rows,
+the revisions and each child relation (e.g. blog tags).
+
+Existing pages can be queued with ``update(page, fields)`` to have those
+fields, and the child relations set on them in memory, written the same way.
+
+The reference index and technology facet rows go in with each batch, and
+search indexing is done in a single pass once every page is in. Then the
+caches of each existing parent and updated page are invalidated. Callers
+that commit as they go (e.g. a resumable import) call ``commit()`` after
+each batch to index and invalidate what it wrote. No ``page_published``
+signals are sent and pages are not validated beyond slug uniqueness. Image
+renditions are generated on first view, or by ``warm_renditions``.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import slugify
+from modelcluster.models import get_all_child_relations
+from treebeard.exceptions import PathOverflow
+from wagtail.models import Page, ReferenceIndex, Revision, get_default_page_content_type
+from wagtail.search.backends import get_search_backends
+
+from . import facets, navigation, page_cache
+from .models import TechnologyFacet
+
+
+class BulkPageLoader:
+    """
+    Queue unsaved pages with ``add(page, parent)`` and changed existing ones
+    with ``update(page, fields)``, then call ``finish()``
+
+    Parents may be existing pages or pages queued earlier. With
+    ``revisions=False`` pages get no revision, as if created in code,
+    which saves a table's worth of rows when seeding.
+    """
+
+    def __init__(self, batch_size=500, revisions=True, using=DEFAULT_DB_ALIAS, log=None):
+        self.batch_size = batch_size
+        self.revisions = revisions
+        self.using = using
+        self.log = log
+        self.pending = []
+        self.changed = []
+        self.loaded = {}
+        self.count = 0
+        self.updated_count = 0
+        self._last_step = {}
+        self._slugs = {}
+        self._existing_parents = {}
+        self._numchild = {}
+        self._updated_pages = []
+
+    def _reserve_position(self, parent):
+        """Step number of the parent's next child, and the slugs already taken under it"""
+        if parent.path not in self._last_step:
+            if parent._state.adding:
+                self._last_step[parent.path], self._slugs[parent.path] = 0, set()
+            else:
+                children = Page.objects.using(self.using).filter(
+                    path__startswith=parent.path, depth=parent.depth + 1,
+                )
+                last_path = children.order_by('-path').values_list('path', flat=True).first()
+                self._last_step[parent.path] = Page._str2int(last_path[-Page.steplen:]) if last_path else 0
+                self._slugs[parent.path] = set(children.values_list('slug', flat=True))
+        step = self._last_step[parent.path] + 1
+        if len(Page._int2str(step)) > Page.steplen:
+            raise PathOverflow(f'{parent.url_path} has no room for more children')
+        self._last_step[parent.path] = step
+        return step
+
+    def add(self, page, parent):
+        """Queue an unsaved specific page as the last child of ``parent``"""
+        step = self._reserve_position(parent)
+        if not page.slug:
+            page.slug = slugify(page.title, allow_unicode=getattr(settings, 'WAGTAIL_ALLOW_UNICODE_SLUGS', True))
+        if page.slug in self._slugs[parent.path]:
+            raise ValidationError({'slug': f"The slug '{page.slug}' is already in use within {parent.url_path}"})
+        self._slugs[parent.path].add(page.slug)
+
+        page.depth = parent.depth + 1
+        page.path = Page._get_path(parent.path, page.depth, step)
+        page.numchild = 0
+        page.set_url_path(parent)
+        page.draft_title = page.draft_title or page.title
+        if page.locale_id is None:
+            page.locale_id = parent.locale_id
+        if page.live:
+            now = timezone.now()
+            page.first_published_at = page.first_published_at or now
+            page.last_published_at = page.last_published_at or now
+            page.has_unpublished_changes = False
+        if hasattr(page, 'extract_search_text'):
+            page.search_text = page.extract_search_text()
+
+        parent.numchild += 1
+        if not parent._state.adding:
+            self._numchild[parent.path] = self._numchild.get(parent.path, 0) + 1
+            self._existing_parents.setdefault(parent.path, page)
+
+        self.pending.append(page)
+        self._flush_if_full()
+        return page
+
+    def update(self, page, fields):
+        """
+        Queue an existing specific page to have ``fields`` written, and
+        replace the rows of each child relation set on it in memory (e.g.
+        with ``page.tags.set(...)``); other relations are left alone
+        """
+        fields = [*fields, 'draft_title']
+        page.draft_title = page.title
+        if page.live:
+            page.last_published_at = timezone.now()
+            page.has_unpublished_changes = False
+            fields += ['last_published_at', 'has_unpublished_changes']
+        if hasattr(page, 'extract_search_text'):
+            page.search_text = page.extract_search_text()
+            fields.append('search_text')
+        self.changed.append((page, fields))
+        self._flush_if_full()
+        return page
+
+    def _flush_if_full(self):
+        if len(self.pending) + len(self.changed) >= self.batch_size:
+            self.flush()
+
+    def _insert(self, model, objs, fields, returning_fields=None):
+        connection = connections[self.using]
+        if returning_fields and not connection.features.can_return_rows_from_bulk_insert:
+            batch_size = 1
+        else:
+            batch_size = connection.ops.bulk_batch_size(fields, objs) or len(objs)
+        rows = []
+        for start in range(0, len(objs), batch_size):
+            result = model._base_manager._insert(
+                objs[start:start + batch_size], fields=fields, returning_fields=returning_fields, using=self.using,
+            )
+            if returning_fields:
+                rows.extend(result)
+        return rows
+
+    def _insert_pages(self, pages):
+        fields = [field for field in Page._meta.local_concrete_fields if not field.primary_key]
+        for page, (pk,) in zip(pages, self._insert(Page, pages, fields, Page._meta.db_returning_fields)):
+            page.id = pk
+            for model in [type(page), *type(page)._meta.get_parent_list()]:
+                for link in model._meta.parents.values():
+                    setattr(page, link.attname, pk)
+
+        by_model = {}
+        for page in pages:
+            by_model.setdefault(type(page), []).append(page)
+        for model, objs in by_model.items():
+            # Specific tables, from the one below Page down to the model's own
+            for table_model in [*reversed(model._meta.get_parent_list()), model][1:]:
+                self._insert(table_model, objs, table_model._meta.local_concrete_fields)
+            for page in objs:
+                page._state.adding = False
+                page._state.db = self.using
+
+    def _update_pages(self, changed):
+        """Write the changed fields, and clear the rows of the child relations about to be replaced"""
+        by_fields = {}
+        for page, fields in changed:
+            by_fields.setdefault((type(page), tuple(fields)), []).append(page)
+        for (model, fields), objs in by_fields.items():
+            model._base_manager.using(self.using).bulk_update(objs, fields, batch_size=self.batch_size)
+
+        replaced = {}
+        for page, _ in changed:
+            for relation in get_all_child_relations(type(page)):
+                if relation.get_accessor_name() in getattr(page, '_cluster_related_objects', {}):
+                    replaced.setdefault(relation, []).append(page.pk)
+        for relation, pks in replaced.items():
+            relation.related_model._base_manager.using(self.using).filter(
+                **{f'{relation.field.attname}__in': pks}
+            ).delete()
+
+    def _child_relation_items(self, pages, new=True):
+        """In-memory child relation items (e.g. tagged items) by model, pointed at their saved pages"""
+        items = {}
+        for page in pages:
+            if not hasattr(page, '_cluster_related_objects'):
+                page._cluster_related_objects = {}
+            for relation in get_all_child_relations(type(page)):
+                accessor = relation.get_accessor_name()
+                if new:
+                    # Relations never set are empty for a new page, which
+                    # saves serializing or indexing it a query for each
+                    page._cluster_related_objects.setdefault(accessor, [])
+                elif accessor not in page._cluster_related_objects:
+                    continue
+                for position, item in enumerate(page._cluster_related_objects[accessor]):
+                    setattr(item, relation.field.attname, page.pk)
+                    if getattr(item, 'sort_order', False) is None:
+                        item.sort_order = position
+                    items.setdefault(relation.related_model, []).append(item)
+        return items
+
+    def _create_revisions(self, pages):
+        now = timezone.now()
+        base_content_type_id = get_default_page_content_type().pk
+        revisions = Revision.objects.using(self.using).bulk_create([
+            Revision(
+                content_type_id=page.content_type_id,
+                base_content_type_id=base_content_type_id,
+                object_id=str(page.pk),
+                content=page.serializable_data(),
+                created_at=now,
+                object_str=str(page),
+            )
+            for page in pages
+        ])
+        for page, revision in zip(pages, revisions):
+            page.latest_revision_id = revision.pk
+            page.latest_revision_created_at = now
+            if page.live:
+                page.live_revision_id = revision.pk
+        Page.objects.using(self.using).bulk_update(
+            pages, ['latest_revision', 'latest_revision_created_at', 'live_revision'],
+        )
+
+    def flush(self):
+        """Write the queued pages"""
+        new, self.pending = self.pending, []
+        changed, self.changed = self.changed, []
+        if not new and not changed:
+            return
+        changed_pages = [page for page, _ in changed]
+        pages = new + changed_pages
+        with transaction.atomic(using=self.using):
+            if new:
+                self._insert_pages(new)
+            items = self._child_relation_items(new)
+            if changed:
+                # Written before anything is read, so the transaction starts with a write
+                self._update_pages(changed)
+                for model, objs in self._child_relation_items(changed_pages, new=False).items():
+                    items.setdefault(model, []).extend(objs)
+            if self.revisions:
+                self._create_revisions(pages)
+            for model, objs in items.items():
+                model.objects.using(self.using).bulk_create(objs)
+            if changed:
+                ReferenceIndex.objects.using(self.using).filter(
+                    base_content_type=get_default_page_content_type(),
+                    object_id__in=[str(page.pk) for page in changed_pages],
+                ).delete()
+                TechnologyFacet.objects.using(self.using).filter(
+                    page_id__in=[page.pk for page in changed_pages],
+                ).delete()
+            # From the pages in memory, so StreamField images are not fetched again
+            # Conflicts are rows object_references() already had Wagtail write
+            ReferenceIndex.objects.using(self.using).bulk_create(self._references(pages), ignore_conflicts=True)
+            TechnologyFacet.objects.using(self.using).bulk_create(
+                [row for page in pages if page.live for row in facets.page_facets(page)]
+            )
+            for page in pages:
+                # Child relations read from the database from now on
+                page._cluster_related_objects.clear()
+            numchild, self._numchild = self._numchild, {}
+            for path, count in numchild.items():
+                Page.objects.using(self.using).filter(path=path).update(numchild=F('numchild') + count)
+
+        for page in pages:
+            self.loaded.setdefault(type(page), []).append(page.pk)
+        self._updated_pages.extend(changed_pages)
+        self.count += len(pages)
+        self.updated_count += len(changed_pages)
+        if self.log:
+            self.log(f'{self.count} pages written')
+
+    def _references(self, pages):
+        """
+        Unsaved reference index rows for the pages, as
+        ``create_or_update_for_object`` would write them one page at a time
+        """
+        base_content_type = get_default_page_content_type()
+        return [
+            ReferenceIndex(
+                content_type_id=page.content_type_id,
+                base_content_type=base_content_type,
+                object_id=page.pk,
+                to_content_type_id=to_content_type_id,
+                to_object_id=to_object_id,
+                model_path=model_path,
+                content_path=content_path,
+                content_path_hash=ReferenceIndex._get_content_path_hash(content_path),
+            )
+            for page in pages if ReferenceIndex.is_indexed(type(page))
+            for to_content_type_id, to_object_id, model_path, content_path in page_cache.object_references(page)
+        ]
+
+    def _index_pages(self):
+        """Add every loaded page to the search index, a batch at a time"""
+        backends = list(get_search_backends(with_auto_update=True))
+        for model, pks in self.loaded.items():
+            for start in range(0, len(pks), self.batch_size):
+                pages = list(model.get_indexed_objects().using(self.using).filter(pk__in=pks[start:start + self.batch_size]))
+                for backend in backends:
+                    backend.add_bulk(model, pages)
+                if self.log:
+                    self.log(f'{model._meta.label}: {start + len(pages)}/{len(pks)} indexed')
+
+    def commit(self):
+        """
+        Write any queued pages, index the pages written since the last
+        commit and invalidate the caches they affect
+        """
+        self.flush()
+        if not self.loaded:
+            return
+        self._index_pages()
+        for path, first_child in self._existing_parents.items():
+            # As if each parent had one child published: its listing, and
+            # the menu when it is a site root
+            page_cache.invalidate_page(first_child)
+            navigation.invalidate_menus(first_child)
+        for page in self._updated_pages:
+            page_cache.invalidate_page(page)
+            navigation.invalidate_menus(page)
+        page_cache.bump_versions([
+            *(page_cache.object_version_key(Page, page.pk) for page in self._updated_pages),
+            page_cache.search_version_key(),
+            facets.FACETS_VERSION_KEY,
+        ])
+        self.loaded, self._existing_parents, self._updated_pages = {}, {}, []
+
+    def finish(self):
+        """Write any queued pages, index everything loaded and invalidate the caches it affects"""
+        self.commit()
+        return self.count
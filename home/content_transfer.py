@@ -0,0 +1,326 @@
+"""
+JSON Lines export and import of page content
+
+``export_pages`` writes one line per page of any ``home.models`` type, in
+tree order::
+
+    {"url_path": "/home/blog/a-post/", "type": "home.blogpage",
+     "fields": {"title": ..., "body": [<StreamField JSON>], "tags": [...]},
+     "images": {"12": {"title": ..., "file": ..., "file_hash": ...}}}
+
+Pages are read ``chunk_size`` at a time from an iterator over the page ids,
+so memory stays flat however large the site is. Tree position, revision,
+locking and ownership state belong to the site the pages live on and are
+left out.
+
+``import_pages`` reads the lines back in batches keyed by URL path: pages
+that exist are updated and the rest are created under their parent, which
+must exist or come earlier in the file, all through ``BulkPageLoader``.
+Image ids are matched to this site's images by file hash, then by file name,
+and references to images that match neither are dropped. Once a batch is
+committed the position reached is saved to a state file, so an interrupted
+import can carry on from there with ``resume=True``.
+"""
+import itertools
+import json
+import os
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import ForeignKey, Q
+from modelcluster.models import get_all_child_relations
+from taggit.managers import TaggableManager
+from wagtail import blocks
+from wagtail.fields import StreamField
+from wagtail.images import get_image_model
+from wagtail.images.blocks import ImageChooserBlock
+from wagtail.models import Page
+
+from .bulk_load import BulkPageLoader
+
+# Where the page sits and who is editing it, which the target site decides
+PAGE_STATE_FIELDS = {
+    'id', 'path', 'depth', 'numchild', 'url_path', 'content_type', 'draft_title', 'translation_key', 'locale',
+    'latest_revision', 'latest_revision_created_at', 'live_revision', 'has_unpublished_changes',
+    'locked', 'locked_at', 'locked_by', 'owner', 'alias_of', 'search_text',
+}
+
+
+def page_models():
+    return [model for model in apps.get_app_config('home').get_models() if issubclass(model, Page)]
+
+
+def content_fields(model):
+    """The concrete fields exported for a page model, by attname in the export"""
+    return [
+        field for field in model._meta.concrete_fields
+        if field.name not in PAGE_STATE_FIELDS and not (field.remote_field and field.remote_field.parent_link)
+    ]
+
+
+def tag_fields(model):
+    return [field for field in model._meta.many_to_many if isinstance(field, TaggableManager)]
+
+
+def _is_image_field(field):
+    return isinstance(field, ForeignKey) and issubclass(field.related_model, get_image_model())
+
+
+def map_raw_images(block, value, replace):
+    """A block's raw (JSON) value with each image id passed through ``replace``"""
+    if value is None:
+        return None
+    if isinstance(block, ImageChooserBlock):
+        return replace(value)
+    if isinstance(block, blocks.StructBlock):
+        return {
+            name: map_raw_images(block.child_blocks[name], item, replace) if name in block.child_blocks else item
+            for name, item in value.items()
+        }
+    if isinstance(block, blocks.ListBlock):
+        return [
+            {**item, 'value': map_raw_images(block.child_block, item['value'], replace)}
+            if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item
+            else map_raw_images(block.child_block, item, replace)
+            for item in value
+        ]
+    if isinstance(block, blocks.StreamBlock):
+        return [
+            {**item, 'value': map_raw_images(block.child_blocks[item['type']], item['value'], replace)}
+            if item['type'] in block.child_blocks else item
+            for item in value
+        ]
+    return value
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _page_record(page, tags):
+    fields, image_ids = {}, set()
+    for field in content_fields(type(page)):
+        if isinstance(field, StreamField):
+            raw_data = list(getattr(page, field.attname).raw_data)
+            map_raw_images(field.stream_block, raw_data, lambda pk: image_ids.add(pk) or pk)
+            fields[field.attname] = raw_data
+        else:
+            fields[field.attname] = field.value_from_object(page)
+            if _is_image_field(field) and fields[field.attname] is not None:
+                image_ids.add(fields[field.attname])
+    for field in tag_fields(type(page)):
+        fields[field.name] = tags.get((page.pk, field.name), [])
+    return {'url_path': page.url_path, 'type': page._meta.label_lower, 'fields': fields}, image_ids
+
+
+def _chunk_records(page_ids):
+    """Records for a chunk of ``(pk, content_type_id)`` pairs, in the chunk's order"""
+    by_model = {}
+    for pk, content_type_id in page_ids:
+        by_model.setdefault(ContentType.objects.get_for_id(content_type_id).model_class(), []).append(pk)
+
+    pages, tags = {}, {}
+    for model, pks in by_model.items():
+        pages.update(model.objects.in_bulk(pks))
+        for field in tag_fields(model):
+            object_field = field.through._meta.get_field('content_object').attname
+            rows = field.through.objects.filter(**{f'{object_field}__in': pks}).order_by('pk')
+            for page_id, name in rows.values_list(object_field, 'tag__name'):
+                tags.setdefault((page_id, field.name), []).append(name)
+
+    records = [_page_record(pages[pk], tags) for pk, _ in page_ids if pk in pages]
+    image_ids = set().union(*(ids for _, ids in records))
+    images = {
+        image.pop('pk'): image
+        for image in get_image_model().objects.filter(pk__in=image_ids).values('pk', 'title', 'file', 'file_hash')
+    }
+    for record, ids in records:
+        record['images'] = {str(pk): images[pk] for pk in sorted(ids) if pk in images}
+        yield record
+
+
+def export_pages(out, root=None, chunk_size=200, log=None):
+    """Write every page of a ``home.models`` type (under ``root``, if given) to ``out``, returning the count"""
+    content_types = ContentType.objects.get_for_models(*page_models()).values()
+    pages = Page.objects.filter(content_type__in=content_types)
+    if root is not None:
+        pages = pages.filter(path__startswith=root.path)
+    page_ids = pages.order_by('path').values_list('pk', 'content_type_id').iterator(chunk_size=chunk_size)
+
+    count = 0
+    for chunk in _chunks(page_ids, chunk_size):
+        for record in _chunk_records(chunk):
+            out.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+            count += 1
+        if log:
+            log(f'{count} pages exported')
+    return count
+
+
+def _parent_url_path(url_path):
+    return url_path[:url_path.rstrip('/').rfind('/') + 1]
+
+
+class PageImporter:
+    """
+    Import a JSON Lines export from ``path``, ``batch_size`` lines per
+    transaction, saving the position reached to ``state_path`` after each
+    """
+
+    def __init__(self, path, batch_size=200, revisions=True, state_path=None, log=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.state_path = state_path or f'{path}.state'
+        self.log = log
+        self.loader = BulkPageLoader(batch_size=batch_size, revisions=revisions)
+        self.missing_images = set()
+        self._images = {}
+        self._tags = {}
+        # Child relations of every page (e.g. comments), which the import
+        # leaves alone but the revisions and reference index read
+        self._page_relations = {
+            relation.get_accessor_name() for relation in get_all_child_relations(Page)
+        }
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return {'path': os.path.abspath(self.path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_state(self, resume):
+        state = {**self._signature(), 'line': 0, 'offset': 0, 'created': 0, 'updated': 0}
+        if not resume or not os.path.exists(self.state_path):
+            return state
+        with open(self.state_path) as f:
+            saved = json.load(f)
+        if any(saved.get(key) != state[key] for key in ('path', 'size', 'mtime_ns')):
+            raise ValueError(f'{self.path} has changed since the interrupted import; import it again without resuming')
+        return saved
+
+    def _save_state(self, state):
+        partial = f'{self.state_path}.partial'
+        with open(partial, 'w') as f:
+            json.dump(state, f)
+        os.replace(partial, self.state_path)
+
+    def _resolve_images(self, records):
+        """Match the batch's image ids not seen before to this site's images"""
+        wanted = {}
+        for record in records:
+            for pk, image in record.get('images', {}).items():
+                if int(pk) not in self._images:
+                    wanted[int(pk)] = image
+        if not wanted:
+            return
+        hashes = {image['file_hash'] for image in wanted.values() if image.get('file_hash')}
+        files = {image['file'] for image in wanted.values() if image.get('file')}
+        by_hash, by_file = {}, {}
+        matches = get_image_model().objects.filter(Q(file_hash__in=hashes) | Q(file__in=files)).order_by('pk')
+        for pk, file, file_hash in matches.values_list('pk', 'file', 'file_hash'):
+            by_hash.setdefault(file_hash, pk)
+            by_file.setdefault(file, pk)
+        for old_pk, image in wanted.items():
+            self._images[old_pk] = by_hash.get(image.get('file_hash') or None) or by_file.get(image.get('file'))
+
+    def _image_id(self, pk):
+        image_id = self._images.get(pk)
+        if image_id is None:
+            self.missing_images.add(pk)
+        return image_id
+
+    def _get_tags(self, field, names):
+        tag_model = field.remote_field.model
+        missing = [name for name in names if (tag_model, name) not in self._tags]
+        if missing:
+            for tag in tag_model.objects.filter(name__in=missing):
+                self._tags[tag_model, tag.name] = tag
+            for name in missing:
+                if (tag_model, name) not in self._tags:
+                    self._tags[tag_model, name] = tag_model.objects.create(name=name)
+        return [self._tags[tag_model, name] for name in names]
+
+    def _set_fields(self, page, fields):
+        """Set the record's fields on the page, returning the names of those set"""
+        names = []
+        for field in content_fields(type(page)):
+            if field.attname not in fields:
+                continue
+            value = fields[field.attname]
+            if isinstance(field, StreamField):
+                value = map_raw_images(field.stream_block, value, self._image_id)
+            elif _is_image_field(field):
+                value = None if value is None else self._image_id(value)
+            else:
+                value = field.to_python(value)
+            setattr(page, field.attname, value)
+            names.append(field.name)
+        for field in tag_fields(type(page)):
+            if field.name in fields:
+                getattr(page, field.name).set(self._get_tags(field, fields[field.name]))
+        return names
+
+    def _get_model(self, label):
+        try:
+            model = apps.get_model(label)
+        except (LookupError, ValueError):
+            model = None
+        if model not in page_models():
+            raise ValueError(f'{label} is not a page type of this site')
+        return model
+
+    def _import_batch(self, lines):
+        records = [(number, json.loads(line)) for number, line in lines]
+        self._resolve_images([record for _, record in records])
+        paths = [record['url_path'] for _, record in records]
+        pages = Page.objects.filter(url_path__in=paths).specific().prefetch_related(*self._page_relations)
+        existing = {page.url_path: page for page in pages}
+        parents = {
+            page.url_path: page
+            for page in Page.objects.filter(url_path__in={_parent_url_path(path) for path in paths})
+        }
+        for number, record in records:
+            url_path = record['url_path']
+            try:
+                model = self._get_model(record['type'])
+                page = existing.get(url_path)
+                if page is not None:
+                    if type(page) is not model:
+                        raise ValueError(f'{url_path} is a {page._meta.label_lower} here, not a {model._meta.label_lower}')
+                    names = self._set_fields(page, record['fields'])
+                    # Keyed by URL path, so the slug stays as it is
+                    self.loader.update(page, [name for name in names if name != 'slug'])
+                else:
+                    parent = parents.get(_parent_url_path(url_path))
+                    if parent is None:
+                        raise ValueError(f'{url_path} has no parent page; import its ancestors first')
+                    page = model()
+                    self._set_fields(page, record['fields'])
+                    page.slug = url_path.rstrip('/').rsplit('/', 1)[-1]
+                    self.loader.add(page, parent)
+            except (ValueError, KeyError) as e:
+                raise ValueError(f'{self.path}:{number}: {e}') from e
+            parents[url_path] = page
+
+    def run(self, resume=False):
+        """Import from the start, or from the saved position with ``resume``; returns ``(created, updated)``"""
+        state = self._load_state(resume)
+        with open(self.path, 'rb') as f:
+            f.seek(state['offset'])
+            numbered = enumerate(f, state['line'] + 1)
+            for batch in _chunks(numbered, self.batch_size):
+                count, updated_count = self.loader.count, self.loader.updated_count
+                self._import_batch([(number, line) for number, line in batch if line.strip()])
+                self.loader.commit()
+                updated = self.loader.updated_count - updated_count
+                state['created'] += self.loader.count - count - updated
+                state['updated'] += updated
+                state['line'] = batch[-1][0]
+                state['offset'] += sum(len(line) for _, line in batch)
+                self._save_state(state)
+                if self.log:
+                    self.log(f'{state["line"]} lines imported')
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return state['created'], state['updated']
@@ -0,0 +1,152 @@
+"""
+Technology facets for projects and portfolio items
+
+The technologies of a published ``ProjectPage`` (its comma-separated
+``technologies`` field) and of every ``PortfolioItemBlock`` in a published
+page's StreamFields are written to the ``TechnologyFacet`` table, one row
+per technology per project or portfolio item, when the page is published.
+Unpublishing removes the page's rows and deleting the page cascades to them.
+
+Names are normalized (whitespace collapsed, spellings that share a slug
+counted together), so filtering by a technology is an index lookup on
+``slug`` and the counts for a listing are one aggregate query, cached in the
+page cache backend until a facet row or the listing's children change. The
+sources are unbounded free text: technologies too long for their columns are
+skipped, titles are truncated and links that do not fit are left out, so a
+long entry never fails the publish.
+"""
+import re
+
+from django.db import models, transaction
+from django.utils.text import slugify
+from wagtail import blocks
+from wagtail.fields import StreamField
+
+from . import page_cache
+
+# Replaced whenever any page's facet rows are rewritten
+FACETS_VERSION_KEY = 'facets:technology:version'
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_technology(name):
+    """Return ``(name, slug)`` for a technology as typed, or ``None`` if it is blank"""
+    name = _whitespace.sub(' ', name or '').strip()
+    if not name:
+        return None
+    return name, slugify(name, allow_unicode=True) or name.casefold()
+
+
+def split_technologies(text):
+    """Technologies in a comma or newline separated field"""
+    return re.split(r'[,\n]', text or '')
+
+
+def _raw_list_values(items):
+    """Values of a raw ListBlock, in either the list-of-values or the list-of-dicts format"""
+    return [
+        item['value'] if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item else item
+        for item in items or []
+    ]
+
+
+def _raw_portfolio_items(block, value, item_id=''):
+    """``(id, value)`` for each portfolio item in a block's raw (JSON) value"""
+    from .models import PortfolioItemBlock
+
+    if value is None:
+        return
+    if isinstance(block, PortfolioItemBlock):
+        yield item_id, value
+    elif isinstance(block, blocks.StructBlock):
+        for name, child_block in block.child_blocks.items():
+            yield from _raw_portfolio_items(child_block, value.get(name), item_id)
+    elif isinstance(block, blocks.ListBlock):
+        for position, item in enumerate(value):
+            child_id = f'{item_id}:{position}'
+            if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item:
+                child_id = item.get('id') or child_id
+                item = item['value']
+            yield from _raw_portfolio_items(block.child_block, item, child_id)
+    elif isinstance(block, blocks.StreamBlock):
+        for position, item in enumerate(value):
+            child_block = block.child_blocks.get(item['type'])
+            if child_block is not None:
+                yield from _raw_portfolio_items(child_block, item['value'], item.get('id') or str(position))
+
+
+def page_facets(page):
+    """Unsaved ``TechnologyFacet`` rows for the page as it is now"""
+    from .models import ProjectPage, TechnologyFacet
+
+    items = []
+    if isinstance(page, ProjectPage):
+        items.append(('', page.title, '', split_technologies(page.technologies)))
+    for field in page._meta.concrete_fields:
+        if isinstance(field, StreamField):
+            raw_data = list(getattr(page, field.attname).raw_data)
+            for item_id, value in _raw_portfolio_items(field.stream_block, raw_data):
+                link = value.get('project_link') or value.get('github_link') or ''
+                items.append((item_id, value.get('title') or '', link, _raw_list_values(value.get('technologies'))))
+
+    max_length = {name: TechnologyFacet._meta.get_field(name).max_length for name in ('name', 'slug', 'title', 'link')}
+    rows = []
+    for item_id, title, link, technologies in items:
+        title = title[:max_length['title']]
+        if len(link) > max_length['link']:
+            link = ''
+        seen = set()
+        for technology in technologies:
+            normalized = normalize_technology(technology)
+            if normalized is None or normalized[1] in seen:
+                continue
+            if len(normalized[0]) > max_length['name'] or len(normalized[1]) > max_length['slug']:
+                continue
+            seen.add(normalized[1])
+            rows.append(TechnologyFacet(
+                name=normalized[0], slug=normalized[1], page_id=page.pk, item_id=item_id, title=title, link=link,
+            ))
+    return rows
+
+
+def update_page(page):
+    """Replace the page's facet rows with those of its live content"""
+    from .models import TechnologyFacet
+
+    with transaction.atomic():
+        TechnologyFacet.objects.filter(page_id=page.pk).delete()
+        TechnologyFacet.objects.bulk_create(page_facets(page))
+    page_cache.bump_versions([FACETS_VERSION_KEY])
+
+
+def remove_page(page):
+    from .models import TechnologyFacet
+
+    TechnologyFacet.objects.filter(page_id=page.pk).delete()
+    page_cache.bump_versions([FACETS_VERSION_KEY])
+
+
+def technology_counts(get_facets, cache_key, version_keys=()):
+    """
+    ``{'name', 'slug', 'count'}`` for each technology in the queryset that
+    ``get_facets`` returns, most used first, cached under ``cache_key`` until
+    a facet row or one of ``version_keys`` changes
+    """
+    cache = page_cache.get_cache()
+    entry = cache.get(cache_key)
+    if entry is not None and page_cache.versions_match(entry['versions']):
+        return entry['technologies']
+
+    versions = page_cache.snapshot_versions([FACETS_VERSION_KEY, *version_keys])
+    technologies = [
+        {'name': name, 'slug': slug, 'count': count}
+        for slug, name, count in (
+            get_facets().values('slug')
+            .annotate(display_name=models.Min('name'), count=models.Count('pk'))
+            .values_list('slug', 'display_name', 'count')
+            .order_by('-count', 'slug')
+        )
+    ]
+    cache.set(cache_key, {'technologies': technologies, 'versions': versions}, page_cache.PAGE_CACHE_TIMEOUT)
+    return technologies
@@ -0,0 +1,67 @@
+import os
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from benniewilliams.metrics import MetricsMiddleware, _instrument_cache, _QueryStats
+
+
+def _per_call(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+class Command(BaseCommand):
+    help = "Measure the overhead the metrics instrumentation adds to requests, cache lookups and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=10000,
+            help="Calls timed per measurement",
+        )
+
+    def handle(self, *args, **options):
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            raise CommandError("Unset PROMETHEUS_MULTIPROC_DIR so benchmark samples stay out of the served metrics")
+        iterations = options["iterations"]
+
+        response = HttpResponse()
+        request = RequestFactory().get("/health/")
+        request.resolver_match = resolve("/health/")
+        middleware = MetricsMiddleware(lambda request: response)
+        self.report(
+            "request",
+            _per_call(lambda: response, iterations),
+            _per_call(lambda: middleware(request), iterations),
+        )
+
+        plain_cache = LocMemCache("benchmark-plain", {})
+        instrumented_cache = _instrument_cache(LocMemCache("benchmark", {}), "benchmark")
+        plain_cache.set("key", "value")
+        instrumented_cache.set("key", "value")
+        self.report(
+            "cache get",
+            _per_call(lambda: plain_cache.get("key"), iterations),
+            _per_call(lambda: instrumented_cache.get("key"), iterations),
+        )
+
+        with connection.cursor() as cursor:
+            plain = _per_call(lambda: cursor.execute("SELECT 1"), iterations)
+        with connection.execute_wrapper(_QueryStats()), connection.cursor() as cursor:
+            instrumented = _per_call(lambda: cursor.execute("SELECT 1"), iterations)
+        self.report("query", plain, instrumented)
+
+    def report(self, name, plain, instrumented):
+        self.stdout.write(
+            "%-10s %8.2f µs plain  %8.2f µs instrumented  %+8.2f µs"
+            % (name, plain * 1e6, instrumented * 1e6, (instrumented - plain) * 1e6)
+        )
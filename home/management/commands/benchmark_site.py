@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from home.benchmark import ENDPOINTS, SERVER_ENDPOINTS, compare, run_benchmark, run_server_comparison
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles, throughput and queries per request of the home page, blog index, "
+        "blog posts, search and health check through the WSGI application, and save them as JSON; "
+        "with --servers, compare the WSGI and ASGI applications under slow database queries instead"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Requests timed per endpoint in each phase",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Worker processes for the concurrent phase (1 runs the serial phase only)",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=5,
+            help="Untimed requests per endpoint (and per worker) before timing starts",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            choices=ENDPOINTS,
+            help="Endpoint to benchmark, may be repeated (default: all)",
+        )
+        parser.add_argument(
+            "--servers",
+            action="store_true",
+            help="Serve each endpoint through the WSGI application (as the sync gunicorn workers do) "
+            "and the ASGI application while every query is slowed down, and compare them",
+        )
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=32,
+            help="With --servers: clients sending requests at the same time",
+        )
+        parser.add_argument(
+            "--slots",
+            type=int,
+            default=8,
+            help="With --servers: requests the WSGI server handles at once (default: 4 workers x 2 threads)",
+        )
+        parser.add_argument(
+            "--query-delay-ms",
+            type=float,
+            default=50,
+            help="With --servers: time added to every database query",
+        )
+        parser.add_argument(
+            "--host",
+            help="Host header to send (default: the default site's hostname)",
+        )
+        parser.add_argument(
+            "--output",
+            help="JSON file to write (default: a timestamped file in BENCHMARK_RESULTS_DIR)",
+        )
+        parser.add_argument(
+            "--compare",
+            help="Earlier result file to compare this run with",
+        )
+
+    def handle(self, *args, **options):
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            raise CommandError("Unset PROMETHEUS_MULTIPROC_DIR so benchmark samples stay out of the served metrics")
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+
+        try:
+            if options["servers"]:
+                result = run_server_comparison(
+                    requests=options["requests"],
+                    clients=options["clients"],
+                    slots=options["slots"],
+                    query_delay_ms=options["query_delay_ms"],
+                    warmup=options["warmup"],
+                    host=options["host"],
+                    endpoints=options["endpoints"] or SERVER_ENDPOINTS,
+                    log=self.report,
+                )
+            else:
+                result = run_benchmark(
+                    requests=options["requests"],
+                    concurrency=options["concurrency"],
+                    warmup=options["warmup"],
+                    host=options["host"],
+                    endpoints=options["endpoints"] or ENDPOINTS,
+                    log=self.report,
+                )
+        except ValueError as e:
+            raise CommandError(e)
+
+        output = options["output"] or os.path.join(
+            settings.BENCHMARK_RESULTS_DIR,
+            datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ.json"),
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Saved results to {output}"))
+
+        if previous is not None:
+            for phase, endpoint, metric, old, new, change in compare(result, previous):
+                self.stdout.write(
+                    "%-10s %-12s %-8s %10s -> %-10s %s"
+                    % (phase, endpoint, metric, old, new, "" if change is None else "%+.1f%%" % change)
+                )
+
+    def report(self, phase, endpoint, stats):
+        latency = stats["latency_ms"]
+        self.stdout.write(
+            "%-10s %-12s %6s req  %4s err  p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  %8.1f req/s  %6.1f queries"
+            % (phase, endpoint, stats["requests"], stats["errors"], latency["p50"], latency["p95"],
+               latency["p99"], stats["throughput_rps"] or 0, stats["queries"]["mean"])
+        )
@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.models import Page, Site
+
+from home.benchmark import load_synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create generated blog posts under a blog index, or projects under a project index, "
+        "with batched inserts and a single search indexing pass"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "parent",
+            help="Page id, or URL path on the default site (e.g. /blog/), of the blog or project index",
+        )
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=1000,
+            help="Pages to add",
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=12,
+            help="Images the pages' featured images, bodies and galleries are drawn from",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed, so the same options generate the same content",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Pages written per transaction",
+        )
+        parser.add_argument(
+            "--no-revisions",
+            action="store_false",
+            dest="revisions",
+            help="Create the pages without revisions",
+        )
+
+    def get_parent(self, parent):
+        if parent.isdigit():
+            pages = Page.objects.filter(pk=parent)
+        else:
+            root = Site.objects.get(is_default_site=True).root_page
+            path = parent.strip("/")
+            pages = Page.objects.filter(url_path=root.url_path + (path + "/" if path else ""))
+        page = pages.first()
+        if page is None:
+            raise CommandError(f"No page {parent}")
+        return page
+
+    def handle(self, *args, **options):
+        parent = self.get_parent(options["parent"])
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        try:
+            count = load_synthetic(
+                parent,
+                options["count"],
+                images=options["images"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+                revisions=options["revisions"],
+                log=log,
+            )
+        except (ValueError, ValidationError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(f"Added {count} pages under {parent.url_path}"))
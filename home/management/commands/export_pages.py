@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.models import Page, Site
+
+from home.content_transfer import export_pages
+
+
+class Command(BaseCommand):
+    help = "Stream every page of a home.models type, with its StreamField JSON, tags and images, as JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            help="File to write, or - for standard output",
+        )
+        parser.add_argument(
+            "--root",
+            help="Only export this page and its descendants: a page id, or URL path on the default site (e.g. /blog/)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Pages read per query",
+        )
+
+    def get_root(self, root):
+        if root.isdigit():
+            pages = Page.objects.filter(pk=root)
+        else:
+            site_root = Site.objects.get(is_default_site=True).root_page
+            path = root.strip("/")
+            pages = Page.objects.filter(url_path=site_root.url_path + (path + "/" if path else ""))
+        page = pages.first()
+        if page is None:
+            raise CommandError(f"No page {root}")
+        return page
+
+    def handle(self, *args, **options):
+        root = self.get_root(options["root"]) if options["root"] else None
+        to_stdout = options["output"] == "-"
+        # Progress goes to stderr when the pages go to stdout
+        log = (self.stderr.write if to_stdout else self.stdout.write) if options["verbosity"] > 1 else None
+        out = sys.stdout if to_stdout else open(options["output"], "w", encoding="utf-8")
+        try:
+            count = export_pages(out, root=root, chunk_size=options["chunk_size"], log=log)
+        finally:
+            if not to_stdout:
+                out.close()
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} pages to {options['output']}"))
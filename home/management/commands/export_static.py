@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.models import Site
+
+from home.static_export import export_site
+
+
+class Command(BaseCommand):
+    help = "Render every live page of each site to static HTML files, re-rendering only changed pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.STATIC_EXPORT_ROOT,
+            help="Directory to write the export to (default: STATIC_EXPORT_ROOT)",
+        )
+        parser.add_argument(
+            "--site",
+            help="Only export the site with this hostname",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes (default: one per CPU; 1 renders in-process)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render every page, e.g. after a template change",
+        )
+
+    def handle(self, *args, **options):
+        sites = Site.objects.select_related("root_page")
+        if options["site"]:
+            sites = sites.filter(hostname=options["site"])
+            if not sites:
+                raise CommandError("No site with hostname '%s'" % options["site"])
+
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        for site in sites:
+            rendered, dynamic, removed = export_site(
+                site,
+                options["output"],
+                workers=options["workers"],
+                force=options["force"],
+                log=log,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "%s: exported %s files, left %s to Django, removed %s"
+                    % (site.hostname, rendered, dynamic, removed)
+                )
+            )
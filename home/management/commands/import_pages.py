@@ -0,0 +1,62 @@
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from home.content_transfer import PageImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update pages from an export_pages JSON Lines file, keyed by URL path, "
+        "in batches that can be resumed after an interruption"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            help="JSON Lines file written by export_pages",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Lines imported per transaction",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Carry on from the last batch an interrupted import of the same file committed",
+        )
+        parser.add_argument(
+            "--state",
+            help="File the position reached is saved to (default: the input path with .state appended)",
+        )
+        parser.add_argument(
+            "--no-revisions",
+            action="store_false",
+            dest="revisions",
+            help="Write the pages without revisions",
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options["input"]):
+            raise CommandError(f"No file {options['input']}")
+        importer = PageImporter(
+            options["input"],
+            batch_size=options["batch_size"],
+            revisions=options["revisions"],
+            state_path=options["state"],
+            log=self.stdout.write if options["verbosity"] > 1 else None,
+        )
+        try:
+            created, updated = importer.run(resume=options["resume"])
+        except (ValueError, ValidationError) as e:
+            raise CommandError(e)
+        if importer.missing_images:
+            self.stderr.write(
+                self.style.WARNING(
+                    "%s referenced images have no match here and were left out" % len(importer.missing_images)
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f"Created {created} pages and updated {updated}"))
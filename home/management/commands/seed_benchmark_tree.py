@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from home.benchmark import seed_tree
+
+
+class Command(BaseCommand):
+    help = "Add generated blog posts and projects under the home page for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posts",
+            type=int,
+            default=2000,
+            help="Blog posts to add to the benchmark blog",
+        )
+        parser.add_argument(
+            "--projects",
+            type=int,
+            default=1000,
+            help="Projects to add to the benchmark project listing",
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=12,
+            help="Images the pages' featured images, bodies and galleries are drawn from",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed, so the same options generate the same content",
+        )
+        parser.add_argument(
+            "--no-revisions",
+            action="store_false",
+            dest="revisions",
+            help="Create the pages without revisions",
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        blog_index, project_index = seed_tree(
+            options["posts"],
+            options["projects"],
+            images=options["images"],
+            seed=options["seed"],
+            revisions=options["revisions"],
+            log=log,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%s now has %s posts and %s has %s projects"
+                % (blog_index.url_path, blog_index.get_children_count(),
+                   project_index.url_path, project_index.get_children_count())
+            )
+        )
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from home.renditions import warm_library
+
+
+class Command(BaseCommand):
+    help = "Generate the template image renditions for every image in the library"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filter",
+            action="append",
+            dest="filters",
+            help="Filter spec to generate, may be repeated (default: the responsive sets of RENDITION_WARMUP_FILTERS)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes (default: one per CPU; 1 renders in-process)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50,
+            help="Images handed to a worker at a time",
+        )
+
+    def handle(self, *args, **options):
+        # Without --filter, warm_images generates the responsive sets the templates use
+        filters = options["filters"]
+        log = self.stdout.write if options["verbosity"] > 1 else None
+        warmed, missing = warm_library(
+            workers=options["workers"],
+            filter_specs=filters,
+            chunk_size=options["chunk_size"],
+            log=log,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Warmed %s renditions for %s images (%s with missing source files)"
+                % (", ".join(filters or settings.RENDITION_WARMUP_FILTERS), warmed, missing)
+            )
+        )
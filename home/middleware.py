@@ -0,0 +1,156 @@
+"""
+Middleware for serving Wagtail pages from the page cache
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import cc_delim_re
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import page_cache
+from .static_export import index_filename
+
+
+def _is_cacheable_response(response):
+    # Pages that set cookies (e.g. a CSRF token for the contact form) are
+    # specific to the visitor and must never be shared
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    cache_control = {
+        directive.strip().split('=')[0].lower()
+        for directive in cc_delim_re.split(response.get('Cache-Control', ''))
+    }
+    return not cache_control & {'private', 'no-cache', 'no-store'}
+
+
+def _is_cacheable_request(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and page_cache.is_anonymous_request(request)
+        and not request.path_info.startswith(tuple(settings.PAGE_CACHE_EXEMPT_PATHS))
+    )
+
+
+def _cached_response(request, entry):
+    # The page serving view, and the hook labelling its page type, never run
+    request.metrics_page_type = entry.get('page_type', '')
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _cache_entry(request, response):
+    """What to store for a response from the page serving view, or ``None`` if it must not be cached"""
+    versions = getattr(request, 'page_cache_versions', None)
+    if request.method != 'GET' or not versions or not _is_cacheable_response(response):
+        return None
+    return {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'versions': versions,
+        'page_type': getattr(request, 'metrics_page_type', ''),
+    }
+
+
+class PageCacheMiddleware:
+    """
+    Full-page cache for anonymous GET requests to Wagtail pages
+
+    Only responses from Wagtail's page serving view are stored; the
+    ``before_serve_page`` hook in ``home.wagtail_hooks`` records which page
+    was served and snapshots the versions it depends on before rendering.
+    Under ASGI the cache is read and written through its async API.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _is_cacheable_request(request):
+            return self.get_response(request)
+
+        cache = page_cache.get_cache()
+        key = page_cache.request_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and page_cache.versions_match(entry['versions']):
+            return _cached_response(request, entry)
+
+        response = self.get_response(request)
+        entry = _cache_entry(request, response)
+        if entry is not None:
+            cache.set(key, entry, page_cache.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    async def __acall__(self, request):
+        if not _is_cacheable_request(request):
+            return await self.get_response(request)
+
+        cache = page_cache.get_cache()
+        key = page_cache.request_cache_key(request)
+        entry = await cache.aget(key)
+        if entry is not None and await page_cache.aversions_match(entry['versions']):
+            return _cached_response(request, entry)
+
+        response = await self.get_response(request)
+        entry = _cache_entry(request, response)
+        if entry is not None:
+            await cache.aset(key, entry, page_cache.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+
+class _StaticExportSettings:
+    """
+    Settings seen by WhiteNoise: only the export directory, no static files,
+    and looked up on every request so later exports are served as written
+    """
+
+    STATIC_ROOT = None
+    WHITENOISE_AUTOREFRESH = True
+    WHITENOISE_INDEX_FILE = True
+    WHITENOISE_USE_FINDERS = False
+
+    def __init__(self, root):
+        self.WHITENOISE_ROOT = root
+
+    def __getattr__(self, name):
+        return getattr(settings, name)
+
+
+class StaticExportMiddleware(WhiteNoiseMiddleware):
+    """
+    Serve pages written by ``manage.py export_static`` without touching Django
+
+    Files are found and stat'ed per request rather than once at startup, so
+    pages a later export writes, rewrites or removes are served (or not)
+    straight away. A query string is mapped to the exported variant file for
+    it (``/blog/?page=2`` to ``blog/index.page=2.html``); queries with no such
+    file, and requests with a session, fall through to Django.
+    """
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response, settings=_StaticExportSettings(settings.STATIC_EXPORT_SERVE_DIR))
+
+    def __call__(self, request):
+        if not page_cache.is_anonymous_request(request):
+            return self.get_response(request)
+        if not request.META.get('QUERY_STRING'):
+            return super().__call__(request)
+        static_file = None
+        query = {key: values[0] for key, values in request.GET.lists() if len(values) == 1}
+        if request.path_info.endswith('/') and len(query) == len(request.GET):
+            static_file = self.find_file(request.path_info + index_filename(query))
+        if static_file is None:
+            return self.get_response(request)
+        return self.serve(static_file, request)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_aboutpage_servicespage'),
+        ('wagtailcore', '0095_groupsitepermission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogindexpage',
+            name='pagination',
+            field=models.CharField(choices=[('pages', 'Numbered pages (?page=)'), ('cursor', 'Cursor (?cursor=), constant cost for deep pages')], default='pages', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='blogindexpage',
+            name='posts_per_page',
+            field=models.PositiveSmallIntegerField(default=10),
+        ),
+        # Supports the newest-first child listing and its keyset cursor
+        # conditions on (first_published_at, id) without a sort step
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS home_page_listing_idx '
+            'ON wagtailcore_page (depth, first_published_at DESC, id DESC)',
+            'DROP INDEX IF EXISTS home_page_listing_idx',
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+MENU_SLUGS = ["about", "services", "blog", "contact"]
+
+
+def show_main_pages_in_menus(apps, schema_editor):
+    # The header menu is now built from show_in_menus; keep the links that
+    # used to be hardcoded in base.html
+    Page = apps.get_model("wagtailcore.Page")
+    Page.objects.filter(depth=3, live=True, slug__in=MENU_SLUGS).update(show_in_menus=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0005_blogindexpage_pagination"),
+    ]
+
+    operations = [
+        migrations.RunPython(show_main_pages_in_menus, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+import wagtail.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_show_main_pages_in_menus'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpage',
+            name='body',
+            field=wagtail.fields.StreamField([('heading', 0), ('paragraph', 1), ('image', 2), ('code', 3), ('quote', 4), ('embed', 5)], block_lookup={0: ('wagtail.blocks.CharBlock', (), {'form_classname': 'full title'}), 1: ('wagtail.blocks.RichTextBlock', (), {}), 2: ('home.renditions.StoredImageChooserBlock', (), {}), 3: ('wagtail.blocks.TextBlock', (), {}), 4: ('wagtail.blocks.BlockQuoteBlock', (), {}), 5: ('wagtail.blocks.URLBlock', (), {})}),
+        ),
+        migrations.AlterField(
+            model_name='homepage',
+            name='content',
+            field=wagtail.fields.StreamField([('hero', 5), ('about', 11), ('portfolio', 16), ('rich_text', 6), ('raw_html', 17)], blank=True, block_lookup={0: ('wagtail.blocks.CharBlock', (), {'max_length': 200}), 1: ('wagtail.blocks.CharBlock', (), {'max_length': 500, 'required': False}), 2: ('home.renditions.StoredImageChooserBlock', (), {'required': False}), 3: ('wagtail.blocks.CharBlock', (), {'max_length': 100, 'required': False}), 4: ('wagtail.blocks.URLBlock', (), {'required': False}), 5: ('wagtail.blocks.StructBlock', [[('heading', 0), ('subheading', 1), ('image', 2), ('cta_text', 3), ('cta_link', 4)]], {}), 6: ('wagtail.blocks.RichTextBlock', (), {}), 7: ('wagtail.blocks.CharBlock', (), {'max_length': 100}), 8: ('wagtail.blocks.IntegerBlock', (), {'max_value': 100, 'min_value': 0}), 9: ('wagtail.blocks.StructBlock', [[('name', 7), ('level', 8)]], {}), 10: ('wagtail.blocks.ListBlock', (9,), {}), 11: ('wagtail.blocks.StructBlock', [[('heading', 0), ('content', 6), ('image', 2), ('skills', 10)]], {}), 12: ('home.renditions.StoredImageChooserBlock', (), {}), 13: ('wagtail.blocks.CharBlock', (), {'max_length': 50}), 14: ('wagtail.blocks.ListBlock', (13,), {}), 15: ('wagtail.blocks.StructBlock', [[('title', 0), ('description', 6), ('image', 12), ('project_link', 4), ('github_link', 4), ('technologies', 14)]], {}), 16: ('wagtail.blocks.ListBlock', (15,), {}), 17: ('wagtail.blocks.RawHTMLBlock', (), {})}, null=True),
+        ),
+        migrations.AlterField(
+            model_name='projectpage',
+            name='content',
+            field=wagtail.fields.StreamField([('overview', 0), ('features', 2), ('gallery', 4), ('code_snippet', 7), ('testimonial', 9)], block_lookup={0: ('wagtail.blocks.RichTextBlock', (), {}), 1: ('wagtail.blocks.CharBlock', (), {'max_length': 255}), 2: ('wagtail.blocks.ListBlock', (1,), {}), 3: ('home.renditions.StoredImageChooserBlock', (), {}), 4: ('wagtail.blocks.ListBlock', (3,), {}), 5: ('wagtail.blocks.ChoiceBlock', [], {'choices': [('python', 'Python'), ('javascript', 'JavaScript'), ('html', 'HTML/CSS'), ('bash', 'Bash')]}), 6: ('wagtail.blocks.TextBlock', (), {}), 7: ('wagtail.blocks.StructBlock', [[('language', 5), ('code', 6)]], {}), 8: ('wagtail.blocks.CharBlock', (), {'max_length': 255, 'required': False}), 9: ('wagtail.blocks.StructBlock', [[('quote', 6), ('author', 1), ('role', 8)]], {})}),
+        ),
+    ]
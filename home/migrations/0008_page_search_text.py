@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+SEARCH_STREAM_FIELDS = {
+    'homepage': ['content'],
+    'blogpage': ['body'],
+    'projectpage': ['content'],
+    'aboutpage': ['career_timeline', 'expertise_areas', 'values'],
+    'servicespage': ['services'],
+}
+
+
+def extract_search_text(apps, schema_editor):
+    # Same extraction as StreamFieldSearchMixin.extract_search_text, for pages
+    # saved before the field existed
+    for model_name, field_names in SEARCH_STREAM_FIELDS.items():
+        model = apps.get_model('home', model_name)
+        for page in model.objects.all():
+            parts = []
+            for name in field_names:
+                field = model._meta.get_field(name)
+                parts.extend(field.get_searchable_content(field.value_from_object(page)))
+            model.objects.filter(pk=page.pk).update(search_text='\n'.join(part for part in parts if part))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_stored_image_chooser_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aboutpage',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpage',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectpage',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='servicespage',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(extract_search_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+import django.db.models.deletion
+import modelcluster.contrib.taggit
+import modelcluster.fields
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def split_tags(value):
+    names = {}
+    for tag in (value or '').split(','):
+        if tag.strip():
+            names.setdefault(tag.strip().casefold(), tag.strip())
+    return list(names.values())
+
+
+def get_tag(Tag, name, tags):
+    # Tags differing only in case are one tag, as with TAGGIT_CASE_INSENSITIVE
+    key = name.casefold()
+    if key not in tags:
+        tag = Tag.objects.filter(name__iexact=name).first()
+        if tag is None:
+            # Historical models lack Tag.save's slug generation
+            base = slugify(name, allow_unicode=True) or 'tag'
+            slug, number = base, 1
+            while Tag.objects.filter(slug=slug).exists():
+                slug, number = f'{base}_{number}', number + 1
+            tag = Tag.objects.create(name=name, slug=slug)
+        tags[key] = tag
+    return tags[key]
+
+
+def copy_tags(apps, schema_editor):
+    BlogPage = apps.get_model('home', 'BlogPage')
+    BlogPageTag = apps.get_model('home', 'BlogPageTag')
+    Tag = apps.get_model('taggit', 'Tag')
+    Revision = apps.get_model('wagtailcore', 'Revision')
+    tags = {}
+
+    BlogPageTag.objects.bulk_create(
+        BlogPageTag(content_object_id=pk, tag=get_tag(Tag, name, tags))
+        for pk, value in BlogPage.objects.values_list('pk', 'legacy_tags')
+        for name in split_tags(value)
+    )
+
+    # Drafts keep their tags when they are published or reverted to
+    revisions = Revision.objects.filter(content_type__app_label='home', content_type__model='blogpage')
+    for revision in revisions.iterator():
+        content = revision.content
+        if not isinstance(content.get('tags'), str):
+            continue
+        content['tagged_items'] = [
+            {'pk': None, 'tag': get_tag(Tag, name, tags).pk, 'content_object': content.get('pk')}
+            for name in split_tags(content.pop('tags'))
+        ]
+        Revision.objects.filter(pk=revision.pk).update(content=content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_page_search_text'),
+        ('wagtailcore', '0095_groupsitepermission'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='blogpage',
+            old_name='tags',
+            new_name='legacy_tags',
+        ),
+        migrations.CreateModel(
+            name='BlogPageTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_object', modelcluster.fields.ParentalKey(on_delete=django.db.models.deletion.CASCADE, related_name='tagged_items', to='home.blogpage')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_items', to='taggit.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='blogpage',
+            name='tags',
+            field=modelcluster.contrib.taggit.ClusterTaggableManager(blank=True, help_text='A comma-separated list of tags.', through='home.BlogPageTag', to='taggit.Tag', verbose_name='Tags'),
+        ),
+        migrations.AddIndex(
+            model_name='blogpagetag',
+            index=models.Index(fields=['tag', 'content_object'], name='home_blogpagetag_tag_post'),
+        ),
+        migrations.RunPython(copy_tags, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='blogpage',
+            name='legacy_tags',
+        ),
+    ]
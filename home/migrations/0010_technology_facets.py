@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:47
+
+import django.db.models.deletion
+import wagtail.fields
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def normalize(name):
+    name = ' '.join((name or '').split())
+    return (name, slugify(name, allow_unicode=True) or name.casefold()) if name else None
+
+
+def list_values(items):
+    return [
+        item['value'] if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item else item
+        for item in items or []
+    ]
+
+
+def facet_rows(TechnologyFacet, page_id, item_id, title, link, technologies):
+    # Same limits as home.facets.page_facets: the sources are unbounded
+    title = title[:255]
+    if len(link) > 200:
+        link = ''
+    seen = set()
+    for technology in technologies:
+        normalized = normalize(technology)
+        if normalized and normalized[1] not in seen and max(map(len, normalized)) <= 100:
+            seen.add(normalized[1])
+            yield TechnologyFacet(
+                name=normalized[0], slug=normalized[1], page_id=page_id, item_id=item_id, title=title, link=link,
+            )
+
+
+def build_facets(apps, schema_editor):
+    # Same rows as home.facets.update_page for the pages published so far
+    TechnologyFacet = apps.get_model('home', 'TechnologyFacet')
+    rows = []
+    for project in apps.get_model('home', 'ProjectPage').objects.filter(live=True):
+        technologies = project.technologies.replace('\n', ',').split(',')
+        rows.extend(facet_rows(TechnologyFacet, project.pk, '', project.title, '', technologies))
+    for homepage in apps.get_model('home', 'HomePage').objects.filter(live=True):
+        for block_position, block in enumerate(homepage.content.raw_data):
+            if block['type'] != 'portfolio':
+                continue
+            for position, item in enumerate(block['value']):
+                item_id = f"{block.get('id') or block_position}:{position}"
+                if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item:
+                    item_id = item.get('id') or item_id
+                    item = item['value']
+                link = item.get('project_link') or item.get('github_link') or ''
+                rows.extend(facet_rows(
+                    TechnologyFacet, homepage.pk, item_id, item.get('title') or '', link, list_values(item.get('technologies')),
+                ))
+    TechnologyFacet.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_blog_page_tags'),
+        ('wagtailcore', '0095_groupsitepermission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectIndexPage',
+            fields=[
+                ('page_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='wagtailcore.page')),
+                ('intro', wagtail.fields.RichTextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Project Index',
+            },
+            bases=('wagtailcore.page',),
+        ),
+        migrations.CreateModel(
+            name='TechnologyFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(allow_unicode=True, db_index=False, max_length=100)),
+                ('item_id', models.CharField(blank=True, max_length=64)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('link', models.URLField(blank=True)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.page')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['slug', 'item_id', 'page'], name='home_techfacet_slug')],
+            },
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replace 0005's listing index. Its trailing ``id`` column was never used:
+    for a page subclass the listing's ``pk`` tie-breaker and keyset condition
+    are on the subclass table's ``page_ptr_id``. ``depth`` stays first: the
+    listing filters on it by equality, so the index is walked newest first
+    and only the ``path`` prefix and ``live`` are checked per row, while an
+    index led by ``path`` has to sort the whole range. The index is on
+    Wagtail's table, so it cannot be declared in a model's Meta and is not
+    part of the migration state.
+    """
+
+    dependencies = [
+        ('home', '0011_blogindexpage_posts_per_page_min'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                'DROP INDEX IF EXISTS home_page_listing_idx',
+                'CREATE INDEX IF NOT EXISTS home_page_depth_published_idx '
+                'ON wagtailcore_page (depth, first_published_at DESC)',
+            ],
+            [
+                'DROP INDEX IF EXISTS home_page_depth_published_idx',
+                'CREATE INDEX IF NOT EXISTS home_page_listing_idx '
+                'ON wagtailcore_page (depth, first_published_at DESC, id DESC)',
+            ],
+        ),
+    ]
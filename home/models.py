@@ -1,20 +1,33 @@
+from urllib.parse import urlencode
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.http import Http404
+from django.utils.functional import cached_property
 from wagtail.models import Page
 from wagtail.fields import RichTextField, StreamField
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel, InlinePanel
 from wagtail.images.models import Image
+from wagtail.search import index
 from wagtail import blocks
-from wagtail.images.blocks import ImageChooserBlock
 from wagtail.snippets.models import register_snippet
+from modelcluster.contrib.taggit import ClusterTaggableManager
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
+from taggit.models import TaggedItemBase
+
+from . import facets, page_cache
+from .block_cache import CachedStructBlock
+from .pagination import KeysetPaginator
+from .renditions import StoredImageChooserBlock, responsive_filter_specs
 
 
 # StreamField blocks for flexible content
-class HeroBlock(blocks.StructBlock):
+class HeroBlock(CachedStructBlock):
     heading = blocks.CharBlock(max_length=200)
     subheading = blocks.CharBlock(max_length=500, required=False)
-    image = ImageChooserBlock(required=False)
+    image = StoredImageChooserBlock(required=False)
     cta_text = blocks.CharBlock(max_length=100, required=False)
     cta_link = blocks.URLBlock(required=False)
 
@@ -24,10 +37,10 @@ class HeroBlock(blocks.StructBlock):
         label = 'Hero Section'
 
 
-class PortfolioItemBlock(blocks.StructBlock):
+class PortfolioItemBlock(CachedStructBlock):
     title = blocks.CharBlock(max_length=200)
     description = blocks.RichTextBlock()
-    image = ImageChooserBlock()
+    image = StoredImageChooserBlock()
     project_link = blocks.URLBlock(required=False)
     github_link = blocks.URLBlock(required=False)
     technologies = blocks.ListBlock(blocks.CharBlock(max_length=50))
@@ -38,10 +51,10 @@ class PortfolioItemBlock(blocks.StructBlock):
         label = 'Portfolio Item'
 
 
-class AboutBlock(blocks.StructBlock):
+class AboutBlock(CachedStructBlock):
     heading = blocks.CharBlock(max_length=200)
     content = blocks.RichTextBlock()
-    image = ImageChooserBlock(required=False)
+    image = StoredImageChooserBlock(required=False)
     skills = blocks.ListBlock(
         blocks.StructBlock([
             ('name', blocks.CharBlock(max_length=100)),
@@ -55,7 +68,37 @@ class AboutBlock(blocks.StructBlock):
         label = 'About Section'
 
 
-class HomePage(Page):
+class StreamFieldSearchMixin(models.Model):
+    """
+    Keeps ``search_text`` filled with the searchable text of the StreamFields
+    named in ``search_stream_fields``, extracted when the page is saved (and
+    so when it is published), so indexing reads one flat field instead of
+    walking block trees
+    """
+
+    search_stream_fields = ()
+
+    search_text = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def extract_search_text(self):
+        parts = []
+        for name in self.search_stream_fields:
+            parts.extend(self._meta.get_field(name).get_searchable_content(getattr(self, name)))
+        return '\n'.join(part for part in parts if part)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(self.search_stream_fields) & set(update_fields):
+            self.search_text = self.extract_search_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_text'}
+        return super().save(*args, **kwargs)
+
+
+class HomePage(StreamFieldSearchMixin, Page):
     """Landing page with hero, portfolio, and about sections"""
 
     hero_title = models.CharField(
@@ -85,30 +128,175 @@ class HomePage(Page):
         FieldPanel('content'),
     ]
 
+    search_stream_fields = ('content',)
+    search_fields = Page.search_fields + [
+        index.SearchField('hero_title'),
+        index.SearchField('hero_subtitle'),
+        index.SearchField('search_text'),
+    ]
+
     class Meta:
         verbose_name = "Homepage"
 
 
 class BlogIndexPage(Page):
     """Index page for blog posts"""
+    show_in_menus_default = True
+
+    PAGINATION_CHOICES = [
+        ('pages', 'Numbered pages (?page=)'),
+        ('cursor', 'Cursor (?cursor=), constant cost for deep pages'),
+    ]
 
     intro = RichTextField(blank=True)
+    posts_per_page = models.PositiveSmallIntegerField(default=10, validators=[MinValueValidator(1)])
+    pagination = models.CharField(max_length=10, choices=PAGINATION_CHOICES, default='pages')
 
     content_panels = Page.content_panels + [
         FieldPanel('intro'),
+        MultiFieldPanel([
+            FieldPanel('posts_per_page'),
+            FieldPanel('pagination'),
+        ], heading="Listing"),
+    ]
+
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
     ]
 
+    # Rendition used for post cards in blog_index_page.html
+    LISTING_IMAGE_FILTER = 'fill-400x300'
+
+    def get_blog_posts(self, tag=None):
+        """
+        Live BlogPage children with only the fields the listing shows; the body
+        StreamField is deferred and card renditions are prefetched per page.
+        ``tag`` is a tag slug, found through the tag and tagged item indexes
+        """
+        blog_posts = BlogPage.objects.child_of(self).live()
+        if tag:
+            blog_posts = blog_posts.filter(tagged_items__tag__slug=tag)
+        return (
+            blog_posts
+            .defer('body', 'search_text')
+            .prefetch_related(
+                models.Prefetch(
+                    'featured_image',
+                    queryset=Image.objects.prefetch_renditions(
+                        *(spec for _, specs in responsive_filter_specs(self.LISTING_IMAGE_FILTER) for spec in specs)
+                    ),
+                )
+            )
+            .order_by('-first_published_at', '-pk')
+        )
+
+    def get_tag_counts(self):
+        """
+        ``{'name', 'slug', 'count'}`` for every tag on a live post, by name,
+        cached until a post below this index or the index itself changes
+        """
+        cache = page_cache.get_cache()
+        key = f'blogtags:{self.pk}'
+        entry = cache.get(key)
+        if entry is not None and page_cache.versions_match(entry['versions']):
+            return entry['tags']
+
+        versions = page_cache.snapshot_versions(
+            [page_cache.tree_version_key(self.path), page_cache.self_version_key(self.path)]
+        )
+        tags = [
+            {'name': name, 'slug': slug, 'count': count}
+            for name, slug, count in (
+                BlogPageTag.objects.filter(content_object__in=BlogPage.objects.child_of(self).live().values('pk'))
+                .values_list('tag__name', 'tag__slug')
+                .annotate(count=models.Count('content_object', distinct=True))
+                .order_by('tag__name')
+            )
+        ]
+        cache.set(key, {'tags': tags, 'versions': versions}, page_cache.PAGE_CACHE_TIMEOUT)
+        return tags
+
+    @property
+    def page_size(self):
+        # Rows saved before posts_per_page was validated may hold 0
+        return max(self.posts_per_page or 0, 1)
+
+    def paginate_blog_posts(self, request, tag=None):
+        """Return the requested page of posts with previous/next query strings"""
+        blog_posts = self.get_blog_posts(tag)
+        base_query = {'tag': tag} if tag else {}
+
+        if self.pagination == 'cursor':
+            page = KeysetPaginator(blog_posts, self.page_size).page(request.GET.get('cursor'))
+            previous_query = {**base_query, 'cursor': page.previous_cursor} if page.has_previous() else None
+            next_query = {**base_query, 'cursor': page.next_cursor} if page.has_next() else None
+            return page, previous_query, next_query
+
+        paginator = Paginator(blog_posts, self.page_size)
+        try:
+            page = paginator.page(request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        previous_query = {**base_query, 'page': page.previous_page_number()} if page.has_previous() else None
+        next_query = {**base_query, 'page': page.next_page_number()} if page.has_next() else None
+        return page, previous_query, next_query
+
     def get_context(self, request):
         context = super().get_context(request)
-        blog_posts = self.get_children().live().order_by('-first_published_at')
+        tags = self.get_tag_counts()
+        current_tag = None
+        if request.GET.get('tag'):
+            current_tag = next((tag for tag in tags if tag['slug'] == request.GET['tag']), None)
+            if current_tag is None:
+                raise Http404("No posts with this tag")
+        blog_posts, previous_query, next_query = self.paginate_blog_posts(
+            request, current_tag['slug'] if current_tag else None
+        )
         context['blog_posts'] = blog_posts
+        context['tags'] = tags
+        context['current_tag'] = current_tag
+        context['previous_query'] = urlencode(previous_query) if previous_query else None
+        context['next_query'] = urlencode(next_query) if next_query else None
         return context
 
+    def _pagination_variants(self, tag=None):
+        base_query = {'tag': tag} if tag else {}
+        if self.pagination == 'cursor':
+            variants = []
+            paginator = KeysetPaginator(self.get_blog_posts(tag), self.page_size)
+            page = paginator.page()
+            while page.has_next():
+                variants.append({**base_query, 'cursor': page.next_cursor})
+                page = paginator.page(page.next_cursor)
+            return variants
+
+        paginator = Paginator(self.get_blog_posts(tag), self.page_size)
+        return [{**base_query, 'page': number} for number in paginator.page_range[1:]]
+
+    def get_static_export_variants(self):
+        """Query strings for every page of posts after the first, and for every tag listing"""
+        variants = self._pagination_variants()
+        for tag in self.get_tag_counts():
+            variants.append({'tag': tag['slug']})
+            variants.extend(self._pagination_variants(tag['slug']))
+        return variants
+
     class Meta:
         verbose_name = "Blog Index"
 
 
-class BlogPage(Page):
+class BlogPageTag(TaggedItemBase):
+    """Tag on a blog post"""
+    content_object = ParentalKey('home.BlogPage', related_name='tagged_items', on_delete=models.CASCADE)
+
+    class Meta:
+        # Posts with a tag are read from this index alone
+        indexes = [models.Index(fields=['tag', 'content_object'], name='home_blogpagetag_tag_post')]
+
+
+class BlogPage(StreamFieldSearchMixin, Page):
     """Individual blog post page"""
 
     date = models.DateField("Post date")
@@ -116,13 +304,13 @@ class BlogPage(Page):
     body = StreamField([
         ('heading', blocks.CharBlock(form_classname="full title")),
         ('paragraph', blocks.RichTextBlock()),
-        ('image', ImageChooserBlock()),
+        ('image', StoredImageChooserBlock()),
         ('code', blocks.TextBlock()),
         ('quote', blocks.BlockQuoteBlock()),
         ('embed', blocks.URLBlock()),
     ], use_json_field=True)
 
-    tags = models.CharField(max_length=500, blank=True, help_text="Comma-separated tags")
+    tags = ClusterTaggableManager(through=BlogPageTag, blank=True)
 
     featured_image = models.ForeignKey(
         'wagtailimages.Image',
@@ -140,11 +328,115 @@ class BlogPage(Page):
         FieldPanel('tags'),
     ]
 
+    search_stream_fields = ('body',)
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
+        index.RelatedFields('tags', [
+            index.SearchField('name'),
+        ]),
+        index.SearchField('search_text'),
+        index.FilterField('date'),
+    ]
+
     class Meta:
         verbose_name = "Blog Post"
 
 
-class ProjectPage(Page):
+class ProjectIndexPage(Page):
+    """Index page for projects, filterable by technology"""
+    show_in_menus_default = True
+
+    intro = RichTextField(blank=True)
+
+    content_panels = Page.content_panels + [
+        FieldPanel('intro'),
+    ]
+
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
+    ]
+
+    # Rendition used for project cards in project_index_page.html
+    LISTING_IMAGE_FILTER = 'fill-400x300'
+
+    def get_projects(self, technology=None):
+        """
+        Live ProjectPage children in tree order, with card renditions
+        prefetched; ``technology`` is a slug, found through the facet index
+        """
+        projects = ProjectPage.objects.child_of(self).live()
+        if technology:
+            projects = projects.filter(
+                pk__in=TechnologyFacet.objects.filter(slug=technology, item_id='').values('page_id')
+            )
+        return (
+            projects
+            .defer('content', 'search_text')
+            .prefetch_related(
+                models.Prefetch(
+                    'featured_image',
+                    queryset=Image.objects.prefetch_renditions(
+                        *(spec for _, specs in responsive_filter_specs(self.LISTING_IMAGE_FILTER) for spec in specs)
+                    ),
+                )
+            )
+            .order_by('path')
+        )
+
+    @cached_property
+    def site_root_path(self):
+        """Tree path of the site root this index is under, found in one query"""
+        return (
+            Page.objects.filter(path__in=page_cache.ancestor_paths(self.path), sites_rooted_here__isnull=False)
+            .order_by('-depth')
+            .values_list('path', flat=True)
+            .first()
+        )
+
+    def get_facets(self):
+        """Facet rows of the live projects below this index and of the portfolio items on its site"""
+        root_path = self.site_root_path
+        portfolio_items = models.Q(page__path__startswith=root_path) if root_path else models.Q(pk__in=[])
+        return TechnologyFacet.objects.filter(
+            models.Q(item_id='', page__in=ProjectPage.objects.child_of(self).live().values('pk'))
+            | (portfolio_items & ~models.Q(item_id=''))
+        )
+
+    def get_technology_counts(self):
+        return facets.technology_counts(
+            self.get_facets, f'facets:technology:{self.pk}', [page_cache.self_version_key(self.path)]
+        )
+
+    def get_context(self, request):
+        context = super().get_context(request)
+        technologies = self.get_technology_counts()
+        current_technology = None
+        if request.GET.get('technology'):
+            current_technology = next(
+                (technology for technology in technologies if technology['slug'] == request.GET['technology']), None
+            )
+            if current_technology is None:
+                raise Http404("No projects use this technology")
+
+        slug = current_technology['slug'] if current_technology else None
+        context['technologies'] = technologies
+        context['current_technology'] = current_technology
+        context['projects'] = self.get_projects(slug)
+        context['portfolio_items'] = (
+            self.get_facets().exclude(item_id='').filter(slug=slug).select_related('page').order_by('title')
+            if slug else []
+        )
+        return context
+
+    def get_static_export_variants(self):
+        """Query strings for every technology listing"""
+        return [{'technology': technology['slug']} for technology in self.get_technology_counts()]
+
+    class Meta:
+        verbose_name = "Project Index"
+
+
+class ProjectPage(StreamFieldSearchMixin, Page):
     """Detailed project page"""
 
     summary = models.CharField(max_length=500)
@@ -171,7 +463,7 @@ class ProjectPage(Page):
     content = StreamField([
         ('overview', blocks.RichTextBlock()),
         ('features', blocks.ListBlock(blocks.CharBlock(max_length=255))),
-        ('gallery', blocks.ListBlock(ImageChooserBlock())),
+        ('gallery', blocks.ListBlock(StoredImageChooserBlock())),
         ('code_snippet', blocks.StructBlock([
             ('language', blocks.ChoiceBlock(choices=[
                 ('python', 'Python'),
@@ -204,12 +496,43 @@ class ProjectPage(Page):
         FieldPanel('content'),
     ]
 
+    search_stream_fields = ('content',)
+    search_fields = Page.search_fields + [
+        index.SearchField('summary'),
+        index.SearchField('technologies'),
+        index.SearchField('client'),
+        index.SearchField('search_text'),
+    ]
+
     class Meta:
         verbose_name = "Project"
 
 
-class AboutPage(Page):
+class TechnologyFacet(models.Model):
+    """
+    A technology used by a published project page (``item_id`` blank) or by
+    a portfolio item on a published page (``item_id`` is the item's block id)
+    """
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, allow_unicode=True, db_index=False)
+    page = models.ForeignKey('wagtailcore.Page', on_delete=models.CASCADE, related_name='+')
+    item_id = models.CharField(max_length=64, blank=True)
+    title = models.CharField(max_length=255, blank=True)
+    link = models.URLField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Projects and portfolio items using a technology
+            models.Index(fields=['slug', 'item_id', 'page'], name='home_techfacet_slug'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class AboutPage(StreamFieldSearchMixin, Page):
     """About page with career timeline and expertise"""
+    show_in_menus_default = True
 
     intro = RichTextField(blank=True)
     profile_statement = models.TextField(
@@ -249,12 +572,20 @@ class AboutPage(Page):
         FieldPanel('values'),
     ]
 
+    search_stream_fields = ('career_timeline', 'expertise_areas', 'values')
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
+        index.SearchField('profile_statement'),
+        index.SearchField('search_text'),
+    ]
+
     class Meta:
         verbose_name = "About Page"
 
 
-class ServicesPage(Page):
+class ServicesPage(StreamFieldSearchMixin, Page):
     """Services overview page"""
+    show_in_menus_default = True
 
     intro = RichTextField(blank=True)
 
@@ -272,12 +603,19 @@ class ServicesPage(Page):
         FieldPanel('services'),
     ]
 
+    search_stream_fields = ('services',)
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
+        index.SearchField('search_text'),
+    ]
+
     class Meta:
         verbose_name = "Services Page"
 
 
 class ContactPage(Page):
     """Contact page with form"""
+    show_in_menus_default = True
 
     intro = RichTextField(blank=True)
     email = models.EmailField(blank=True)
@@ -307,5 +645,9 @@ class ContactPage(Page):
         FieldPanel('social_links'),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField('intro'),
+    ]
+
     class Meta:
         verbose_name = "Contact Page"
@@ -0,0 +1,107 @@
+"""
+Cached navigation structures for the site templates
+
+Breadcrumbs are built from the materialized ``path`` of the current page, so
+the ancestor chain is known without a tree query, and stored in the page
+cache backend against the tree versions of those ancestors. Publishing an
+ancestor (e.g. a title change) or moving one replaces its tree version and
+the breadcrumbs below it are rebuilt on next use.
+
+The header menu is the site root's live ``show_in_menus`` children, stored
+as one object per site against the site root's tree version. Any change to a
+child of a site root replaces that version, which also invalidates every
+cached page of the site, since they all render the menu.
+"""
+from wagtail.models import Page, Site
+
+from . import page_cache
+
+
+def _request_memo(request, name):
+    memo = getattr(request, name, None)
+    if memo is None:
+        memo = {}
+        setattr(request, name, memo)
+    return memo
+
+
+def get_breadcrumbs(page, request):
+    """
+    Return the non-root ancestors of ``page``, root first, as a list of
+    ``{'title': ..., 'url': ...}`` dicts
+    """
+    memo = _request_memo(request, '_breadcrumbs')
+    if page.path in memo:
+        return memo[page.path]
+
+    paths = page_cache.ancestor_paths(page.path)[1:-1]
+    if not paths:
+        memo[page.path] = []
+        return []
+
+    cache = page_cache.get_cache()
+    key = f'breadcrumbs:{request.get_host()}:{page.path}'
+    entry = cache.get(key)
+    if entry is not None and page_cache.versions_match(entry['versions']):
+        memo[page.path] = entry['items']
+        return entry['items']
+
+    versions = page_cache.snapshot_versions(
+        [page_cache.tree_version_key(path) for path in page_cache.ancestor_paths(page.path)[:-1]]
+    )
+    items = [
+        {'title': ancestor.title, 'url': ancestor.get_url(request)}
+        for ancestor in Page.objects.filter(path__in=paths).order_by('path')
+    ]
+    cache.set(key, {'items': items, 'versions': versions}, page_cache.PAGE_CACHE_TIMEOUT)
+    memo[page.path] = items
+    return items
+
+
+def _site_root_url_paths():
+    return {root_path for _, root_path, _, _ in Site.get_site_root_paths()}
+
+
+def invalidate_menus(page, path=None):
+    """Invalidate the menu (and cached pages) of a site whose root is the page's parent"""
+    path = path or page.path
+    parent_url_path = page.url_path[:page.url_path.rstrip('/').rfind('/') + 1]
+    if len(path) > Page.steplen and parent_url_path in _site_root_url_paths():
+        page_cache.bump_versions([page_cache.tree_version_key(page_cache.parent_path(path))])
+
+
+def get_menu(request):
+    """
+    Return the menu for the request's site as a dict with the site root's
+    ``root_path`` and a list of ``{'title', 'url', 'path'}`` items
+    """
+    memo = _request_memo(request, '_navigation_menu')
+    if 'menu' in memo:
+        return memo['menu']
+
+    cache = page_cache.get_cache()
+    key = f'navmenu:{request.get_host()}'
+    entry = cache.get(key)
+    if entry is not None and page_cache.versions_match(entry['versions']):
+        memo['menu'] = entry['menu']
+        return entry['menu']
+
+    site = Site.find_for_request(request)
+    if site is None:
+        memo['menu'] = {'root_path': None, 'items': []}
+        return memo['menu']
+
+    root = site.root_page
+    versions = page_cache.snapshot_versions(
+        [page_cache.tree_version_key(path) for path in page_cache.ancestor_paths(root.path)]
+    )
+    menu = {
+        'root_path': root.path,
+        'items': [
+            {'title': child.title, 'url': child.get_url(request), 'path': child.path}
+            for child in root.get_children().live().in_menu().order_by('path')
+        ],
+    }
+    cache.set(key, {'menu': menu, 'versions': versions}, page_cache.PAGE_CACHE_TIMEOUT)
+    memo['menu'] = menu
+    return menu
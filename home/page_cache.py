@@ -0,0 +1,201 @@
+"""
+Versioned cache for rendered Wagtail pages
+
+Cached entries record the version tokens of the tree paths and referenced
+objects they depend on. Publishing, unpublishing, moving or deleting a page
+replaces the tokens for that page's subtree and its parent, and saving an
+image or snippet replaces its object token, so any entry rendered against the
+old tokens is treated as a miss. No entry is ever searched for or deleted.
+
+Pages served with these versions get an ETag derived from them, and a
+Last-Modified from the publish times of the pages they show, which survive a
+cache clear where the tokens do not, and from the object tokens: a token is
+the time it was created, so a changed image or snippet moves Last-Modified
+forward (as does recreating its token after a cache clear).
+"""
+import calendar
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Q
+from wagtail.models import Page, ReferenceIndex
+
+PAGE_CACHE_ALIAS = getattr(settings, 'PAGE_CACHE_ALIAS', 'default')
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+PAGE_CACHE_VARY_HEADERS = getattr(settings, 'PAGE_CACHE_VARY_HEADERS', ['Accept-Language'])
+
+# Wagtail's reference extraction, read from the object in memory; private API
+_extract_references = getattr(ReferenceIndex, '_extract_references_from_object', None)
+
+
+def get_cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def _new_token():
+    # Wall-clock nanoseconds, so object tokens double as modification times
+    return time.time_ns()
+
+
+def tree_version_key(path):
+    """Version shared by a page and every page below it"""
+    return f'pagecache:tree:{path}'
+
+
+def self_version_key(path):
+    """Version of a page on its own, e.g. an index listing its children"""
+    return f'pagecache:self:{path}'
+
+
+OBJECT_VERSION_PREFIX = 'pagecache:object:'
+
+
+def object_version_key(model, pk):
+    """Version of a single object, e.g. an image or snippet a page references"""
+    return f'{OBJECT_VERSION_PREFIX}{model._meta.label_lower}:{pk}'
+
+
+def search_version_key():
+    """Version of the search index as a whole, replaced whenever any page changes"""
+    return 'pagecache:search'
+
+
+def ancestor_paths(path):
+    """Materialized paths of a page and its ancestors, root first"""
+    steplen = Page.steplen
+    return [path[:i] for i in range(steplen, len(path) + 1, steplen)]
+
+
+def dependency_keys(path):
+    """Version keys a page rendered at ``path`` depends on"""
+    keys = [tree_version_key(p) for p in ancestor_paths(path)]
+    keys.append(self_version_key(path))
+    return keys
+
+
+def object_references(obj):
+    """
+    Set of ``(to_content_type_id, to_object_id, model_path, content_path)``
+    for each reference a saved object makes, as the reference index
+    records them
+    """
+    if _extract_references is not None:
+        return set(_extract_references(obj))
+    # Without the private API, have Wagtail index the object and read it back
+    with transaction.atomic():
+        ReferenceIndex.create_or_update_for_object(obj)
+    base_model = ([type(obj)] + obj._meta.get_parent_list())[-1]
+    return set(
+        ReferenceIndex.objects.filter(
+            base_content_type=ContentType.objects.get_for_model(base_model, for_concrete_model=False),
+            object_id=str(obj.pk),
+        ).values_list('to_content_type_id', 'to_object_id', 'model_path', 'content_path')
+    )
+
+
+def reference_version_keys(page):
+    """Object version keys for everything the page's reference index points at"""
+    references = ReferenceIndex.objects.filter(
+        base_content_type=ContentType.objects.get_for_model(Page),
+        object_id=str(page.pk),
+    ).values_list('to_content_type_id', 'to_object_id').distinct()
+    keys = set()
+    for content_type_id, object_id in references:
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is not None:
+            keys.add(object_version_key(model, object_id))
+    return sorted(keys)
+
+
+def page_dependency_keys(page):
+    return dependency_keys(page.path) + reference_version_keys(page)
+
+
+def snapshot_versions(keys):
+    """Return the current token for each key, creating any that are missing"""
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: _new_token() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def versions_match(snapshot):
+    if not snapshot:
+        return False
+    return get_cache().get_many(list(snapshot)) == snapshot
+
+
+async def aversions_match(snapshot):
+    if not snapshot:
+        return False
+    return await get_cache().aget_many(list(snapshot)) == snapshot
+
+
+def bump_versions(keys):
+    """Replace the tokens for ``keys``, invalidating everything that used them"""
+    keys = list(keys)
+    if keys:
+        get_cache().set_many({key: _new_token() for key in keys}, timeout=None)
+
+
+def parent_path(path):
+    return path[:-Page.steplen]
+
+
+def invalidate_page(page, path=None):
+    """Invalidate a page, its descendants and its parent's own rendering"""
+    path = path or page.path
+    keys = [tree_version_key(path)]
+    if len(path) > Page.steplen:
+        keys.append(self_version_key(parent_path(path)))
+    bump_versions(keys)
+
+
+def is_anonymous_request(request):
+    # Checked against the raw cookie so a cache hit never loads a session
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def last_published_at(page):
+    """
+    Latest publish time of a page and of the pages it shows: its ancestors
+    (breadcrumbs), its live children (listings) and its site root's menu
+    """
+    paths = ancestor_paths(page.path)
+    shown = Q(path__in=paths) | Q(path__startswith=page.path, depth=page.depth + 1, live=True)
+    if len(paths) > 1:
+        # Site roots sit directly below the tree root, so menu pages at depth 3
+        shown |= Q(path__startswith=paths[1], depth=3, live=True, show_in_menus=True)
+    return Page.objects.filter(shown).aggregate(latest=Max('last_published_at'))['latest']
+
+
+def page_validators(page, versions):
+    """
+    Return an ``(etag, last_modified)`` pair for a page rendered against
+    ``versions``, with ``last_modified`` as a Unix timestamp: the latest of
+    the pages' publish times and the times the objects' tokens were replaced
+    """
+    parts = [str(page.pk), str(page.live_revision_id)]
+    parts.extend(f'{key}={versions[key]}' for key in sorted(versions))
+    etag = '"%s"' % hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+    latest = last_published_at(page)
+    times = [calendar.timegm(latest.utctimetuple())] if latest else []
+    times.extend(token // 10**9 for key, token in versions.items() if key.startswith(OBJECT_VERSION_PREFIX))
+    return etag, max(times, default=None)
+
+
+def request_cache_key(request):
+    """Cache key for a request, keyed on site host, full path and vary headers"""
+    parts = [request.scheme, request.get_host(), request.get_full_path()]
+    for header in PAGE_CACHE_VARY_HEADERS:
+        parts.append(request.headers.get(header, ''))
+    digest = hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+    return f'pagecache:response:{digest}'
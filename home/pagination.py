@@ -0,0 +1,86 @@
+"""
+Keyset (cursor) pagination
+
+Pages are addressed by an opaque cursor encoding the sort key of the row at
+the page boundary, so fetching a deep page costs the same indexed range scan
+as fetching the first one. Rows are ordered newest first on
+``(first_published_at, id)``.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(direction, row):
+    raw = f'{direction}|{row.first_published_at.isoformat()}|{row.pk}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, first_published_at, pk)``, or ``None`` if invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        direction, published, pk = raw.split('|')
+        published = parse_datetime(published)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in ('next', 'prev') or published is None:
+        return None
+    return direction, published, pk
+
+
+class KeysetPage(list):
+    """One page of results with cursors for its neighbours"""
+
+    def __init__(self, rows, next_cursor=None, previous_cursor=None):
+        super().__init__(rows)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """Paginate a queryset newest first without OFFSET or COUNT queries"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset.exclude(first_published_at=None)
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return self._slice(self.queryset.order_by('-first_published_at', '-pk'), first=True)
+
+        direction, published, pk = decoded
+        if direction == 'next':
+            older = Q(first_published_at__lt=published) | Q(first_published_at=published, pk__lt=pk)
+            return self._slice(self.queryset.filter(older).order_by('-first_published_at', '-pk'))
+
+        newer = Q(first_published_at__gt=published) | Q(first_published_at=published, pk__gt=pk)
+        rows = list(self.queryset.filter(newer).order_by('first_published_at', 'pk')[:self.per_page + 1])
+        has_newer = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor('next', rows[-1]) if rows else None,
+            previous_cursor=encode_cursor('prev', rows[0]) if rows and has_newer else None,
+        )
+
+    def _slice(self, queryset, first=False):
+        # One extra row tells us whether an older page exists
+        rows = list(queryset[:self.per_page + 1])
+        has_older = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor('next', rows[-1]) if rows and has_older else None,
+            previous_cursor=encode_cursor('prev', rows[0]) if rows and not first else None,
+        )
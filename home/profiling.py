@@ -0,0 +1,200 @@
+"""
+Per-request SQL profiling
+
+``QueryProfile`` records every query run on any database connection while
+it is capturing, including in threads it hands work to, with its duration,
+its shape (the SQL with literals and ``IN`` lists folded, so the same query
+for different rows compares equal) and where it came from: the innermost
+frame of project code and, when it ran during template rendering, the
+template line. Shapes that repeat within one request are reported as N+1
+candidates.
+
+``QueryProfilingMiddleware`` is opt-in (``QUERY_PROFILING = True``, e.g. in
+``settings/local.py``): it adds an ``X-Query-Profile`` header and logs a
+summary line per request, plus the repeated shapes with their origins.
+``QueryBudgetMixin`` gives test cases per-page-type query budgets.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from benniewilliams.metrics import observe_queries
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+ProfiledQuery = namedtuple('ProfiledQuery', ['sql', 'shape', 'duration', 'origin'])
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+# Wrappers between the caller and the query, never its origin
+INSTRUMENTATION_MODULES = {__name__, 'benniewilliams.metrics'}
+
+
+def query_shape(sql):
+    """The SQL with literals and placeholders as ``?`` and ``IN`` lists folded"""
+    sql = _literals.sub('?', sql.replace('%s', '?'))
+    return ' '.join(_in_lists.sub('(...)', sql).split())
+
+
+def _is_project_frame(frame):
+    filename = os.path.abspath(frame.f_code.co_filename)
+    return (
+        filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in filename
+        and frame.f_globals.get('__name__') not in INSTRUMENTATION_MODULES
+    )
+
+
+def _origin():
+    """``file:line in function`` of the innermost project frame, and the template line if rendering"""
+    code_origin = template_origin = None
+    frame = sys._getframe(2)
+    while frame is not None and not (code_origin and template_origin):
+        code = frame.f_code
+        if template_origin is None and code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template_origin = f'{origin.template_name}:{token.lineno}'
+        elif code_origin is None and _is_project_frame(frame):
+            filename = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            code_origin = f'{filename}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return ' via '.join(part for part in (template_origin, code_origin) if part) or '<unknown>'
+
+
+class QueryProfile:
+    """The queries run on any connection while ``capture()`` is active"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries.append(ProfiledQuery(sql, query_shape(sql), duration, _origin()))
+
+    @contextmanager
+    def capture(self):
+        with observe_queries(self):
+            yield self
+
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def repeated_shapes(self, threshold=None):
+        """``(shape, queries)`` for each shape run at least ``threshold`` times, most repeated first"""
+        threshold = threshold or settings.QUERY_PROFILING_REPEAT_THRESHOLD
+        by_shape = {}
+        for query in self.queries:
+            by_shape.setdefault(query.shape, []).append(query)
+        repeated = [(shape, queries) for shape, queries in by_shape.items() if len(queries) >= threshold]
+        return sorted(repeated, key=lambda item: -len(item[1]))
+
+    def summary(self, threshold=None):
+        return '%s queries in %.1f ms, %s repeated shapes' % (
+            len(self.queries), self.duration * 1000, len(self.repeated_shapes(threshold)),
+        )
+
+    def report(self, threshold=None):
+        """Every query with its origin, then the repeated shapes"""
+        lines = [self.summary(threshold)]
+        lines.extend(
+            f'  {number}. [{query.duration * 1000:.2f} ms] {query.origin}: {query.sql}'
+            for number, query in enumerate(self.queries, 1)
+        )
+        for shape, queries in self.repeated_shapes(threshold):
+            origins = sorted({query.origin for query in queries})
+            lines.append(f'  Repeated {len(queries)}x from {", ".join(origins)}: {shape}')
+        return '\n'.join(lines)
+
+
+class QueryProfilingMiddleware:
+    """Profile the queries of every request when ``QUERY_PROFILING`` is on"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = QueryProfile()
+        with profile.capture():
+            response = self.get_response(request)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = QueryProfile()
+        with profile.capture():
+            response = await self.get_response(request)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        repeated = profile.repeated_shapes()
+        response['X-Query-Profile'] = 'queries=%s; time-ms=%.1f; repeated=%s' % (
+            len(profile.queries), profile.duration * 1000, len(repeated),
+        )
+        logger.info('%s %s: %s', request.method, request.get_full_path(), profile.summary())
+        for shape, queries in repeated:
+            origins = sorted({query.origin for query in queries})
+            logger.warning(
+                'Possible N+1 on %s: %s queries from %s: %s',
+                request.get_full_path(), len(queries), ', '.join(origins), shape,
+            )
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin for per-page-type query budgets
+
+    ``query_budgets`` maps a page type label (``'home.blogpage'``) to the
+    most queries serving one of those pages may run. Budgets apply to cold
+    renders: the page cache is cleared before each request unless
+    ``cold=False`` is passed.
+    """
+
+    query_budgets = {}
+
+    def assertWithinQueryBudget(self, path, cold=True, **extra):
+        if cold:
+            page_cache.get_cache().clear()
+        profile = QueryProfile()
+        with profile.capture():
+            response = self.client.get(path, **extra)
+        self.assertEqual(response.status_code, 200, path)
+
+        page_type = getattr(response.wsgi_request, 'metrics_page_type', None)
+        if page_type not in self.query_budgets:
+            self.fail(f'No query budget for {page_type or path}')
+        budget = self.query_budgets[page_type]
+        if len(profile.queries) > budget:
+            self.fail(f'{path} ({page_type}) is over its budget of {budget} queries: {profile.report()}')
+        return response, profile
+
+    def assertNoRepeatedQueries(self, profile, threshold=None):
+        repeated = profile.repeated_shapes(threshold)
+        if repeated:
+            self.fail(f'Repeated query shapes (possible N+1): {profile.report(threshold)}')
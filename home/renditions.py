@@ -0,0 +1,334 @@
+"""
+Background warm-up of image renditions
+
+The filter specs used by the templates (``RENDITION_WARMUP_FILTERS``) are
+generated for an image when it is uploaded or replaced, and for the images a
+page references when the page is published, so the first visitor does not
+pay for resizing. Web processes hand the work to a small spawned process
+pool once the surrounding transaction commits; ``warm_library`` does the same
+for the whole library from the ``warm_renditions`` command.
+
+``responsive_renditions`` backs the ``{% responsive_image %}`` tag: a base
+spec such as ``fill-1200x600`` is expanded to one spec per width in
+``RESPONSIVE_IMAGE_WIDTHS`` and per format (AVIF where Pillow can write it,
+WebP, then the original format). Existing renditions are looked up in one
+batch, and missing ones are queued for the pool rather than generated during
+the request.
+
+While a page is served, every image it references is fetched up front with
+all of its renditions (two queries) into a request-scoped store, which
+``StoredImageChooserBlock`` and the page's image foreign keys read from, so
+``{% image %}`` tags find their renditions without further queries.
+"""
+import functools
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import ForeignKey
+from wagtail import blocks
+from wagtail.fields import StreamField
+from wagtail.images import get_image_model
+from wagtail.images.blocks import ImageChooserBlock
+from wagtail.images.models import Filter, SourceImageIOError
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+_image_store = ContextVar('image_store', default=None)
+
+_resize_spec = re.compile(r'^(fill|max|min)-(\d+)x(\d+)(-c\d+)?$|^width-(\d+)$')
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+RESPONSIVE_SET_TIMEOUT = 60 * 60 * 24
+
+
+@functools.cache
+def avif_supported():
+    from PIL import Image as PILImage
+
+    PILImage.init()
+    return 'AVIF' in PILImage.SAVE
+
+
+def responsive_formats():
+    return [fmt for fmt in settings.RESPONSIVE_IMAGE_FORMATS if fmt != 'avif' or avif_supported()]
+
+
+def _width_specs(spec):
+    """The base spec resized to each configured width below its own, then itself"""
+    operation, _, rest = spec.partition('|')
+    match = _resize_spec.match(operation)
+    if not match:
+        return [spec]
+    suffix = '|' + rest if rest else ''
+    if match.group(5):
+        base_width = int(match.group(5))
+
+        def resized(width):
+            return f'width-{width}'
+    else:
+        method, base_width, height, crop = match.group(1), int(match.group(2)), int(match.group(3)), match.group(4) or ''
+
+        def resized(width):
+            return f'{method}-{width}x{round(height * width / base_width)}{crop}'
+    widths = [width for width in settings.RESPONSIVE_IMAGE_WIDTHS if width < base_width]
+    return [resized(width) + suffix for width in widths] + [spec]
+
+
+def responsive_filter_specs(spec):
+    """
+    Return ``[(format, [spec, ...]), ...]`` for a base spec, narrowest first;
+    the original format comes last with a format of ``None``
+    """
+    width_specs = _width_specs(spec)
+    variants = [(fmt, [f'{width_spec}|format-{fmt}' for width_spec in width_specs]) for fmt in responsive_formats()]
+    return variants + [(None, width_specs)]
+
+
+def warmup_filter_specs():
+    """Every spec generated ahead of time: the responsive sets of RENDITION_WARMUP_FILTERS"""
+    return [
+        variant_spec
+        for spec in settings.RENDITION_WARMUP_FILTERS
+        for _, variant_specs in responsive_filter_specs(spec)
+        for variant_spec in variant_specs
+    ]
+
+
+def warm_images(image_ids, filter_specs=None):
+    """
+    Generate any missing renditions of the given images, returning
+    ``(warmed, missing)`` counts; images whose source file is gone are missing
+    """
+    filter_specs = filter_specs or warmup_filter_specs()
+    filters = [Filter(spec=spec) for spec in filter_specs]
+    image_model = get_image_model()
+    warmed = missing = 0
+    generated = []
+    for image in image_model.objects.filter(pk__in=image_ids).prefetch_renditions(*filter_specs):
+        existing = len(image.find_existing_renditions(*filters))
+        try:
+            image.get_renditions(*filters)
+        except SourceImageIOError:
+            missing += 1
+        else:
+            warmed += 1
+            if existing < len(filters):
+                generated.append(image.pk)
+    # Pages and blocks rendered while a set was incomplete were cached with a
+    # reduced srcset; replacing the image's version re-renders them
+    page_cache.bump_versions(page_cache.object_version_key(image_model, pk) for pk in generated)
+    return warmed, missing
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Spawned rather than forked, so workers never share the web process's
+        # database connections or threads; they set Django up before importing
+        # this module
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RENDITION_WARMUP_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def _warmup_done(executor, image_ids, future):
+    global _executor
+    if future.cancelled() or future.exception() is None:
+        return
+    logger.error("Rendition warm-up failed for images %s", image_ids, exc_info=future.exception())
+    if isinstance(future.exception(), BrokenProcessPool) and _executor is executor:
+        # Start a fresh pool for the next warm-up
+        _executor = None
+
+
+def _submit(image_ids, filter_specs=None):
+    global _executor
+    if not settings.RENDITION_WARMUP_WORKERS:
+        warm_images(image_ids, filter_specs)
+        return
+    executor = _get_executor()
+    try:
+        future = executor.submit(warm_images, image_ids, filter_specs)
+    except BrokenProcessPool:
+        # Renditions are still generated on first view; start a fresh pool next time
+        logger.warning("Rendition warm-up pool is broken, skipping images %s", image_ids)
+        _executor = None
+        return
+    future.add_done_callback(functools.partial(_warmup_done, executor, image_ids))
+
+
+def schedule_warmup(image_ids, filter_specs=None):
+    """Warm renditions of the given images in the background after commit"""
+    image_ids = sorted(set(image_ids))
+    if image_ids:
+        transaction.on_commit(lambda: _submit(image_ids, filter_specs))
+
+
+def responsive_renditions(image, spec):
+    """
+    Return ``[(format, [{'url', 'width', 'height'}, ...]), ...]`` as
+    ``responsive_filter_specs`` does, for the renditions that exist so far.
+
+    The full size rendition in the original format is always present; other
+    missing renditions are queued for warm-up (at most once every few minutes
+    per image and spec). A complete set is cached as one entry, keyed on the
+    image file and focal point, so later lookups are a single cache read.
+    """
+    base_filter = Filter(spec=spec)
+    key = f'renditions:set:{image.pk}:{image.file_hash}:{base_filter.get_cache_key(image)}:{spec}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    variants = responsive_filter_specs(spec)
+    filters = {variant_spec: Filter(spec=variant_spec) for _, specs in variants for variant_spec in specs}
+    found = image.find_existing_renditions(*filters.values())
+    if filters[spec] not in found:
+        found[filters[spec]] = image.get_rendition(filters[spec])
+
+    renditions = [
+        (fmt, [
+            {'url': rendition.url, 'width': rendition.width, 'height': rendition.height}
+            for rendition in (found.get(filters[variant_spec]) for variant_spec in specs)
+            if rendition is not None
+        ])
+        for fmt, specs in variants
+    ]
+    missing = [variant_spec for variant_spec, filter in filters.items() if filter not in found]
+    if not missing:
+        cache.set(key, renditions, RESPONSIVE_SET_TIMEOUT)
+    elif cache.add(f'renditions:queued:{image.pk}:{image.file_hash}:{spec}', True, 300):
+        schedule_warmup([image.pk], missing)
+    return renditions
+
+
+def page_image_ids(page):
+    """Ids of the images referenced by a page's fields and StreamFields"""
+    image_type_id = ContentType.objects.get_for_model(get_image_model()).pk
+    return {
+        int(object_id)
+        for content_type_id, object_id, _, _ in page_cache.object_references(page)
+        if content_type_id == image_type_id
+    }
+
+
+def warm_library(workers=None, filter_specs=None, chunk_size=50, log=None):
+    """Warm renditions of every image, returning ``(warmed, missing)`` counts"""
+    image_ids = list(get_image_model().objects.order_by('pk').values_list('pk', flat=True))
+    chunks = [image_ids[i:i + chunk_size] for i in range(0, len(image_ids), chunk_size)]
+
+    if workers == 1:
+        results = (warm_images(chunk, filter_specs) for chunk in chunks)
+    else:
+        # Worker processes open their own database connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(warm_images, chunks, [filter_specs] * len(chunks))
+
+    warmed = missing = 0
+    for chunk, (chunk_warmed, chunk_missing) in zip(chunks, results):
+        warmed += chunk_warmed
+        missing += chunk_missing
+        if log:
+            log(f'images {chunk[0]}-{chunk[-1]}: warmed {chunk_warmed}, missing {chunk_missing}')
+    if workers != 1:
+        executor.shutdown()
+    return warmed, missing
+
+
+def _raw_image_ids(block, value):
+    """Image ids in a block's raw (JSON) value, found without converting it"""
+    if value is None:
+        return
+    if isinstance(block, ImageChooserBlock):
+        yield value
+    elif isinstance(block, blocks.StructBlock):
+        for name, child_block in block.child_blocks.items():
+            yield from _raw_image_ids(child_block, value.get(name))
+    elif isinstance(block, blocks.ListBlock):
+        for item in value:
+            if isinstance(item, dict) and item.get('type') == 'item' and 'value' in item:
+                item = item['value']
+            yield from _raw_image_ids(block.child_block, item)
+    elif isinstance(block, blocks.StreamBlock):
+        for item in value:
+            child_block = block.child_blocks.get(item['type'])
+            if child_block is not None:
+                yield from _raw_image_ids(child_block, item['value'])
+
+
+def _image_fields(page):
+    image_model = get_image_model()
+    for field in page._meta.concrete_fields:
+        if isinstance(field, StreamField) or (
+            isinstance(field, ForeignKey) and issubclass(field.related_model, image_model)
+        ):
+            yield field
+
+
+def load_page_images(page):
+    """
+    Return ``{pk: image}`` for every image in the page's StreamFields and
+    image foreign keys, with all renditions prefetched
+    """
+    image_ids = set()
+    for field in _image_fields(page):
+        if isinstance(field, StreamField):
+            raw_data = getattr(page, field.attname).raw_data
+            image_ids.update(_raw_image_ids(field.stream_block, list(raw_data)))
+        elif getattr(page, field.attname) is not None:
+            image_ids.add(getattr(page, field.attname))
+    if not image_ids:
+        return {}
+    return get_image_model().objects.prefetch_renditions().in_bulk(image_ids)
+
+
+def activate_image_store(page):
+    """
+    Load the page's images into the store and attach them to its foreign
+    keys, returning the token to pass to ``deactivate_image_store``
+    """
+    store = load_page_images(page)
+    for field in _image_fields(page):
+        if isinstance(field, ForeignKey) and getattr(page, field.attname) in store:
+            field.set_cached_value(page, store[getattr(page, field.attname)])
+    return _image_store.set(store)
+
+
+def deactivate_image_store(token):
+    _image_store.reset(token)
+
+
+class StoredImageChooserBlock(ImageChooserBlock):
+    """An image chooser that reads images from the page's store when one is active"""
+
+    def to_python(self, value):
+        store = _image_store.get()
+        if store and value in store:
+            return store[value]
+        return super().to_python(value)
+
+    def bulk_to_python(self, values):
+        store = _image_store.get()
+        if not store:
+            return super().bulk_to_python(values)
+        missing = [value for value in values if value is not None and value not in store]
+        fetched = dict(zip(missing, super().bulk_to_python(missing))) if missing else {}
+        return [None if value is None else store.get(value, fetched.get(value)) for value in values]
@@ -0,0 +1,89 @@
+"""
+Signal receivers that keep the page and block caches and the technology
+facets in step with content, and warm image renditions ahead of the first view
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.images import get_image_model
+from wagtail.models import Page, Site
+from wagtail.signals import page_published, page_unpublished, post_page_move, pre_page_move
+from wagtail.snippets.models import get_snippet_models
+
+from . import facets, navigation, page_cache, renditions
+
+
+def _invalidate_page(page):
+    page_cache.invalidate_page(page)
+    navigation.invalidate_menus(page)
+    page_cache.bump_versions([page_cache.object_version_key(Page, page.pk), page_cache.search_version_key()])
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_page_cache_on_publish(sender, instance, **kwargs):
+    _invalidate_page(instance)
+
+
+@receiver(page_published)
+def warm_renditions_on_publish(sender, instance, **kwargs):
+    renditions.schedule_warmup(renditions.page_image_ids(instance))
+
+
+@receiver(page_published)
+def update_facets_on_publish(sender, instance, **kwargs):
+    facets.update_page(instance)
+
+
+@receiver(page_unpublished)
+def remove_facets_on_unpublish(sender, instance, **kwargs):
+    facets.remove_page(instance)
+
+
+@receiver(pre_page_move)
+@receiver(post_page_move)
+def invalidate_page_cache_on_move(sender, instance, **kwargs):
+    # Sent with the old tree path before the move and the new one after it
+    _invalidate_page(instance)
+
+
+@receiver(post_delete)
+def invalidate_page_cache_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        _invalidate_page(instance)
+        # The page's facet rows went with it
+        page_cache.bump_versions([facets.FACETS_VERSION_KEY])
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_caches_for_site(sender, instance, **kwargs):
+    # Hostnames and root pages decide every URL and menu, so start afresh
+    page_cache.bump_versions([page_cache.tree_version_key(Page.get_first_root_node().path)])
+
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+def invalidate_caches_for_image(sender, instance, **kwargs):
+    page_cache.bump_versions([page_cache.object_version_key(sender, instance.pk)])
+
+
+@receiver(post_save, sender=get_image_model())
+def warm_renditions_on_save(sender, instance, raw=False, **kwargs):
+    # Covers uploads, replaced files and focal point changes
+    if not raw:
+        renditions.schedule_warmup([instance.pk])
+
+
+def invalidate_caches_for_snippet(sender, instance, **kwargs):
+    page_cache.bump_versions([page_cache.object_version_key(sender, instance.pk)])
+
+
+def connect_snippet_receivers():
+    """
+    Connect ``invalidate_caches_for_snippet`` to each registered snippet model;
+    called from ``home.snippet_receivers`` once every app is ready
+    """
+    for model in get_snippet_models():
+        uid = f'invalidate_caches_for_snippet:{model._meta.label_lower}'
+        post_save.connect(invalidate_caches_for_snippet, sender=model, dispatch_uid=uid)
+        post_delete.connect(invalidate_caches_for_snippet, sender=model, dispatch_uid=uid)
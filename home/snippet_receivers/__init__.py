@@ -0,0 +1,8 @@
+"""
+Page cache receivers for snippet models
+
+Snippets are registered in ``wagtail.snippets``' ready() and in
+``wagtail_hooks`` modules, both after ``home``'s ready(), so this app is
+listed last in ``INSTALLED_APPS`` and connects ``invalidate_caches_for_snippet``
+to each snippet model once every other app is ready.
+"""
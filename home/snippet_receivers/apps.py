@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class SnippetReceiversConfig(AppConfig):
+    name = "home.snippet_receivers"
+    label = "home_snippet_receivers"
+
+    def ready(self):
+        from home.signals import connect_snippet_receivers
+
+        connect_snippet_receivers()
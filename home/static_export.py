@@ -0,0 +1,246 @@
+"""
+Static export of the live page tree
+
+Each live page is rendered through the WSGI stack, minus the middleware that
+answers from the page cache or an earlier export, and written to
+``<output>/<hostname>/<url>/index.html``, and each query string a page lists
+in ``get_static_export_variants`` (further pages, tag listings) beside it as
+``index.<query>.html``; ``StaticExportMiddleware`` maps such requests back
+to those files. A manifest next to the exported files records a fingerprint
+per URL built from the page's live revision, its ancestors, its live
+children, the images it references and the site's menu pages, so later runs
+only re-render pages whose content or dependencies changed.
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.test import Client, override_settings
+from wagtail.images import get_image_model
+from wagtail.models import Page, ReferenceIndex, get_page_models
+
+MANIFEST_NAME = '.export-manifest.json'
+
+
+def site_output_dir(output_dir, site):
+    return os.path.join(output_dir, site.hostname)
+
+
+def index_filename(query=None):
+    """Name of the file a page, or one of its query variants, is exported to"""
+    return f'index.{urlencode(sorted(query.items()))}.html' if query else 'index.html'
+
+
+def output_path(site_dir, url, query=None):
+    """File an exported URL is written to, with query variants beside the index"""
+    directory = os.path.join(site_dir, *[part for part in url.split('/') if part])
+    return os.path.join(directory, index_filename(query))
+
+
+def _image_fingerprints(page_ids):
+    """Map page id to the identities of the images it references"""
+    page_type = ContentType.objects.get_for_model(Page)
+    image_model = get_image_model()
+    references = ReferenceIndex.objects.filter(
+        base_content_type=page_type,
+        to_content_type=ContentType.objects.get_for_model(image_model),
+    ).values_list('object_id', 'to_object_id')
+
+    images_by_page = defaultdict(set)
+    for object_id, image_id in references:
+        if int(object_id) in page_ids:
+            images_by_page[int(object_id)].add(int(image_id))
+
+    image_ids = set().union(*images_by_page.values()) if images_by_page else set()
+    images = {
+        pk: f'{pk}:{file_hash}:{x}:{y}:{width}:{height}'
+        for pk, file_hash, x, y, width, height in image_model.objects.filter(pk__in=image_ids).values_list(
+            'pk', 'file_hash', 'focal_point_x', 'focal_point_y', 'focal_point_width', 'focal_point_height'
+        )
+    }
+    return {
+        page_id: sorted(images.get(image_id, str(image_id)) for image_id in image_ids)
+        for page_id, image_ids in images_by_page.items()
+    }
+
+
+def page_fingerprints(site):
+    """
+    Return ``{url: (page_id, fingerprint)}`` for every live page in a site;
+    every page shows the site's menu, so all fingerprints cover the site
+    root's live children in order
+    """
+    root = site.root_page
+    rows = list(
+        Page.objects.live()
+        .filter(path__startswith=root.path)
+        .values_list('pk', 'path', 'url_path', 'live_revision_id', 'last_published_at', 'title', 'show_in_menus')
+        .order_by('path')
+    )
+    by_path = {row[1]: row for row in rows}
+    children = defaultdict(list)
+    for row in rows:
+        children[row[1][:-Page.steplen]].append((row[0], row[3]))
+    menu = [
+        (pk, live_revision_id, title, show_in_menus)
+        for pk, path, _, live_revision_id, _, title, show_in_menus in rows
+        if len(path) == len(root.path) + Page.steplen
+    ]
+    images = _image_fingerprints({row[0] for row in rows})
+
+    root_prefix = len(root.url_path) - 1
+    fingerprints = {}
+    for pk, path, url_path, live_revision_id, last_published_at, _, _ in rows:
+        ancestors = [
+            by_path[path[:i]][3]
+            for i in range(len(root.path), len(path), Page.steplen)
+            if path[:i] in by_path
+        ]
+        parts = [
+            pk,
+            live_revision_id,
+            last_published_at,
+            ancestors,
+            sorted(children.get(path, [])),
+            images.get(pk, []),
+            menu,
+        ]
+        digest = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+        fingerprints[url_path[root_prefix:]] = (pk, digest)
+    return fingerprints
+
+
+def load_manifest(site_dir):
+    try:
+        with open(os.path.join(site_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(site_dir, manifest):
+    path = os.path.join(site_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Middleware that would answer with a cached or previously exported page
+# instead of rendering it
+SERVING_MIDDLEWARE = ('home.middleware.PageCacheMiddleware', 'home.middleware.StaticExportMiddleware')
+
+
+def export_client():
+    """A test client whose handler runs ``MIDDLEWARE`` without ``SERVING_MIDDLEWARE``"""
+    client = Client(raise_request_exception=False)
+    middleware = [name for name in settings.MIDDLEWARE if name not in SERVING_MIDDLEWARE]
+    with override_settings(MIDDLEWARE=middleware):
+        client.handler.load_middleware()
+    return client
+
+
+def render_url(job):
+    """
+    Render one URL through the WSGI stack and write it to disk
+
+    Runs in a worker process. Responses that are not a plain 200, or that set
+    cookies (e.g. a CSRF token for a form), are left to Django and removed
+    from the export.
+    """
+    hostname, port, url, query, path = job
+    host = hostname if port in (80, 443) else f'{hostname}:{port}'
+    response = export_client().get(url, query or {}, secure=port == 443, HTTP_HOST=host, SERVER_PORT=str(port))
+    if response.status_code != 200 or response.cookies or response.streaming:
+        _remove_file(path)
+        return url, query, False
+    _write_file(path, response.content)
+    return url, query, True
+
+
+def _variant_queries(page_ids):
+    """Map page id to its ``get_static_export_variants``, loading only the page types that have them"""
+    content_types = ContentType.objects.get_for_models(
+        *[model for model in get_page_models() if hasattr(model, 'get_static_export_variants')]
+    ).values()
+    pages = Page.objects.filter(pk__in=page_ids, content_type__in=content_types).specific()
+    return {page.pk: list(page.get_static_export_variants()) for page in pages}
+
+
+def export_site(site, output_dir, workers=None, force=False, log=None):
+    """
+    Export a site's live pages, returning ``(rendered, dynamic, removed)``
+    file counts; ``dynamic`` counts the URLs left to Django because they did
+    not render as a plain, cookie-free 200 (unchanged pages are not counted)
+    """
+    site_dir = site_output_dir(output_dir, site)
+    os.makedirs(site_dir, exist_ok=True)
+    previous = load_manifest(site_dir)
+    current = page_fingerprints(site)
+
+    changed = {}
+    manifest = {}
+    for url, (page_id, fingerprint) in current.items():
+        entry = previous.get(url)
+        if not force and entry and entry['fingerprint'] == fingerprint:
+            manifest[url] = entry
+            continue
+        changed[url] = page_id
+        manifest[url] = {'fingerprint': fingerprint, 'files': []}
+
+    variants = _variant_queries(changed.values())
+    jobs = [
+        (site.hostname, site.port, url, query, output_path(site_dir, url, query))
+        for url, page_id in changed.items()
+        for query in [None, *variants.get(page_id, [])]
+    ]
+
+    if workers == 1:
+        results = map(render_url, jobs)
+    else:
+        # Worker processes open their own database connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(render_url, jobs, chunksize=8)
+
+    rendered = dynamic = 0
+    for job, (url, query, written) in zip(jobs, results):
+        if written:
+            manifest[url]['files'].append(os.path.relpath(job[4], site_dir))
+            rendered += 1
+        else:
+            dynamic += 1
+        if log:
+            log(f"{'exported' if written else 'dynamic '} {url}{'?' + urlencode(query) if query else ''}")
+    if workers != 1:
+        executor.shutdown()
+
+    # Remove pages that are no longer live, and query variants that went away
+    removed = 0
+    for url, entry in previous.items():
+        kept = set(manifest[url]['files']) if url in manifest else set()
+        for path in set(entry['files']) - kept:
+            _remove_file(os.path.join(site_dir, path))
+            removed += 1
+
+    save_manifest(site_dir, manifest)
+    return rendered, dynamic, removed
@@ -0,0 +1,45 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from home.renditions import MIME_TYPES, responsive_renditions
+
+register = template.Library()
+
+
+def _srcset(renditions):
+    return ', '.join(f"{rendition['url']} {rendition['width']}w" for rendition in renditions)
+
+
+@register.simple_tag
+def responsive_image(image, spec, sizes='100vw', **attrs):
+    """
+    Render ``image`` as a ``<picture>`` with AVIF / WebP sources and an
+    ``<img>`` fallback, each with a ``srcset`` over the widths of ``spec``;
+    extra keyword arguments become attributes of the ``<img>``
+    """
+    if not image:
+        return ''
+    attrs.setdefault('alt', image.default_alt_text)
+    if image.is_svg():
+        return image.get_rendition(spec).img_tag(attrs)
+
+    *sources, (_, fallback) = responsive_renditions(image, spec)
+    largest = fallback[-1]
+    img_attrs = {
+        'src': largest['url'],
+        'srcset': _srcset(fallback),
+        'sizes': sizes,
+        'width': largest['width'],
+        'height': largest['height'],
+        **attrs,
+    }
+    return format_html(
+        '<picture>{}<img{}></picture>',
+        format_html_join(
+            '',
+            '<source type="{}" srcset="{}" sizes="{}">',
+            ((MIME_TYPES[fmt], _srcset(renditions), sizes) for fmt, renditions in sources if renditions),
+        ),
+        flatatt(img_attrs),
+    )
@@ -0,0 +1,32 @@
+from django import template
+
+from home.navigation import get_breadcrumbs, get_menu
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def page_breadcrumbs(context, page):
+    """Cached ancestors of ``page`` (excluding the tree root) for the breadcrumb trail"""
+    request = context.get('request')
+    if not page or request is None or not getattr(page, 'path', None):
+        return []
+    return get_breadcrumbs(page, request)
+
+
+@register.simple_tag(takes_context=True)
+def navigation_menu(context, page=None):
+    """
+    The site's menu with ``active`` flags for the current page; an item is
+    active for its own page and every page below it
+    """
+    request = context.get('request')
+    if request is None:
+        return {'home_active': False, 'items': []}
+
+    menu = get_menu(request)
+    path = getattr(page, 'path', None) or ''
+    return {
+        'home_active': bool(path) and path == menu['root_path'],
+        'items': [dict(item, active=path.startswith(item['path'])) for item in menu['items']],
+    }
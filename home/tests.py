@@ -1,7 +1,51 @@
+import datetime
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.template.response import SimpleTemplateResponse
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from home.models import HomePage
+from django.utils.text import slugify
+from benniewilliams import health_check, metrics
+from home import benchmark, facets, page_cache, renditions
+from home.bulk_load import BulkPageLoader
+from home.content_transfer import PageImporter, export_pages
+from home.models import (
+    BlogIndexPage, BlogPage, BlogPageTag, HomePage, PortfolioItemBlock, ProjectIndexPage, ProjectPage,
+    TechnologyFacet,
+)
+from home.middleware import StaticExportMiddleware
+from home.navigation import get_breadcrumbs, get_menu
+from home.profiling import QueryBudgetMixin, QueryProfile, query_shape
+from home.renditions import _image_store, avif_supported, responsive_filter_specs
+from home.static_export import export_site
+from search import autocomplete, hits
+from search.results import normalize_query
 
-from wagtail.models import Page
+from wagtail.contrib.search_promotions.models import Query, QueryDailyHits, SearchPromotion
+from wagtail.images.models import Image
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Page, ReferenceIndex, Site
 from wagtail.test.utils import WagtailPageTestCase
 
 
@@ -41,3 +85,1682 @@ class HomeTests(WagtailPageTestCase):
     def test_homepage_template_used(self):
         response = self.client.get(reverse("home"))
         self.assertTemplateUsed(response, "home/home_page.html")
+
+
+class PageCacheTests(WagtailPageTestCase):
+    """
+    Tests for the anonymous full-page cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page.specific
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.homepage.add_child(instance=self.blog_index)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get("/blog/")
+        self.assertEqual(first["X-Page-Cache"], "miss")
+        with self.assertNumQueries(0):
+            second = self.client.get("/blog/")
+        self.assertEqual(second["X-Page-Cache"], "hit")
+        self.assertEqual(first.content, second.content)
+
+    def test_publish_invalidates_page_and_parent(self):
+        self.client.get("/")
+        self.client.get("/blog/")
+        self.blog_index.title = "Insights"
+        self.blog_index.save_revision().publish()
+
+        response = self.client.get("/blog/")
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        self.assertContains(response, "Insights")
+        self.assertEqual(self.client.get("/")["X-Page-Cache"], "miss")
+
+    def test_unpublish_invalidates_page(self):
+        self.client.get("/blog/")
+        self.blog_index.unpublish()
+        self.assertEqual(self.client.get("/blog/").status_code, 404)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.get("/blog/")
+        self.login()
+        response = self.client.get("/blog/")
+        self.assertNotIn("X-Page-Cache", response)
+
+
+class BlockCacheTests(TestCase):
+    """
+    Tests for the StreamField block render cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.block = PortfolioItemBlock()
+        self.image = Image.objects.create(title="Screenshot", file=get_test_image_file())
+        self.value = self.block.to_python({
+            "title": "Portfolio",
+            "description": "<p>Case study</p>",
+            "image": self.image.pk,
+            "technologies": ["Python", "Wagtail"],
+        })
+
+    def test_unchanged_value_renders_from_cache(self):
+        first = self.block.render(self.value)
+        with self.assertTemplateNotUsed("blocks/portfolio_item.html"):
+            second = self.block.render(self.value)
+        self.assertEqual(first, second)
+
+    def test_changed_value_is_rendered(self):
+        self.block.render(self.value)
+        self.value["title"] = "Renamed"
+        with self.assertTemplateUsed("blocks/portfolio_item.html"):
+            html = self.block.render(self.value)
+        self.assertIn("Renamed", html)
+
+    def test_saving_referenced_image_invalidates_fragment(self):
+        self.block.render(self.value)
+        self.image.title = "Updated screenshot"
+        self.image.save()
+        with self.assertTemplateUsed("blocks/portfolio_item.html"):
+            self.block.render(self.value)
+
+    def test_fragments_are_cached_per_page(self):
+        homepage = Site.objects.get(is_default_site=True).root_page
+        blog_index = homepage.add_child(instance=BlogIndexPage(title="Blog", slug="blog"))
+        self.block.render(self.value, context={"page": homepage})
+        with self.assertTemplateNotUsed("blocks/portfolio_item.html"):
+            self.block.render(self.value, context={"page": homepage})
+        with self.assertTemplateUsed("blocks/portfolio_item.html"):
+            self.block.render(self.value, context={"page": blog_index})
+
+
+class StaticExportTests(WagtailPageTestCase):
+    """
+    Tests for the incremental static page export.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        self.site = Site.objects.get(is_default_site=True)
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.site.root_page.add_child(instance=self.blog_index)
+
+    def export(self):
+        return export_site(self.site, self.output, workers=1)
+
+    def test_export_writes_index_files(self):
+        rendered, skipped, removed = self.export()
+        self.assertEqual((rendered, skipped, removed), (2, 0, 0))
+        with open(os.path.join(self.output, "localhost", "blog", "index.html")) as f:
+            self.assertIn("Blog", f.read())
+
+    def test_unchanged_pages_are_not_rerendered(self):
+        self.export()
+        self.assertEqual(self.export(), (0, 0, 0))
+
+    def test_publish_rerenders_page_and_parent(self):
+        self.export()
+        self.blog_index.save_revision().publish()
+        self.assertEqual(self.export(), (2, 0, 0))
+
+    def test_unpublished_page_is_removed(self):
+        self.export()
+        self.blog_index.unpublish()
+        self.assertEqual(self.export(), (1, 0, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.output, "localhost", "blog", "index.html")))
+
+    def test_menu_changes_rerender_deep_pages(self):
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[])
+        self.blog_index.add_child(instance=post)
+        self.export()
+        self.blog_index.show_in_menus = True
+        self.blog_index.save_revision().publish()
+        self.export()
+        with open(os.path.join(self.output, "localhost", "blog", "post", "index.html")) as f:
+            self.assertIn('href="/blog/"', f.read())
+
+        about = self.site.root_page.add_child(instance=BlogIndexPage(title="About", slug="about", show_in_menus=True))
+        about.save_revision().publish()
+        self.export()
+        with open(os.path.join(self.output, "localhost", "blog", "post", "index.html")) as f:
+            self.assertIn('href="/about/"', f.read())
+        about.unpublish()
+        rendered, _, _ = self.export()
+        self.assertEqual(rendered, 3)
+
+    def test_export_skips_the_serving_middleware(self):
+        site_dir = os.path.join(self.output, "localhost")
+        middleware = ["home.middleware.StaticExportMiddleware", *settings.MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware, STATIC_EXPORT_SERVE_DIR=site_dir):
+            self.assertEqual(self.export(), (2, 0, 0))
+            self.blog_index.title = "Writing on platform engineering"
+            self.blog_index.save_revision().publish()
+            self.assertEqual(self.export(), (2, 0, 0))
+            self.assertEqual(self.export(), (0, 0, 0))
+        with open(os.path.join(site_dir, "blog", "index.html")) as f:
+            self.assertIn("Writing on platform engineering", f.read())
+
+    def serve(self, middleware, path):
+        response = middleware(RequestFactory().get(path))
+        if not response.streaming:
+            return response.content.decode()
+        content = b"".join(response.streaming_content)
+        response.close()
+        self.assertEqual(len(content), int(response["Content-Length"]))
+        return content.decode()
+
+    def test_middleware_serves_later_exports_and_query_variants(self):
+        with override_settings(STATIC_EXPORT_SERVE_DIR=os.path.join(self.output, "localhost")):
+            middleware = StaticExportMiddleware(lambda request: HttpResponse("from Django"))
+        self.assertEqual(self.serve(middleware, "/blog/"), "from Django")
+
+        self.blog_index.posts_per_page = 1
+        self.blog_index.save_revision().publish()
+        for number in range(2):
+            post = BlogPage(title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro="Intro", body=[])
+            self.blog_index.add_child(instance=post)
+        self.export()
+        self.assertIn("Post 1", self.serve(middleware, "/blog/"))
+        self.assertIn("Post 0", self.serve(middleware, "/blog/?page=2"))
+        self.assertEqual(self.serve(middleware, "/blog/?page=2&utm_source=feed"), "from Django")
+
+        # Re-exported and removed files are picked up without a restart
+        self.blog_index.title = "Writing on platform engineering"
+        self.blog_index.save_revision().publish()
+        self.export()
+        self.assertIn("Writing on platform engineering", self.serve(middleware, "/blog/"))
+        BlogPage.objects.get(slug="post-0").unpublish()
+        self.export()
+        self.assertEqual(self.serve(middleware, "/blog/?page=2"), "from Django")
+
+
+class ConditionalGetTests(WagtailPageTestCase):
+    """
+    Tests for ETag / Last-Modified handling on page responses.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page.specific
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.homepage.add_child(instance=self.blog_index)
+        self.blog_index.save_revision().publish()
+
+    def test_page_response_has_validators(self):
+        response = self.client.get("/blog/")
+        self.assertTrue(response.has_header("ETag"))
+        self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_matching_etag_returns_not_modified_without_rendering(self):
+        etag = self.client.get("/blog/")["ETag"]
+        with self.assertTemplateNotUsed("home/blog_index_page.html"):
+            response = self.client.get("/blog/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_matching_etag_skips_rendering_on_page_cache_miss(self):
+        etag = self.client.get("/blog/")["ETag"]
+        with self.assertTemplateNotUsed("home/blog_index_page.html"):
+            response = self.client.get("/blog/?utm_source=feed", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_returns_not_modified(self):
+        last_modified = self.client.get("/blog/")["Last-Modified"]
+        response = self.client.get("/blog/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_publishing_a_child_changes_etag(self):
+        etag = self.client.get("/blog/")["ETag"]
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[])
+        self.blog_index.add_child(instance=post)
+        post.save_revision().publish()
+        response = self.client.get("/blog/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_last_modified_survives_a_cache_clear(self):
+        last_modified = self.client.get("/blog/")["Last-Modified"]
+        cache.clear()
+        # Tokens recreated after the clear are from a later clock
+        with mock.patch.object(page_cache, "_new_token", return_value=time.time_ns() + 10 * 10**9):
+            response = self.client.get("/blog/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["Last-Modified"], last_modified)
+
+    def test_changing_a_referenced_image_moves_last_modified(self):
+        image = Image.objects.create(title="Featured", file=get_test_image_file())
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[], featured_image=image)
+        self.blog_index.add_child(instance=post)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save_revision().publish()
+        last_modified = self.client.get("/blog/post/")["Last-Modified"]
+
+        with mock.patch.object(page_cache, "_new_token", return_value=time.time_ns() + 10 * 10**9):
+            image.title = "Replaced"
+            image.save()
+        response = self.client.get("/blog/post/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["Last-Modified"], last_modified)
+
+    def test_saving_a_snippet_model_replaces_its_version(self):
+        app_labels = [app_config.label for app_config in apps.get_app_configs()]
+        self.assertGreater(app_labels.index("home_snippet_receivers"), app_labels.index("wagtailsnippets"))
+        with mock.patch("home.signals.get_snippet_models", return_value=[Query]):
+            apps.get_app_config("home_snippet_receivers").ready()
+        for signal in (post_save, post_delete):
+            self.addCleanup(signal.disconnect, dispatch_uid="invalidate_caches_for_snippet:wagtailsearchpromotions.query")
+        query = Query.get("kubernetes")
+        key = page_cache.object_version_key(Query, query.pk)
+        versions = page_cache.snapshot_versions([key])
+        query.save()
+        self.assertFalse(page_cache.versions_match(versions))
+
+
+class BlogIndexPaginationTests(WagtailPageTestCase):
+    """
+    Tests for numbered and keyset pagination of the blog index.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog", posts_per_page=2)
+        homepage.add_child(instance=self.blog_index)
+        published = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        # Posts 2 and 3 share a timestamp so the id tie-breaker is exercised
+        for number, days in enumerate([0, 1, 2, 2, 3]):
+            post = BlogPage(title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro="Intro", body=[])
+            self.blog_index.add_child(instance=post)
+            Page.objects.filter(pk=post.pk).update(first_published_at=published + datetime.timedelta(days=days))
+
+    def titles(self, response):
+        return [post.title for post in response.context["blog_posts"]]
+
+    def test_numbered_pages(self):
+        response = self.client.get("/blog/?page=2")
+        self.assertEqual(self.titles(response), ["Post 2", "Post 1"])
+        self.assertEqual(response.context["previous_query"], "page=1")
+        self.assertEqual(response.context["next_query"], "page=3")
+
+    def test_cursor_pages_walk_forwards_and_back(self):
+        self.blog_index.pagination = "cursor"
+        self.blog_index.save()
+
+        seen = []
+        query = ""
+        while True:
+            response = self.client.get(f"/blog/?{query}")
+            seen.extend(self.titles(response))
+            if not response.context["next_query"]:
+                break
+            query = response.context["next_query"]
+        self.assertEqual(seen, ["Post 4", "Post 3", "Post 2", "Post 1", "Post 0"])
+
+        response = self.client.get(f"/blog/?{response.context['previous_query']}")
+        self.assertEqual(self.titles(response), ["Post 2", "Post 1"])
+
+    def test_invalid_cursor_shows_first_page(self):
+        self.blog_index.pagination = "cursor"
+        self.blog_index.save()
+        response = self.client.get("/blog/?cursor=not-a-cursor")
+        self.assertEqual(self.titles(response), ["Post 4", "Post 3"])
+        self.assertIsNone(response.context["previous_query"])
+
+    def test_static_export_variants_cover_every_page(self):
+        self.assertEqual(self.blog_index.get_static_export_variants(), [{"page": 2}, {"page": 3}])
+        self.blog_index.pagination = "cursor"
+        self.assertEqual(len(self.blog_index.get_static_export_variants()), 2)
+
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "query plan text is SQLite's")
+    def test_listing_walks_the_depth_index_newest_first(self):
+        plan = self.blog_index.get_blog_posts().order_by("-first_published_at", "-pk")[:3].explain()
+        self.assertIn("USING INDEX home_page_depth_published_idx (depth=?)", plan)
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_zero_posts_per_page_is_rejected_and_served_as_one(self):
+        self.blog_index.posts_per_page = 0
+        with self.assertRaises(ValidationError):
+            self.blog_index.full_clean()
+
+        BlogIndexPage.objects.filter(pk=self.blog_index.pk).update(posts_per_page=0)
+        response = self.client.get("/blog/?page=2")
+        self.assertEqual(self.titles(response), ["Post 3"])
+        self.assertEqual(len(BlogIndexPage.objects.get(pk=self.blog_index.pk).get_static_export_variants()), 4)
+
+class BlogIndexQueryTests(WagtailPageTestCase):
+    """
+    The blog listing must cost the same number of queries however many posts it shows.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog", posts_per_page=20)
+        homepage.add_child(instance=self.blog_index)
+
+    def add_posts(self, count):
+        for _ in range(count):
+            number = BlogPage.objects.count()
+            image = Image.objects.create(title=f"Image {number}", file=get_test_image_file())
+            image.get_rendition(BlogIndexPage.LISTING_IMAGE_FILTER)
+            post = BlogPage(
+                title=f"Post {number}", slug=f"post-{number}", date="2024-01-01",
+                intro=f"Intro {number}", body=[], featured_image=image,
+            )
+            self.blog_index.add_child(instance=post)
+            post.save_revision().publish()
+
+    def count_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/blog/")
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_posts(self):
+        self.add_posts(1)
+        baseline = self.count_queries()
+        self.add_posts(5)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_listing_defers_body(self):
+        self.add_posts(1)
+        post = self.blog_index.get_blog_posts()[0]
+        self.assertIn("body", post.get_deferred_fields())
+        self.assertEqual(post.intro, "Intro 0")
+
+
+class BlogTagTests(WagtailPageTestCase):
+    """
+    Tests for blog post tags and the tag-filtered blog index.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog", posts_per_page=2)
+        homepage.add_child(instance=self.blog_index)
+        self.posts = [
+            self.add_post(0, ["Kubernetes", "Terraform"]),
+            self.add_post(1, ["Kubernetes"]),
+            self.add_post(2, ["Kubernetes"]),
+            self.add_post(3, []),
+        ]
+
+    def add_post(self, number, tags):
+        post = BlogPage(title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro="Intro", body=[])
+        post.tags.add(*tags)
+        self.blog_index.add_child(instance=post)
+        return post
+
+    def test_tag_counts(self):
+        self.assertEqual(self.blog_index.get_tag_counts(), [
+            {"name": "Kubernetes", "slug": "kubernetes", "count": 3},
+            {"name": "Terraform", "slug": "terraform", "count": 1},
+        ])
+        with self.assertNumQueries(0):
+            self.blog_index.get_tag_counts()
+
+    def test_tag_counts_follow_publishing(self):
+        self.blog_index.get_tag_counts()
+        self.posts[0].unpublish()
+        self.assertEqual(self.blog_index.get_tag_counts(), [{"name": "Kubernetes", "slug": "kubernetes", "count": 2}])
+
+        self.posts[3].tags.add("Terraform")
+        self.posts[3].save_revision().publish()
+        self.assertEqual(self.blog_index.get_tag_counts()[1], {"name": "Terraform", "slug": "terraform", "count": 1})
+
+    def test_tag_listing_filters_and_paginates(self):
+        response = self.client.get("/blog/?tag=kubernetes")
+        self.assertEqual(len(response.context["blog_posts"]), 2)
+        self.assertEqual(response.context["current_tag"]["name"], "Kubernetes")
+        self.assertEqual(response.context["next_query"], "tag=kubernetes&page=2")
+
+        response = self.client.get("/blog/?" + response.context["next_query"])
+        self.assertEqual([post.title for post in response.context["blog_posts"]], ["Post 0"])
+
+    def test_unknown_tag_is_not_found(self):
+        self.assertEqual(self.client.get("/blog/?tag=missing").status_code, 404)
+
+    def test_post_links_to_its_tags(self):
+        response = self.client.get("/blog/post-0/")
+        self.assertContains(response, 'href="/blog/?tag=terraform"')
+
+    def test_static_export_variants_include_tags(self):
+        self.assertEqual(self.blog_index.get_static_export_variants(), [
+            {"page": 2},
+            {"tag": "kubernetes"},
+            {"tag": "kubernetes", "page": 2},
+            {"tag": "terraform"},
+        ])
+
+
+class TechnologyFacetTests(WagtailPageTestCase):
+    """
+    Tests for the technology facet table and the filterable project index.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page.specific
+        self.project_index = ProjectIndexPage(title="Projects", slug="projects")
+        self.homepage.add_child(instance=self.project_index)
+        self.projects = [
+            self.add_project("Platform", "Kubernetes, Terraform,terraform"),
+            self.add_project("Pipelines", "kubernetes\n  GitHub   Actions"),
+            self.add_project("Notes", ""),
+        ]
+        image = Image.objects.create(title="Portfolio", file=get_test_image_file())
+        self.homepage.content = [("portfolio", [
+            {"title": "Cluster tooling", "description": "<p>Tools</p>", "image": image,
+             "project_link": "https://example.com/tooling", "technologies": ["Go", "Kubernetes"]},
+            {"title": "Docs site", "description": "<p>Docs</p>", "image": image, "technologies": []},
+        ])]
+        self.homepage.save_revision().publish()
+
+    def add_project(self, title, technologies):
+        project = ProjectPage(title=title, slug=slugify(title), summary=f"{title} summary", technologies=technologies)
+        self.project_index.add_child(instance=project)
+        project.save_revision().publish()
+        return project
+
+    def test_publish_writes_normalized_facets(self):
+        self.assertEqual(
+            sorted(TechnologyFacet.objects.filter(page=self.projects[1]).values_list("name", "slug")),
+            [("GitHub Actions", "github-actions"), ("kubernetes", "kubernetes")],
+        )
+        self.assertEqual(TechnologyFacet.objects.filter(page=self.projects[0], slug="terraform").count(), 1)
+        portfolio = TechnologyFacet.objects.filter(page=self.homepage).exclude(item_id="")
+        self.assertEqual(sorted(portfolio.values_list("slug", flat=True)), ["go", "kubernetes"])
+        self.assertEqual(portfolio.first().link, "https://example.com/tooling")
+
+    def test_technology_counts_are_cached(self):
+        self.assertEqual(self.project_index.get_technology_counts(), [
+            {"name": "Kubernetes", "slug": "kubernetes", "count": 3},
+            {"name": "GitHub Actions", "slug": "github-actions", "count": 1},
+            {"name": "Go", "slug": "go", "count": 1},
+            {"name": "Terraform", "slug": "terraform", "count": 1},
+        ])
+        with self.assertNumQueries(0):
+            self.project_index.get_technology_counts()
+
+    def test_counts_follow_publishing(self):
+        self.project_index.get_technology_counts()
+        self.projects[0].technologies = "Ansible"
+        self.projects[0].save_revision().publish()
+        self.projects[1].unpublish()
+        counts = {technology["slug"]: technology["count"] for technology in self.project_index.get_technology_counts()}
+        self.assertEqual(counts, {"ansible": 1, "go": 1, "kubernetes": 1})
+
+        self.projects[0].delete()
+        self.assertNotIn("ansible", [technology["slug"] for technology in self.project_index.get_technology_counts()])
+
+    def test_filtered_listing(self):
+        response = self.client.get("/projects/?technology=kubernetes")
+        self.assertEqual([project.title for project in response.context["projects"]], ["Platform", "Pipelines"])
+        self.assertEqual([item.title for item in response.context["portfolio_items"]], ["Cluster tooling"])
+        self.assertContains(response, 'href="https://example.com/tooling"')
+
+        response = self.client.get("/projects/")
+        self.assertEqual(len(response.context["projects"]), 3)
+        self.assertEqual(self.client.get("/projects/?technology=cobol").status_code, 404)
+
+
+    def test_values_too_long_for_their_columns_do_not_fail_the_publish(self):
+        project = self.add_project("Legacy", "COBOL, " + "x" * 150)
+        self.assertEqual(list(TechnologyFacet.objects.filter(page=project).values_list("slug", flat=True)), ["cobol"])
+
+        self.homepage.content = [("portfolio", [
+            {"title": "T" * 300, "description": "<p>Long</p>", "image": Image.objects.first(),
+             "project_link": "https://example.com/" + "a" * 300, "technologies": ["Go"]},
+        ])]
+        self.homepage.save_revision().publish()
+        facet = TechnologyFacet.objects.get(page=self.homepage)
+        self.assertEqual((len(facet.title), facet.link), (255, ""))
+
+    def test_migration_builds_the_rows_publishing_would(self):
+        migration = importlib.import_module("home.migrations.0010_technology_facets")
+        raw_data = self.homepage.content.raw_data
+        for block in raw_data:
+            block.pop("id", None)
+            for item in block["value"]:
+                item.pop("id", None)
+        HomePage.objects.filter(pk=self.homepage.pk).update(content=list(raw_data))
+        homepage = HomePage.objects.get(pk=self.homepage.pk)
+        published = {(row.item_id, row.slug) for row in facets.page_facets(homepage)}
+
+        TechnologyFacet.objects.all().delete()
+        migration.build_facets(apps, None)
+        built = set(TechnologyFacet.objects.filter(page=homepage).values_list("item_id", "slug"))
+        self.assertEqual(built, published)
+        self.assertIn(("0:0", "go"), built)
+
+class BreadcrumbTests(WagtailPageTestCase):
+    """
+    Tests for the cached breadcrumb trail.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.homepage.add_child(instance=self.blog_index)
+        self.post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[])
+        self.blog_index.add_child(instance=self.post)
+        self.factory = RequestFactory()
+
+    def breadcrumbs(self):
+        return get_breadcrumbs(self.post, self.factory.get("/blog/post/"))
+
+    def test_breadcrumbs_list_non_root_ancestors(self):
+        self.assertEqual(
+            [crumb["title"] for crumb in self.breadcrumbs()],
+            [self.homepage.title, "Blog"],
+        )
+        self.assertEqual(self.breadcrumbs()[-1]["url"], "/blog/")
+
+    def test_cached_breadcrumbs_cost_no_queries(self):
+        self.breadcrumbs()
+        with self.assertNumQueries(0):
+            self.breadcrumbs()
+
+    def test_ancestor_title_change_rebuilds_breadcrumbs(self):
+        self.breadcrumbs()
+        self.blog_index.title = "Insights"
+        self.blog_index.save_revision().publish()
+        self.assertEqual(self.breadcrumbs()[-1]["title"], "Insights")
+
+    def test_page_renders_breadcrumbs(self):
+        response = self.client.get("/blog/post/")
+        self.assertContains(response, '<a href="/blog/">Blog</a>', html=True)
+
+
+class NavigationMenuTests(WagtailPageTestCase):
+    """
+    Tests for the tree-driven header menu.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.homepage.add_child(instance=self.blog_index)
+        self.factory = RequestFactory()
+
+    def menu(self):
+        return get_menu(self.factory.get("/"))
+
+    def test_menu_lists_live_show_in_menus_children(self):
+        self.homepage.add_child(instance=BlogIndexPage(title="Hidden", slug="hidden", show_in_menus=False))
+        self.assertEqual(
+            [(item["title"], item["url"]) for item in self.menu()["items"]],
+            [("Blog", "/blog/")],
+        )
+
+    def test_cached_menu_costs_no_queries(self):
+        self.menu()
+        with self.assertNumQueries(0):
+            self.menu()
+
+    def test_publishing_menu_page_invalidates_menu_and_cached_pages(self):
+        self.client.get("/blog/")
+        self.assertEqual(self.client.get("/blog/")["X-Page-Cache"], "hit")
+
+        notes = BlogIndexPage(title="Notes", slug="notes", live=False)
+        self.homepage.add_child(instance=notes)
+        notes.save_revision().publish()
+
+        self.assertEqual([item["title"] for item in self.menu()["items"]], ["Blog", "Notes"])
+        response = self.client.get("/blog/")
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        self.assertContains(response, '<a href="/notes/" class="nav-link ">Notes</a>', html=True)
+
+    def test_current_section_is_active(self):
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[])
+        self.blog_index.add_child(instance=post)
+        response = self.client.get("/blog/post/")
+        self.assertContains(response, '<a href="/blog/" class="nav-link active">Blog</a>', html=True)
+
+
+@override_settings(
+    RENDITION_WARMUP_WORKERS=0,
+    RENDITION_WARMUP_FILTERS=["fill-400x300", "fill-1200x600"],
+    RESPONSIVE_IMAGE_WIDTHS=[200],
+    RESPONSIVE_IMAGE_FORMATS=["webp"],
+)
+class RenditionWarmupTests(WagtailPageTestCase):
+    """
+    Tests for generating template renditions ahead of the first view.
+    """
+
+    WARMED_SPECS = {
+        "fill-200x150", "fill-400x300", "fill-200x150|format-webp", "fill-400x300|format-webp",
+        "fill-200x100", "fill-1200x600", "fill-200x100|format-webp", "fill-1200x600|format-webp",
+    }
+
+    def rendition_specs(self, image):
+        return set(image.renditions.values_list("filter_spec", flat=True))
+
+    def test_upload_warms_renditions_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(title="Upload", file=get_test_image_file())
+        self.assertEqual(self.rendition_specs(image), self.WARMED_SPECS)
+
+    def test_publish_warms_referenced_images(self):
+        image = Image.objects.create(title="Featured", file=get_test_image_file())
+        homepage = Site.objects.get(is_default_site=True).root_page
+        blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=blog_index)
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[], live=False)
+        blog_index.add_child(instance=post)
+        post.featured_image = image
+        self.assertEqual(self.rendition_specs(image), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save_revision().publish()
+        self.assertEqual(self.rendition_specs(image), self.WARMED_SPECS)
+
+    def test_command_warms_library(self):
+        image = Image.objects.create(title="Library", file=get_test_image_file())
+        call_command("warm_renditions", workers=1, filters=["max-100x100"], stdout=io.StringIO())
+        self.assertEqual(self.rendition_specs(image), {"max-100x100"})
+
+    def test_command_warms_the_responsive_sets_by_default(self):
+        image = Image.objects.create(title="Library", file=get_test_image_file())
+        call_command("warm_renditions", workers=1, stdout=io.StringIO())
+        self.assertEqual(self.rendition_specs(image), self.WARMED_SPECS)
+
+    def test_publish_finds_images_without_the_private_reference_api(self):
+        image = Image.objects.create(title="Featured", file=get_test_image_file())
+        homepage = Site.objects.get(is_default_site=True).root_page
+        post = BlogPage(title="Post", slug="post", date="2024-01-01", intro="Intro", body=[], featured_image=image)
+        homepage.add_child(instance=post)
+        with mock.patch.object(page_cache, "_extract_references", None):
+            self.assertEqual(renditions.page_image_ids(post), {image.pk})
+
+    @override_settings(RENDITION_WARMUP_WORKERS=1)
+    def test_failed_warmups_are_logged_and_a_broken_pool_replaced(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(setattr, renditions, "_executor", None)
+        for error in (OSError("storage unavailable"), BrokenProcessPool("worker died")):
+            renditions._executor = pool
+            with (
+                mock.patch.object(renditions, "warm_images", side_effect=error),
+                self.assertLogs("home.renditions", "ERROR") as logs,
+            ):
+                renditions._submit([1, 2])
+                pool.submit(lambda: None).result()
+            self.assertIn("failed for images [1, 2]", logs.output[0])
+        self.assertIsNone(renditions._executor)
+        pool.shutdown()
+
+
+class PageImageStoreTests(WagtailPageTestCase):
+    """
+    Tests for batching a page's image and rendition lookups.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=blog_index)
+        self.images = [Image.objects.create(title=f"Image {number}", file=get_test_image_file()) for number in range(4)]
+        self.post = BlogPage(
+            title="Post",
+            slug="post",
+            date="2024-01-01",
+            intro="Intro",
+            featured_image=self.images[0],
+            body=[("image", image) for image in self.images[1:]],
+        )
+        blog_index.add_child(instance=self.post)
+        for image in self.images:
+            image.get_renditions("original", "fill-1200x600")
+
+    def test_images_and_renditions_are_fetched_in_one_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/blog/post/")
+        self.assertEqual(response.status_code, 200)
+        for image in self.images[1:]:
+            self.assertContains(response, image.get_rendition("original").url)
+
+        tables = [query["sql"].split(" FROM ")[1].split()[0] for query in queries if " FROM " in query["sql"]]
+        self.assertEqual(tables.count('"wagtailimages_image"'), 1)
+        self.assertEqual(tables.count('"wagtailimages_rendition"'), 1)
+
+    def test_store_is_cleared_after_the_response(self):
+        self.client.get("/blog/post/")
+        self.assertIsNone(_image_store.get())
+
+    def test_store_is_cleared_when_rendering_fails(self):
+        with mock.patch.object(
+            SimpleTemplateResponse, "rendered_content", new_callable=mock.PropertyMock, side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.get("/blog/post/")
+        self.assertIsNone(_image_store.get())
+
+
+@override_settings(RENDITION_WARMUP_WORKERS=0, RESPONSIVE_IMAGE_WIDTHS=[200, 800], RESPONSIVE_IMAGE_FORMATS=["webp"])
+class ResponsiveImageTests(WagtailPageTestCase):
+    """
+    Tests for responsive rendition sets and the responsive_image tag.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.image = Image.objects.create(title="Photo", file=get_test_image_file())
+
+    def render(self, spec="fill-400x300"):
+        template = Template('{% load image_tags %}{% responsive_image image spec sizes="50vw" class="photo" %}')
+        return template.render(Context({"image": self.image, "spec": spec}))
+
+    def test_specs_cover_narrower_widths_and_formats(self):
+        self.assertEqual(
+            responsive_filter_specs("fill-400x300|jpegquality-70"),
+            [
+                ("webp", ["fill-200x150|jpegquality-70|format-webp", "fill-400x300|jpegquality-70|format-webp"]),
+                (None, ["fill-200x150|jpegquality-70", "fill-400x300|jpegquality-70"]),
+            ],
+        )
+        self.assertEqual(responsive_filter_specs("width-300")[-1], (None, ["width-200", "width-300"]))
+        self.assertEqual(responsive_filter_specs("original")[-1], (None, ["original"]))
+
+    def test_first_render_falls_back_and_queues_the_set(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            html = self.render()
+        base = self.image.get_rendition("fill-400x300")
+        self.assertInHTML(
+            f'<picture><img src="{base.url}" srcset="{base.url} 400w" sizes="50vw" '
+            f'width="400" height="300" alt="Photo" class="photo"></picture>',
+            html,
+        )
+        self.assertEqual(self.image.renditions.count(), 4)
+
+        html = self.render()
+        webp = self.image.get_rendition("fill-200x150|format-webp")
+        self.assertIn(f'<source type="image/webp" srcset="{webp.url} 200w, ', html)
+        self.assertIn(f'srcset="{self.image.get_rendition("fill-200x150").url} 200w, {base.url} 400w"', html)
+
+    def test_finishing_the_set_replaces_the_image_version(self):
+        key = page_cache.object_version_key(Image, self.image.pk)
+        versions = page_cache.snapshot_versions([key])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.render()
+        self.assertFalse(page_cache.versions_match(versions))
+
+        # Warming a complete set leaves cached pages alone
+        versions = page_cache.snapshot_versions([key])
+        specs = [spec for _, variant_specs in responsive_filter_specs("fill-400x300") for spec in variant_specs]
+        renditions.warm_images([self.image.pk], specs)
+        self.assertTrue(page_cache.versions_match(versions))
+
+    def test_complete_set_is_served_from_one_cache_entry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.render()
+        html = self.render()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+
+    @unittest.skipUnless(avif_supported(), "Pillow cannot write AVIF")
+    @override_settings(RESPONSIVE_IMAGE_FORMATS=["avif", "webp"])
+    def test_avif_source_comes_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.render()
+        html = self.render()
+        self.assertLess(html.index('type="image/avif"'), html.index('type="image/webp"'))
+
+
+class SearchFieldsTests(WagtailPageTestCase):
+    """
+    Tests for the search_fields definitions and pre-extracted StreamField text.
+    """
+
+    def setUp(self):
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=self.blog_index)
+
+    def add_post(self, number, body_text):
+        post = BlogPage(
+            title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro=f"Intro {number}",
+            body=[("heading", "Deploying"), ("paragraph", f"<p>{body_text}</p>")],
+        )
+        self.blog_index.add_child(instance=post)
+        return post
+
+    def test_stream_text_is_extracted_on_save(self):
+        post = self.add_post(1, "Kubernetes <b>operators</b>")
+        self.assertEqual(post.search_text, "Deploying\nKubernetes operators")
+
+    def test_stream_text_is_re_extracted_on_publish(self):
+        post = self.add_post(1, "Kubernetes operators")
+        post.body = [("paragraph", "<p>Terraform modules</p>")]
+        post.save_revision().publish()
+        post.refresh_from_db()
+        self.assertEqual(post.search_text, "Terraform modules")
+
+    def test_search_matches_stream_text_and_returns_specific_pages(self):
+        # Index updates run once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(3):
+                self.add_post(number, "Kubernetes operators" if number else "Ansible playbooks")
+
+        response = self.client.get("/search/", {"query": "kubernetes"})
+        results = list(response.context["search_results"])
+        self.assertEqual(sorted(result.title for result in results), ["Post 1", "Post 2"])
+        self.assertTrue(all(isinstance(result, BlogPage) for result in results))
+        self.assertContains(response, "Intro 1")
+
+
+class SearchResultsCacheTests(WagtailPageTestCase):
+    """
+    Tests for the cached, normalized search results.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=self.blog_index)
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(3):
+                self.add_post(number)
+
+    def add_post(self, number):
+        post = BlogPage(
+            title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro=f"Intro {number}",
+            body=[("paragraph", "<p>Kubernetes operators</p>")],
+        )
+        self.blog_index.add_child(instance=post)
+        return post
+
+    def search(self, query, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/search/", {"query": query, **params})
+        index_queries = [query for query in queries if "wagtailsearch_indexentry" in query["sql"]]
+        return response, index_queries
+
+    def test_query_normalization(self):
+        self.assertEqual(normalize_query("  Kubernetes,\tOPERATORS! "), "kubernetes operators")
+
+    def test_repeated_and_equivalent_queries_skip_the_index(self):
+        response, index_queries = self.search("kubernetes operators")
+        self.assertTrue(index_queries)
+        self.assertEqual(len(response.context["search_results"]), 3)
+
+        response, index_queries = self.search("  KUBERNETES   operators!", page=1)
+        self.assertEqual(index_queries, [])
+        self.assertEqual(len(response.context["search_results"]), 3)
+
+    def test_publish_invalidates_cached_results(self):
+        self.search("kubernetes")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_post(3).save_revision().publish()
+        response, index_queries = self.search("kubernetes")
+        self.assertTrue(index_queries)
+        self.assertEqual(len(response.context["search_results"]), 4)
+
+    async def test_async_client_gets_results(self):
+        response = await self.async_client.get("/search/", {"query": "kubernetes"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["search_results"]), 3)
+
+
+@override_settings(SEARCH_AUTOCOMPLETE_RECHECK=0)
+class SearchAutocompleteTests(WagtailPageTestCase):
+    """
+    Tests for the autocomplete endpoint and its prefix index.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        self.blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=self.blog_index)
+        self.post = self.add_post("Kubernetes operators in practice", ["kubernetes", "Platform engineering"])
+        self.add_post("Operating Terraform at scale", ["terraform"])
+
+    def add_post(self, title, tags):
+        post = BlogPage(title=title, slug=slugify(title), date="2024-01-01", intro="Intro", body=[])
+        post.tags.add(*tags)
+        self.blog_index.add_child(instance=post)
+        return post
+
+    def suggest(self, query, **params):
+        response = self.client.get("/search/autocomplete/", {"query": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(result["type"], result["title"]) for result in response.json()["results"]]
+
+    def test_prefix_matches_titles_then_tags(self):
+        self.assertEqual(
+            self.suggest("kub"),
+            [("page", "Kubernetes operators in practice"), ("tag", "kubernetes")],
+        )
+        self.assertEqual(
+            self.suggest("oper"),
+            [("page", "Operating Terraform at scale"), ("page", "Kubernetes operators in practice")],
+        )
+        self.assertEqual(self.suggest("kubernetes op"), [("page", "Kubernetes operators in practice")])
+        self.assertEqual(self.suggest("plat")[0], ("tag", "Platform engineering"))
+        self.assertEqual(len(self.suggest("o", limit=1)), 1)
+
+    def test_lookups_do_not_query_the_database(self):
+        self.suggest("kub")
+        with self.assertNumQueries(0):
+            self.suggest("kube")
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "test_cache"}},
+        SEARCH_AUTOCOMPLETE_RECHECK=60,
+    )
+    def test_keystrokes_do_not_query_a_database_cache(self):
+        # Production falls back to DatabaseCache, where every cache lookup is a query
+        call_command("createcachetable", stdout=io.StringIO())
+        self.suggest("kub")
+        with self.assertNumQueries(0):
+            self.suggest("kube")
+
+    def test_publish_and_unpublish_update_the_index(self):
+        self.suggest("kub")
+        self.post.title = "Kubernetes controllers"
+        self.post.save_revision().publish()
+        self.assertEqual(self.suggest("kubernetes c"), [("page", "Kubernetes controllers")])
+
+        self.post.unpublish()
+        self.assertEqual(self.suggest("kub"), [])
+
+    def test_publishing_a_new_page_adds_its_entry_and_id(self):
+        self.suggest("kub")
+        post = self.add_post("Kustomize overlays", [])
+        post.save_revision().publish()
+        self.assertIn(post.pk, page_cache.get_cache().get(autocomplete.IDS_KEY))
+        self.assertEqual(self.suggest("kus"), [("page", "Kustomize overlays")])
+
+    def test_a_held_lock_drops_the_id_list_for_a_rebuild(self):
+        self.suggest("kub")
+        page_cache.get_cache().add(autocomplete.IDS_LOCK_KEY, True)
+        post = self.add_post("Kustomize overlays", [])
+        with mock.patch("search.autocomplete.time.sleep"):
+            post.save_revision().publish()
+        self.assertIsNone(page_cache.get_cache().get(autocomplete.IDS_KEY))
+        self.assertEqual(self.suggest("kus"), [("page", "Kustomize overlays")])
+
+    async def test_async_client_gets_suggestions(self):
+        response = await self.async_client.get("/search/autocomplete/", {"query": "kub"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["title"], "Kubernetes operators in practice")
+
+
+class SearchPaginationTests(WagtailPageTestCase):
+    """
+    Tests for count-free search pagination.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=blog_index)
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(25):
+                blog_index.add_child(instance=BlogPage(
+                    title=f"Kubernetes {number}", slug=f"post-{number}", date="2024-01-01", intro="Intro", body=[],
+                ))
+
+    def search(self, **params):
+        return self.client.get("/search/", {"query": "kubernetes", **params})
+
+    def test_first_page_fetches_one_extra_result_and_no_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search()
+        results = response.context["search_results"]
+        self.assertEqual(len(results), 10)
+        self.assertTrue(results.has_next())
+        self.assertFalse(results.has_previous())
+        self.assertIsNone(response.context["result_count"])
+        self.assertFalse(any("COUNT(" in query["sql"].upper() for query in queries))
+        self.assertTrue(any("LIMIT 11" in query["sql"] for query in queries))
+        self.assertContains(response, "page=2")
+
+    def test_last_page_knows_the_total(self):
+        response = self.search(page=3)
+        results = response.context["search_results"]
+        self.assertEqual(len(results), 5)
+        self.assertFalse(results.has_next())
+        self.assertEqual(response.context["result_count"], 25)
+        self.assertContains(response, "25 results")
+
+    def test_page_past_the_end_shows_the_last_page(self):
+        response = self.search(page=9)
+        self.assertEqual(response.context["search_results"].number, 3)
+
+    @override_settings(SEARCH_PAGINATION="numbered")
+    def test_numbered_mode_counts_every_match(self):
+        response = self.search(page=2)
+        self.assertEqual(len(response.context["search_results"]), 10)
+        self.assertEqual(response.context["result_count"], 25)
+
+    @override_settings(SEARCH_PAGINATION="numbered")
+    def test_numbered_mode_labels_a_capped_count(self):
+        with mock.patch("search.results.MAX_RESULTS", 20), mock.patch("search.views.MAX_RESULTS", 20):
+            response = self.search(page=5)
+        self.assertEqual(response.context["search_results"].number, 2)
+        self.assertEqual(response.context["search_results"].paginator.num_pages, 2)
+        self.assertContains(response, "20+ results")
+
+    def test_count_free_pages_stop_at_the_cap(self):
+        with mock.patch("search.results.MAX_RESULTS", 20):
+            response = self.search(page=3)
+        results = response.context["search_results"]
+        self.assertEqual((results.number, len(results), results.has_next()), (2, 10, False))
+        self.assertIsNone(response.context["result_count"])
+
+
+@override_settings(SEARCH_HIT_FLUSH_THRESHOLD=3, SEARCH_HIT_FLUSH_INTERVAL=3600)
+class SearchHitLoggingTests(WagtailPageTestCase):
+    """
+    Tests for buffered search hit logging and promoted results.
+    """
+
+    def setUp(self):
+        cache.clear()
+        # Start from an empty buffer and tables, whatever earlier tests searched for
+        hits.flush()
+        Query.objects.all().delete()
+
+    def daily_hits(self):
+        return dict(QueryDailyHits.objects.values_list("query__query_string", "hits"))
+
+    def test_hits_are_buffered_until_the_threshold(self):
+        with self.assertNumQueries(0):
+            hits.record_hit("Kubernetes")
+            hits.record_hit("kubernetes ")
+        self.assertEqual(self.daily_hits(), {})
+
+        hits.record_hit("terraform")
+        self.assertEqual(self.daily_hits(), {"kubernetes": 2, "terraform": 1})
+
+    def test_flush_adds_to_existing_counts(self):
+        hits.record_hit("kubernetes")
+        hits.flush()
+        hits.record_hit("kubernetes")
+        hits.record_hit("kubernetes")
+        hits.flush()
+        self.assertEqual(self.daily_hits(), {"kubernetes": 3})
+        self.assertEqual(Query.objects.count(), 1)
+
+    def test_an_idle_buffer_is_flushed_by_a_timer(self):
+        with mock.patch.object(hits, "_timer", None), mock.patch("search.hits.threading.Timer") as timer:
+            hits.record_hit("kubernetes")
+            hits.record_hit("terraform")
+            timer.assert_called_once_with(3600, hits._timed_flush)
+            self.assertTrue(timer.return_value.daemon)
+            timer.return_value.start.assert_called_once_with()
+
+            # What the timer thread runs once the interval is up
+            hits._timed_flush()
+            self.assertIsNone(hits._timer)
+        self.assertEqual(self.daily_hits(), {"kubernetes": 1, "terraform": 1})
+
+    def test_search_view_records_hits_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/search/", {"query": "kubernetes"})
+        self.assertFalse(any("wagtailsearchpromotions" in query["sql"] for query in queries if "INSERT" in query["sql"]))
+        hits.flush()
+        self.assertEqual(self.daily_hits(), {"kubernetes": 1})
+
+    def test_promoted_results_are_shown_and_follow_edits(self):
+        homepage = Site.objects.get(is_default_site=True).root_page
+        blog_index = BlogIndexPage(title="Blog", slug="blog")
+        homepage.add_child(instance=blog_index)
+        promotion = SearchPromotion.objects.create(
+            query=Query.get("kubernetes"), page=blog_index, description="All our writing"
+        )
+
+        response = self.client.get("/search/", {"query": "Kubernetes"})
+        self.assertEqual(
+            response.context["promoted_results"],
+            [{"title": "Blog", "url": "/blog/", "description": "All our writing"}],
+        )
+        self.assertContains(response, "All our writing")
+
+        promotion.delete()
+        response = self.client.get("/search/", {"query": "Kubernetes"})
+        self.assertEqual(response.context["promoted_results"], [])
+
+
+class HealthCheckTests(TestCase):
+    """
+    Tests for the liveness and readiness probes.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(health_check, "monitor", health_check.HealthMonitor(health_check.CHECKS))
+        self.monitor = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Checks are run by hand rather than on the background thread
+        self.monitor.ensure_started = lambda: None
+
+    def test_liveness_does_no_io(self):
+        with (
+            self.assertNumQueries(0),
+            mock.patch.object(health_check, "cache") as health_cache,
+            mock.patch("home.page_cache.get_cache") as page_cache_get,
+        ):
+            response = self.client.get("/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "healthy")
+        self.assertFalse(health_cache.method_calls)
+        page_cache_get.assert_not_called()
+
+    def test_readiness_is_starting_until_checks_have_run(self):
+        response = self.client.get("/ready/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "starting")
+
+    @override_settings(STATIC_ROOT=tempfile.gettempdir())
+    def test_readiness_reports_stored_results_with_timings(self):
+        self.monitor.run_checks()
+        with self.assertNumQueries(0):
+            response = self.client.get("/ready/")
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()["checks"]
+        self.assertEqual(set(checks), {"database", "cache", "static_files"})
+        self.assertTrue(all(check["duration_ms"] >= 0 for check in checks.values()))
+
+    @override_settings(STATIC_ROOT="/nonexistent/static")
+    def test_failed_check_is_not_ready(self):
+        self.monitor.run_checks()
+        response = self.client.get("/ready/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["checks"]["static_files"]["status"], "not_ready")
+        self.assertIn("error", response.json()["checks"]["static_files"])
+
+    @override_settings(STATIC_ROOT=tempfile.gettempdir(), HEALTH_CHECK_INTERVAL=0)
+    def test_stale_results_are_not_ready(self):
+        self.monitor.run_checks()
+        self.assertEqual(self.client.get("/ready/").json()["status"], "stale")
+
+    async def test_probes_answer_the_async_client(self):
+        response = await self.async_client.get("/health/")
+        self.assertEqual(response.json()["status"], "healthy")
+        response = await self.async_client.get("/ready/")
+        self.assertEqual(response.status_code, 503)
+
+    def test_monitor_thread_runs_checks(self):
+        monitor = health_check.HealthMonitor({"noop": lambda: None})
+        with override_settings(HEALTH_CHECK_INTERVAL=60):
+            monitor.ensure_started()
+            for _ in range(100):
+                if monitor.completed_at is not None:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(monitor.results["noop"]["status"], "ready")
+
+
+class MetricsTests(WagtailPageTestCase):
+    """
+    Tests for request, database, cache and template metrics.
+    """
+
+    def setUp(self):
+        cache.clear()
+        homepage = Site.objects.get(is_default_site=True).root_page
+        homepage.add_child(instance=BlogIndexPage(title="Blog", slug="blog"))
+
+    def sample(self, name, **labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_page_requests_are_labelled_with_view_and_page_type(self):
+        labels = {"view": "wagtail_serve", "page_type": "home.blogindexpage", "method": "GET", "status": "200"}
+        requests = self.sample("django_request_duration_seconds_count", **labels)
+        queries = self.sample("django_request_db_queries_sum", view="wagtail_serve")
+        renders = self.sample("django_template_render_duration_seconds_count", template="home/blog_index_page.html")
+
+        self.client.get("/blog/")
+        self.assertEqual(self.sample("django_request_duration_seconds_count", **labels), requests + 1)
+        self.assertGreater(self.sample("django_request_db_queries_sum", view="wagtail_serve"), queries)
+        self.assertEqual(
+            self.sample("django_template_render_duration_seconds_count", template="home/blog_index_page.html"),
+            renders + 1,
+        )
+
+        # Page cache hits never reach the page serving view; the entry keeps the page type
+        response = self.client.get("/blog/")
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertEqual(self.sample("django_request_duration_seconds_count", **labels), requests + 2)
+
+    def test_cache_hits_and_misses_are_counted_per_alias(self):
+        hits = self.sample("django_cache_requests_total", alias="default", result="hit")
+        misses = self.sample("django_cache_requests_total", alias="default", result="miss")
+        metrics.instrument()
+        cache.get("metrics-test")
+        cache.set("metrics-test", 1)
+        cache.get("metrics-test")
+        cache.get_many(["metrics-test", "metrics-missing"])
+        self.assertEqual(self.sample("django_cache_requests_total", alias="default", result="hit"), hits + 2)
+        self.assertEqual(self.sample("django_cache_requests_total", alias="default", result="miss"), misses + 2)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/health/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'django_request_duration_seconds_bucket{', response.content)
+        self.assertIn(b'view="health_check"', response.content)
+
+    @override_settings(METRICS_ALLOWED_NETWORKS=["10.0.0.0/8"], METRICS_TOKEN="scrape-me")
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.1.2.3").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-me").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+
+    async def test_queries_in_worker_threads_are_counted(self):
+        def select_one():
+            # On the worker thread's own connection, which cannot see this test's tables
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.close()
+
+        stats = metrics._QueryStats()
+        with metrics.observe_queries(stats):
+            await sync_to_async(select_one, thread_sensitive=False)()
+        self.assertEqual(stats.count, 1)
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("benchmark_metrics", iterations=10, stdout=out)
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()], ["request", "cache", "query"])
+
+
+class QueryBudgetTests(QueryBudgetMixin, WagtailPageTestCase):
+    """
+    Query budgets for a cold render of each page type, and the profiler behind them.
+    """
+
+    query_budgets = {
+        "home.homepage": 10,
+        "home.blogindexpage": 16,
+        "home.blogpage": 16,
+        "home.projectindexpage": 17,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page.specific
+        image = Image.objects.create(title="Image", file=get_test_image_file())
+        self.homepage.content = [
+            ("hero", {"heading": "Hello", "image": image}),
+            ("portfolio", [
+                {"title": f"Item {number}", "description": "<p>Item</p>", "image": image, "technologies": ["Go"]}
+                for number in range(3)
+            ]),
+        ]
+        self.homepage.save_revision().publish()
+
+        blog_index = BlogIndexPage(title="Blog", slug="blog")
+        self.homepage.add_child(instance=blog_index)
+        project_index = ProjectIndexPage(title="Projects", slug="projects")
+        self.homepage.add_child(instance=project_index)
+        for number in range(5):
+            post = BlogPage(
+                title=f"Post {number}", slug=f"post-{number}", date="2024-01-01", intro="Intro",
+                featured_image=image, body=[("paragraph", "<p>Body</p>"), ("image", image)],
+            )
+            post.tags.add("Kubernetes", f"Tag {number}")
+            blog_index.add_child(instance=post)
+            post.save_revision().publish()
+            project = ProjectPage(title=f"Project {number}", slug=f"project-{number}", summary="Summary",
+                                  technologies="Go", featured_image=image)
+            project_index.add_child(instance=project)
+            project.save_revision().publish()
+
+    def test_page_types_are_within_budget(self):
+        for path in ["/", "/blog/", "/blog/?tag=kubernetes", "/blog/post-0/", "/projects/", "/projects/?technology=go"]:
+            with self.subTest(path=path):
+                # The first render generates the image renditions
+                self.client.get(path)
+                self.assertWithinQueryBudget(path)
+
+    def test_repeated_shapes_are_flagged_with_their_origin(self):
+        profile = QueryProfile()
+        with profile.capture():
+            for post in BlogPage.objects.all()[:3]:
+                Page.objects.get(pk=post.pk)
+        ((shape, queries),) = profile.repeated_shapes()
+        self.assertEqual(len(queries), 3)
+        self.assertIn("home/tests.py", queries[0].origin)
+        with self.assertRaises(AssertionError):
+            self.assertNoRepeatedQueries(profile)
+
+    def test_query_shape_folds_literals_and_in_lists(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+    @override_settings(QUERY_PROFILING=True)
+    def test_middleware_adds_header_and_logs_summary(self):
+        with self.assertLogs("home.profiling", "INFO") as logs:
+            response = self.client.get("/blog/")
+        self.assertRegex(response["X-Query-Profile"], r"^queries=\d+; time-ms=[\d.]+; repeated=0$")
+        self.assertIn("GET /blog/: ", logs.output[0])
+
+    def test_middleware_is_off_by_default(self):
+        self.assertNotIn("X-Query-Profile", self.client.get("/blog/"))
+
+
+class BulkPageLoaderTests(WagtailPageTestCase):
+    """
+    Tests for batched page creation.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.homepage = Site.objects.get(is_default_site=True).root_page
+        self.image = Image.objects.create(title="Image", file=get_test_image_file())
+
+    def load(self, posts=3, batch_size=2, **kwargs):
+        loader = BulkPageLoader(batch_size=batch_size, **kwargs)
+        tag = BlogPageTag.tag_model().objects.get_or_create(name="Kubernetes")[0]
+        blog_index = loader.add(BlogIndexPage(title="Blog", slug="blog"), self.homepage)
+        for number in range(posts):
+            post = BlogPage(
+                title=f"Post {number}", slug=f"post-{number}", date=datetime.date(2024, 1, 1), intro="Intro",
+                body=[("paragraph", "<p>Kubernetes operators</p>"), ("image", self.image)],
+            )
+            post.tags.add(tag)
+            loader.add(post, blog_index)
+        loader.add(ProjectPage(title="Project", slug="project", summary="Summary", technologies="Go"), self.homepage)
+        self.assertEqual(loader.finish(), posts + 2)
+        return blog_index
+
+    def test_pages_are_placed_in_the_tree(self):
+        blog_index = self.load()
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        self.assertEqual(
+            [page.url_path for page in blog_index.get_children()],
+            ["/home/blog/post-0/", "/home/blog/post-1/", "/home/blog/post-2/"],
+        )
+        self.assertEqual(Page.objects.get(pk=self.homepage.pk).numchild, 2)
+        post = BlogPage.objects.get(slug="post-1")
+        self.assertEqual(post.draft_title, "Post 1")
+        self.assertEqual(post.search_text, "Kubernetes operators")
+        self.assertEqual(list(post.tags.names()), ["Kubernetes"])
+        self.assertEqual(self.client.get("/blog/post-1/").status_code, 200)
+        self.assertContains(self.client.get("/blog/"), "Post 2")
+
+    def test_revisions_references_facets_and_search(self):
+        self.load()
+        post = BlogPage.objects.get(slug="post-0")
+        self.assertEqual(post.live_revision, post.latest_revision)
+        self.assertEqual([tag.name for tag in post.latest_revision.as_object().tags.all()], ["Kubernetes"])
+        self.assertTrue(
+            ReferenceIndex.get_references_to(self.image).filter(object_id=str(post.pk)).exists()
+        )
+        self.assertEqual(
+            list(TechnologyFacet.objects.values_list("slug", "title")), [("go", "Project")],
+        )
+        self.assertEqual({page.slug for page in BlogPage.objects.search("operators")}, {"post-0", "post-1", "post-2"})
+
+    def test_revisions_can_be_skipped(self):
+        self.load(revisions=False)
+        self.assertIsNone(BlogPage.objects.get(slug="post-0").latest_revision)
+
+    def test_children_follow_existing_children(self):
+        blog_index = self.load(posts=1)
+        loader = BulkPageLoader()
+        loader.add(BlogPage(title="Later", date=datetime.date(2024, 1, 2), intro="Intro"), blog_index)
+        with self.assertRaises(ValidationError):
+            loader.add(BlogPage(title="Post 0", slug="post-0", date=datetime.date(2024, 1, 2), intro="Intro"), blog_index)
+        loader.finish()
+        self.assertEqual([page.slug for page in blog_index.get_children()], ["post-0", "later"])
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+
+    @override_settings(RENDITION_WARMUP_WORKERS=0)
+    def test_command_loads_generated_pages_under_a_listing(self):
+        self.homepage.add_child(instance=ProjectIndexPage(title="Projects", slug="projects"))
+        stdout = io.StringIO()
+        call_command("bulk_load_pages", "/projects/", count=3, images=1, stdout=stdout)
+        self.assertIn("Added 3 pages under /home/projects/", stdout.getvalue())
+        self.assertEqual(ProjectPage.objects.live().count(), 3)
+        with self.assertRaisesMessage(CommandError, "neither a blog index nor a project index"):
+            call_command("bulk_load_pages", "/", count=1, stdout=stdout)
+
+    def test_queries_do_not_grow_with_the_number_of_pages(self):
+        def load(posts):
+            BlogIndexPage.objects.get().delete()
+            ProjectPage.objects.get().delete()
+            with CaptureQueriesContext(connection) as queries:
+                self.load(posts=posts, batch_size=100)
+            return len(queries)
+
+        # The first load also creates the tag and looks up content types
+        self.load()
+        self.assertEqual(load(2), load(20))
+
+
+@override_settings(RENDITION_WARMUP_WORKERS=0)
+class BenchmarkTests(WagtailPageTestCase):
+    """
+    The synthetic content tree and the WSGI benchmark run over it.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog_index, self.project_index = benchmark.seed_tree(4, 2, images=2)
+
+    def test_seed_tree_builds_tagged_posts_and_projects_with_galleries(self):
+        posts = BlogPage.objects.child_of(self.blog_index).live()
+        self.assertEqual(posts.count(), 4)
+        self.assertTrue(all(post.tags.exists() for post in posts))
+        projects = ProjectPage.objects.child_of(self.project_index).live()
+        self.assertEqual(projects.count(), 2)
+        for project in projects:
+            self.assertIn("gallery", [block.block_type for block in project.content])
+        self.assertEqual(
+            TechnologyFacet.objects.filter(page__in=projects, item_id="").count(),
+            sum(len(project.technologies.split(", ")) for project in projects),
+        )
+
+        benchmark.seed_tree(1, 0, images=2)
+        self.assertEqual(self.blog_index.get_children().count(), 5)
+        self.assertEqual(Image.objects.count(), 2)
+
+    def test_command_saves_results_for_every_endpoint(self):
+        output = os.path.join(self.output, "run.json")
+        call_command(
+            "benchmark_site", requests=3, concurrency=1, warmup=1, output=output, stdout=io.StringIO(),
+        )
+        with open(output) as f:
+            result = json.load(f)
+        self.assertEqual(result["tree"]["blog_posts"], 4)
+        self.assertEqual(set(result["phases"]), {"serial"})
+        self.assertEqual(set(result["phases"]["serial"]), set(benchmark.ENDPOINTS))
+        for endpoint, stats in result["phases"]["serial"].items():
+            self.assertEqual((stats["requests"], stats["errors"]), (3, 0), endpoint)
+            latency = stats["latency_ms"]
+            self.assertLessEqual(latency["p50"], latency["p95"])
+            self.assertLessEqual(latency["p95"], latency["p99"])
+        self.assertEqual(result["phases"]["serial"]["health"]["queries"]["max"], 0)
+
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_site", requests=3, concurrency=1, warmup=1, endpoints=["health"],
+            output=os.path.join(self.output, "again.json"), compare=output, stdout=stdout,
+        )
+        self.assertIn("serial     health       p50 ms", stdout.getvalue())
+
+    def test_server_comparison_runs_both_applications(self):
+        # Only the health probe: other threads cannot see this test's data
+        output = os.path.join(self.output, "servers.json")
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_site", servers=True, requests=4, clients=2, slots=1, query_delay_ms=0, warmup=1,
+            endpoints=["health"], output=output, stdout=stdout,
+        )
+        with open(output) as f:
+            result = json.load(f)
+        self.assertEqual(set(result["phases"]), set(benchmark.SERVER_MODES))
+        for mode in benchmark.SERVER_MODES:
+            stats = result["phases"][mode]["health"]
+            self.assertEqual((stats["requests"], stats["errors"]), (4, 0), mode)
+        self.assertIn("asgi       health", stdout.getvalue())
+
+    def test_concurrency_needs_a_shared_database(self):
+        with self.assertRaisesMessage(CommandError, "in-memory SQLite"):
+            call_command("benchmark_site", requests=1, concurrency=2, output=os.devnull, stdout=io.StringIO())
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+
+class ContentTransferTests(WagtailPageTestCase):
+    """
+    JSON Lines export and the resumable import keyed by URL path.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        self.homepage = Site.objects.get(is_default_site=True).root_page
+        self.image = Image.objects.create(title="Image", file=get_test_image_file())
+        loader = BulkPageLoader()
+        tag = BlogPageTag.tag_model().objects.create(name="Kubernetes")
+        self.blog_index = loader.add(BlogIndexPage(title="Blog", slug="blog"), self.homepage)
+        for number in range(3):
+            post = BlogPage(
+                title=f"Post {number}", slug=f"post-{number}", date=datetime.date(2024, 1, 1), intro="Intro",
+                featured_image=self.image, body=[("paragraph", "<p>Operators</p>"), ("image", self.image)],
+            )
+            post.tags.add(tag)
+            loader.add(post, self.blog_index)
+        loader.add(ProjectPage(title="Project", slug="project", summary="Summary", technologies="Go"), self.homepage)
+        loader.finish()
+
+    def export(self, **kwargs):
+        path = os.path.join(self.output, "pages.jsonl")
+        with open(path, "w") as f:
+            export_pages(f, **kwargs)
+        with open(path) as f:
+            return path, [json.loads(line) for line in f]
+
+    def write(self, records):
+        path = os.path.join(self.output, "edited.jsonl")
+        with open(path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        return path
+
+    def test_export_writes_pages_in_tree_order_with_stream_data_tags_and_images(self):
+        path, records = self.export(root=self.blog_index)
+        self.assertEqual(
+            [record["url_path"] for record in records],
+            ["/home/blog/", "/home/blog/post-0/", "/home/blog/post-1/", "/home/blog/post-2/"],
+        )
+        post = records[1]
+        self.assertEqual(post["type"], "home.blogpage")
+        self.assertEqual(post["fields"]["tags"], ["Kubernetes"])
+        self.assertEqual(post["fields"]["featured_image_id"], self.image.pk)
+        self.assertEqual([block["type"] for block in post["fields"]["body"]], ["paragraph", "image"])
+        self.assertEqual(post["images"][str(self.image.pk)]["file"], self.image.file.name)
+        self.assertNotIn("path", post["fields"])
+        self.assertNotIn("latest_revision_id", post["fields"])
+
+    def test_import_updates_existing_pages_and_recreates_missing_ones(self):
+        path, records = self.export()
+        BlogPage.objects.get(slug="post-2").delete()
+        post = BlogPage.objects.get(slug="post-1")
+        post.title = "Edited"
+        post.save_revision().publish()
+
+        stdout = io.StringIO()
+        call_command("import_pages", path, batch_size=2, stdout=stdout)
+        self.assertIn("Created 1 pages and updated 5", stdout.getvalue())
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        self.assertEqual(
+            [page.slug for page in self.blog_index.get_children()], ["post-0", "post-1", "post-2"],
+        )
+        post = BlogPage.objects.get(slug="post-1")
+        self.assertEqual((post.title, post.live_revision.content["title"]), ("Post 1", "Post 1"))
+        restored = BlogPage.objects.get(slug="post-2")
+        self.assertEqual(list(restored.tags.names()), ["Kubernetes"])
+        self.assertEqual(restored.body[1].value, self.image)
+        self.assertTrue(ReferenceIndex.get_references_to(self.image).filter(object_id=str(restored.pk)).exists())
+        self.assertEqual(BlogPageTag.objects.count(), 3)
+        self.assertFalse(os.path.exists(path + ".state"))
+
+    def test_import_matches_images_by_file_and_replaces_tags(self):
+        path, records = self.export(root=self.blog_index)
+        post = records[1]
+        post["images"] = {"999": post["images"][str(self.image.pk)], "998": {"title": "Gone", "file": "gone.png"}}
+        post["fields"]["featured_image_id"] = 999
+        post["fields"]["body"][1]["value"] = 998
+        post["fields"]["tags"] = ["Go"]
+        post["fields"]["title"] = "Operators, revisited"
+
+        importer = PageImporter(self.write(records))
+        self.assertEqual(importer.run(), (0, 4))
+        self.assertEqual(importer.missing_images, {998})
+        post = BlogPage.objects.get(slug="post-0")
+        self.assertEqual(post.featured_image, self.image)
+        self.assertIsNone(post.body[1].value)
+        self.assertEqual(list(post.tags.names()), ["Go"])
+        self.assertEqual(list(BlogPage.objects.search("revisited")), [post])
+
+    def test_import_resumes_after_the_last_committed_batch(self):
+        path, records = self.export()
+        BlogIndexPage.objects.get().delete()
+        importer = PageImporter(path, batch_size=2)
+        import_batch = importer._import_batch
+        batches = []
+
+        def interrupted(lines):
+            batches.append(lines)
+            if len(batches) == 2:
+                raise KeyboardInterrupt
+            import_batch(lines)
+
+        with mock.patch.object(importer, "_import_batch", interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                importer.run()
+        with open(path + ".state") as f:
+            self.assertEqual(json.load(f)["line"], 2)
+        blog_index = BlogIndexPage.objects.get()
+        self.assertFalse(BlogPage.objects.child_of(blog_index).exists())
+
+        importer = PageImporter(path, batch_size=2)
+        self.assertEqual(importer.run(resume=True), (4, 2))
+        self.assertEqual(
+            [page.slug for page in BlogPage.objects.child_of(blog_index)], ["post-0", "post-1", "post-2"],
+        )
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+
+    def test_resume_refuses_a_changed_file(self):
+        _, records = self.export()
+        path = self.write(records)
+        with open(path + ".state", "w") as f:
+            json.dump({"path": os.path.abspath(path), "size": 1, "mtime_ns": 1, "line": 1, "offset": 1}, f)
+        with self.assertRaisesMessage(CommandError, "has changed since the interrupted import"):
+            call_command("import_pages", path, resume=True, stdout=io.StringIO())
+
+    def test_unknown_parents_and_types_are_reported_with_their_line(self):
+        _, records = self.export(root=self.blog_index)
+        records[2]["url_path"] = "/home/missing/post-1/"
+        with self.assertRaisesMessage(CommandError, "edited.jsonl:3: /home/missing/post-1/ has no parent page"):
+            call_command("import_pages", self.write(records), stdout=io.StringIO())
+        records[2]["type"] = "wagtailcore.page"
+        with self.assertRaisesMessage(CommandError, "wagtailcore.page is not a page type of this site"):
+            call_command("import_pages", self.write(records), stdout=io.StringIO())
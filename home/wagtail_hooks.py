@@ -0,0 +1,85 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from wagtail import hooks
+
+from . import page_cache, renditions
+
+
+@hooks.register('before_serve_page')
+def snapshot_page_cache_versions(page, request, serve_args, serve_kwargs):
+    """Mark the request as cacheable and record the versions it renders against"""
+    if page_cache.is_anonymous_request(request) and not getattr(request, 'is_preview', False):
+        request.page_cache_versions = page_cache.snapshot_versions(
+            page_cache.page_dependency_keys(page)
+        )
+
+
+@hooks.register('before_serve_page')
+def record_page_type(page, request, serve_args, serve_kwargs):
+    """Label the request's metrics with the type of page served"""
+    request.metrics_page_type = page._meta.label_lower
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, max_age=0, must_revalidate=True)
+
+
+@hooks.register('on_serve_page')
+def serve_page_conditionally(next_serve_page):
+    """
+    Answer conditional GETs with a 304 before the page is rendered, and add
+    ETag / Last-Modified headers derived from the page cache versions
+    """
+
+    def serve(page, request, serve_args, serve_kwargs):
+        versions = getattr(request, 'page_cache_versions', None)
+        if not versions or request.method not in ('GET', 'HEAD'):
+            return next_serve_page(page, request, serve_args, serve_kwargs)
+
+        etag, last_modified = page_cache.page_validators(page, versions)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            _set_validators(not_modified, etag, last_modified)
+            return not_modified
+
+        response = next_serve_page(page, request, serve_args, serve_kwargs)
+        if response.status_code != 200:
+            return response
+
+        def add_validators(rendered):
+            # A page that hands out a CSRF token must always be fetched in full
+            if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                _set_validators(rendered, etag, last_modified)
+
+        if getattr(response, 'is_rendered', True):
+            add_validators(response)
+        else:
+            response.add_post_render_callback(add_validators)
+        return response
+
+    return serve
+
+
+@hooks.register('on_serve_page')
+def serve_page_with_image_store(next_serve_page):
+    """
+    Fetch the page's images and their renditions in one batch before it is
+    rendered, rather than one query per image and rendition
+    """
+
+    def serve(page, request, serve_args, serve_kwargs):
+        token = renditions.activate_image_store(page)
+        try:
+            response = next_serve_page(page, request, serve_args, serve_kwargs)
+            # Rendered here so the store is reset even when rendering raises;
+            # otherwise it would outlive the request in this thread
+            if not getattr(response, 'is_rendered', True):
+                response.render()
+            return response
+        finally:
+            renditions.deactivate_image_store(token)
+
+    return serve
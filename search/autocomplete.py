@@ -0,0 +1,226 @@
+"""
+Prefix index for search autocomplete
+
+The titles, URLs and tags of live pages are kept in the page cache backend
+under one key per page, plus the list of their ids. Publishing a page
+rewrites just its key; adding or removing a page also changes the id list,
+under a short lock so concurrent publishes in different processes do not
+lose each other's changes. Moves (which change descendant URLs) drop the
+list so everything is rebuilt from the database on next use, as is any
+missing entry. Each process turns the entries
+into sorted word arrays and answers prefix lookups with a binary search, only
+rechecking the shared version every ``SEARCH_AUTOCOMPLETE_RECHECK`` seconds,
+so a keystroke never touches the database, and under ASGI rarely leaves the
+event loop.
+"""
+import re
+import time
+from bisect import bisect_left
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import reverse
+from wagtail.models import Page
+
+from home import page_cache
+
+IDS_KEY = "search:autocomplete:ids"
+IDS_LOCK_KEY = "search:autocomplete:ids:lock"
+VERSION_KEY = "search:autocomplete:version"
+
+_words = re.compile(r"\w+")
+
+_index = None
+_checked_at = 0.0
+
+
+def _split_words(text):
+    return _words.findall(text.casefold())
+
+
+def _page_tags(page):
+    tags = getattr(page, "tags", None)
+    return sorted(tags.names()) if tags is not None else []
+
+
+def _page_entry(page, tags=None):
+    url = page.get_url()
+    if url is None:
+        return None
+    return {"title": page.title, "url": url, "tags": _page_tags(page) if tags is None else tags}
+
+
+def _load_entries():
+    """Entries for every live page, built from the database"""
+    from home.models import BlogPageTag
+
+    tags = {}
+    tagged_items = BlogPageTag.objects.filter(content_object__live=True).values_list("content_object_id", "tag__name")
+    for pk, name in tagged_items.order_by("tag__name"):
+        tags.setdefault(pk, []).append(name)
+
+    entries = {}
+    for page in Page.objects.live().filter(depth__gt=1).only("pk", "title", "url_path"):
+        entry = _page_entry(page, tags.get(page.pk, []))
+        if entry is not None:
+            entries[page.pk] = entry
+    return entries
+
+
+def _entry_key(pk):
+    return f"search:autocomplete:page:{pk}"
+
+
+def _get_entries():
+    cache = page_cache.get_cache()
+    ids = cache.get(IDS_KEY)
+    if ids is not None:
+        stored = cache.get_many([_entry_key(pk) for pk in ids])
+        if len(stored) == len(ids):
+            return {pk: stored[_entry_key(pk)] for pk in ids}
+    entries = _load_entries()
+    cache.set_many({_entry_key(pk): entry for pk, entry in entries.items()}, timeout=None)
+    cache.set(IDS_KEY, sorted(entries), timeout=None)
+    return entries
+
+
+def _change_ids(change):
+    """Apply ``change`` to the stored id list while holding its lock, or drop the list"""
+    cache = page_cache.get_cache()
+    for _ in range(50):
+        if cache.add(IDS_LOCK_KEY, True, timeout=5):
+            try:
+                ids = cache.get(IDS_KEY)
+                if ids is not None:
+                    cache.set(IDS_KEY, sorted(change(set(ids))), timeout=None)
+            finally:
+                cache.delete(IDS_LOCK_KEY)
+            return
+        time.sleep(0.01)
+    # Rebuilt from the database on next use
+    cache.delete(IDS_KEY)
+
+
+def _replace_entry(page, entry):
+    cache = page_cache.get_cache()
+    previous = cache.get(_entry_key(page.pk))
+    if previous and entry and previous["url"] != entry["url"] and page.numchild:
+        # A new slug moves every page below too
+        cache.delete(IDS_KEY)
+    elif entry is None:
+        _change_ids(lambda ids: ids - {page.pk})
+        cache.delete(_entry_key(page.pk))
+    else:
+        cache.set(_entry_key(page.pk), entry, timeout=None)
+        if previous is None:
+            _change_ids(lambda ids: ids | {page.pk})
+    page_cache.bump_versions([VERSION_KEY])
+
+
+def update_page(page):
+    _replace_entry(page, _page_entry(page))
+
+
+def remove_page(page):
+    _replace_entry(page, None)
+
+
+def reset():
+    page_cache.get_cache().delete(IDS_KEY)
+    page_cache.bump_versions([VERSION_KEY])
+
+
+class PrefixIndex:
+    """Sorted words of titles and tags, each pointing at the suggestion it came from"""
+
+    def __init__(self, entries):
+        search_url = reverse("search")
+        self.suggestions = []
+        self.suggestion_words = []
+        pairs = []
+
+        tags = {}
+        for entry in sorted(entries.values(), key=lambda entry: entry["title"].casefold()):
+            self._add(pairs, entry["title"], entry["url"], "page")
+            for tag in entry["tags"]:
+                tags.setdefault(tag.casefold(), tag)
+        for tag in sorted(tags.values(), key=str.casefold):
+            self._add(pairs, tag, f"{search_url}?{urlencode({'query': tag})}", "tag")
+
+        pairs.sort()
+        self.words = [word for word, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def _add(self, pairs, title, url, kind):
+        position = len(self.suggestions)
+        words = _split_words(title)
+        self.suggestions.append({"title": title, "url": url, "type": kind})
+        self.suggestion_words.append(words)
+        pairs.extend((word, position) for word in set(words))
+
+    def lookup(self, query, limit):
+        """
+        Suggestions with a word starting with each word of ``query``, pages
+        before tags and titles starting with the query first
+        """
+        words = _split_words(query)
+        if not words:
+            return []
+        *complete, prefix = words
+
+        matches = set()
+        i = bisect_left(self.words, prefix)
+        while i < len(self.words) and self.words[i].startswith(prefix):
+            position = self.positions[i]
+            if all(
+                any(word.startswith(other) for word in self.suggestion_words[position])
+                for other in complete
+            ):
+                matches.add(position)
+            i += 1
+
+        def rank(position):
+            title_words = self.suggestion_words[position]
+            starts_with_query = (
+                len(title_words) >= len(words)
+                and title_words[:len(complete)] == complete
+                and title_words[len(complete)].startswith(prefix)
+            )
+            return (not starts_with_query, position)
+
+        return [self.suggestions[position] for position in sorted(matches, key=rank)[:limit]]
+
+
+def _checked_index():
+    """This process's index if its version was checked recently, otherwise ``None``"""
+    if _index is not None and time.monotonic() - _checked_at < settings.SEARCH_AUTOCOMPLETE_RECHECK:
+        return _index[1]
+    return None
+
+
+def get_index():
+    """This process's index, rebuilt when another process has changed the entries"""
+    global _index, _checked_at
+    index = _checked_index()
+    if index is not None:
+        return index
+
+    now = time.monotonic()
+    version = page_cache.snapshot_versions([VERSION_KEY])[VERSION_KEY]
+    if _index is None or _index[0] != version:
+        _index = (version, PrefixIndex(_get_entries()))
+    _checked_at = now
+    return _index[1]
+
+
+def suggest(query, limit=8):
+    return get_index().lookup(query, limit)
+
+
+async def asuggest(query, limit=8):
+    """``suggest`` for async views: only a version recheck or rebuild goes to a thread"""
+    index = _checked_index()
+    if index is None:
+        index = await sync_to_async(get_index)()
+    return index.lookup(query, limit)
@@ -0,0 +1,125 @@
+"""
+Buffered search query hit logging
+
+Each search adds to an in-process counter instead of writing a row. The
+counter is flushed to the search promotions tables (``Query`` and
+``QueryDailyHits``) in one transaction of bulk statements once
+``SEARCH_HIT_FLUSH_THRESHOLD`` hits have built up, by a timer thread
+``SEARCH_HIT_FLUSH_INTERVAL`` seconds after the first hit in the buffer (so an
+idle worker does not sit on its hits), and when the process exits. A process
+that is killed without exiting (SIGKILL, a worker timeout) loses at most one
+interval's hits; these are analytics.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections, models, transaction
+from django.utils import timezone
+from wagtail.contrib.search_promotions.models import Query, QueryDailyHits
+from wagtail.search.utils import normalise_query_string
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_buffer = Counter()
+_buffered = 0
+_timer = None
+_timer_pid = None
+
+
+def _schedule_flush():
+    """Start the flush timer unless this process already has one; call with ``_lock`` held"""
+    global _timer, _timer_pid
+    if _timer is not None and _timer_pid == os.getpid():
+        return
+    _timer = threading.Timer(settings.SEARCH_HIT_FLUSH_INTERVAL, _timed_flush)
+    _timer.name = "search-hit-flush"
+    _timer.daemon = True
+    _timer_pid = os.getpid()
+    _timer.start()
+
+
+def _timed_flush():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    finally:
+        connections.close_all()
+
+
+def _count(query_string):
+    """Buffer a hit, returning whether a flush is due"""
+    global _buffered
+    query_string = normalise_query_string(query_string)
+    if not query_string:
+        return False
+    with _lock:
+        _buffer[query_string, timezone.now().date()] += 1
+        _buffered += 1
+        _schedule_flush()
+        return _buffered >= settings.SEARCH_HIT_FLUSH_THRESHOLD
+
+
+def record_hit(query_string):
+    """Count a search for ``query_string``, flushing the buffer when it is due"""
+    if _count(query_string):
+        flush()
+
+
+async def arecord_hit(query_string):
+    """``record_hit`` for async views: only a due flush goes to a thread"""
+    if _count(query_string):
+        await sync_to_async(flush)()
+
+
+def flush():
+    """Write the buffered hits; on a database error they go back in the buffer"""
+    global _buffer, _buffered
+    with _lock:
+        hits, _buffer, _buffered = _buffer, Counter(), 0
+    if not hits:
+        return
+    try:
+        write_hits(hits)
+    except DatabaseError:
+        logger.exception("Could not write %d buffered search hits", sum(hits.values()))
+        with _lock:
+            _buffer.update(hits)
+            _buffered += sum(hits.values())
+            _schedule_flush()
+
+
+def write_hits(hits):
+    """
+    Add ``{(query_string, date): count}`` to the daily hit counts
+
+    Missing rows are inserted with no hits first, ignoring conflicts with
+    other processes doing the same, then every row is incremented in place,
+    one UPDATE per date and count rather than per query.
+    """
+    query_strings = {query_string for query_string, _ in hits}
+    with transaction.atomic():
+        Query.objects.bulk_create(
+            [Query(query_string=query_string) for query_string in query_strings], ignore_conflicts=True
+        )
+        query_ids = dict(Query.objects.filter(query_string__in=query_strings).values_list("query_string", "pk"))
+        QueryDailyHits.objects.bulk_create(
+            [QueryDailyHits(query_id=query_ids[query_string], date=date, hits=0) for query_string, date in hits],
+            ignore_conflicts=True,
+        )
+
+        increments = defaultdict(list)
+        for (query_string, date), count in hits.items():
+            increments[date, count].append(query_ids[query_string])
+        for (date, count), ids in increments.items():
+            QueryDailyHits.objects.filter(query_id__in=ids, date=date).update(hits=models.F("hits") + count)
+
+
+atexit.register(flush)
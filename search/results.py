@@ -0,0 +1,211 @@
+"""
+Cached search results
+
+Ranked page ids for a query are stored in the page cache backend under a key
+built from the normalized query, against the global search version that
+every publish, unpublish, move or delete replaces. Paging through results,
+or repeating a popular query, reads the id list from the cache and only
+loads the pages being shown. The ``a``-prefixed functions are the same for
+async views.
+"""
+import hashlib
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from wagtail.contrib.search_promotions.models import SearchPromotion
+from wagtail.models import Page
+from wagtail.search.backends import get_search_backend
+from wagtail.search.utils import normalise_query_string
+
+from home import page_cache
+
+# Ranked ids shown per query; deeper results are not reachable from the UI.
+# One more is kept, so a full list is known to be capped or not
+MAX_RESULTS = 200
+
+# Replaced whenever a promoted search result or its query changes
+PROMOTIONS_VERSION_KEY = "search:promotions:version"
+
+_words = re.compile(r"\w+")
+
+
+def normalize_query(query):
+    """
+    Key text for a query: queries with the same key return the same results
+
+    On PostgreSQL this is the backend's own ``plainto_tsquery``, so case,
+    punctuation, stop words and stemming are all ignored. Elsewhere it is the
+    lower-cased words of the query, matching the SQLite FTS tokenizer.
+    """
+    words = " ".join(_words.findall(query.casefold()))
+    if connection.vendor == "postgresql" and words:
+        # SEARCH_CONFIG is the backend's text search configuration; without
+        # one, both fall back to the database's default_text_search_config
+        config = getattr(get_search_backend(), "config", None)
+        with connection.cursor() as cursor:
+            if config:
+                cursor.execute("SELECT plainto_tsquery(%s::regconfig, %s)::text", [config, words])
+            else:
+                cursor.execute("SELECT plainto_tsquery(%s)::text", [words])
+            return cursor.fetchone()[0]
+    return words
+
+
+def _cache_key(normalized, kind="results"):
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"search:{kind}:{digest}"
+
+
+def search_page_ids(query, limit=MAX_RESULTS):
+    """
+    Return ``(ids, complete)``: ranked ids of up to ``limit`` live pages
+    matching ``query`` (at most ``MAX_RESULTS + 1``), and whether they are
+    all of the matches
+
+    The cached list is only extended as far as a request needs, so the first
+    page of results costs a query for ``limit`` rows rather than for every
+    match.
+    """
+    limit = min(limit, MAX_RESULTS + 1)
+    normalized = normalize_query(query)
+    if not normalized:
+        return [], True
+
+    cache = page_cache.get_cache()
+    key = _cache_key(normalized)
+    entry = cache.get(key)
+    if entry is None or not page_cache.versions_match(entry["versions"]):
+        entry = {
+            "ids": [],
+            "complete": False,
+            "versions": page_cache.snapshot_versions([page_cache.search_version_key()]),
+        }
+
+    ids = entry["ids"]
+    if not entry["complete"] and len(ids) < limit:
+        more = [page.pk for page in Page.objects.live().search(query)[len(ids):limit]]
+        entry["ids"] = ids = ids + more
+        entry["complete"] = len(ids) < limit
+        cache.set(key, entry, page_cache.PAGE_CACHE_TIMEOUT)
+    return ids[:limit], entry["complete"] and len(ids) <= limit
+
+
+async def asearch_page_ids(query, limit=MAX_RESULTS):
+    """
+    ``search_page_ids`` for async views; search backends have no async API,
+    so the lookup runs in a thread and the event loop is free meanwhile
+    """
+    return await sync_to_async(search_page_ids)(query, limit)
+
+
+class SearchResultsPage:
+    """
+    One page of search results that knows whether a next page exists
+    without counting every match; ``count`` is the number of matches when
+    all of them have been fetched, otherwise ``None``
+    """
+
+    def __init__(self, object_list, number, has_next, count=None):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _results_page(ids, complete, number, per_page):
+    if len(ids) > MAX_RESULTS:
+        ids, complete = ids[:MAX_RESULTS], False
+    if number > 1 and len(ids) <= (number - 1) * per_page:
+        # Past the end: show the last page there is
+        number = max(1, -(-len(ids) // per_page))
+    page_ids = ids[(number - 1) * per_page:number * per_page]
+    return SearchResultsPage(
+        page_ids,
+        number,
+        has_next=len(ids) > number * per_page,
+        count=len(ids) if complete else None,
+    )
+
+
+def capped_ids(ids, complete):
+    """
+    ``(ids, count)`` for numbered pagination: at most ``MAX_RESULTS`` ids,
+    and their number, as ``"200+"`` text when more matches were left out
+    """
+    if complete and len(ids) <= MAX_RESULTS:
+        return ids, len(ids)
+    return ids[:MAX_RESULTS], f"{MAX_RESULTS}+"
+
+
+def count_free_page(query, number, per_page):
+    """
+    Page ``number`` of the results for ``query``, fetching one row beyond it
+    to decide whether there is a next page
+    """
+    ids, complete = search_page_ids(query, limit=number * per_page + 1)
+    return _results_page(ids, complete, number, per_page)
+
+
+async def acount_free_page(query, number, per_page):
+    ids, complete = await asearch_page_ids(query, limit=number * per_page + 1)
+    return _results_page(ids, complete, number, per_page)
+
+
+def load_pages(ids):
+    """Specific live pages for ``ids``, in the same order"""
+    pages = Page.objects.live().filter(pk__in=ids).specific().in_bulk()
+    return [pages[pk] for pk in ids if pk in pages]
+
+
+async def aload_pages(ids):
+    pages = await Page.objects.live().filter(pk__in=ids).specific().ain_bulk()
+    return [pages[pk] for pk in ids if pk in pages]
+
+
+def promoted_results(query):
+    """
+    The promoted results for ``query`` as ``{'title', 'url', 'description'}``
+    dicts, cached until a promotion or any page changes
+    """
+    query_string = normalise_query_string(query)
+    if not query_string:
+        return []
+
+    cache = page_cache.get_cache()
+    key = _cache_key(query_string, kind="promotions")
+    entry = cache.get(key)
+    if entry is not None and page_cache.versions_match(entry["versions"]):
+        return entry["promotions"]
+
+    versions = page_cache.snapshot_versions([PROMOTIONS_VERSION_KEY, page_cache.search_version_key()])
+    promotions = []
+    for promotion in SearchPromotion.objects.filter(query__query_string=query_string).select_related("page"):
+        if promotion.page is not None and not promotion.page.live:
+            continue
+        url = promotion.page.get_url() if promotion.page is not None else promotion.external_link_url
+        promotions.append({"title": promotion.title, "url": url, "description": promotion.description})
+    cache.set(key, {"promotions": promotions, "versions": versions}, page_cache.PAGE_CACHE_TIMEOUT)
+    return promotions
+
+
+async def apromoted_results(query):
+    return await sync_to_async(promoted_results)(query)
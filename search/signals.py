@@ -0,0 +1,45 @@
+"""
+Signal receivers that keep the autocomplete index in step with live pages,
+and cached promoted results in step with their promotions
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.contrib.search_promotions.models import Query, SearchPromotion
+from wagtail.models import Page, Site
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from home import page_cache
+
+from . import autocomplete
+from .results import PROMOTIONS_VERSION_KEY
+
+
+@receiver(page_published)
+def update_autocomplete_on_publish(sender, instance, **kwargs):
+    autocomplete.update_page(instance)
+
+
+@receiver(page_unpublished)
+def update_autocomplete_on_unpublish(sender, instance, **kwargs):
+    autocomplete.remove_page(instance)
+
+
+@receiver(post_delete)
+def update_autocomplete_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        autocomplete.remove_page(instance)
+
+
+@receiver(post_page_move)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def reset_autocomplete(sender, instance, **kwargs):
+    # Every URL below the moved page (or of the whole site) may have changed
+    autocomplete.reset()
+
+
+@receiver(post_save, sender=SearchPromotion)
+@receiver(post_delete, sender=SearchPromotion)
+@receiver(post_delete, sender=Query)
+def invalidate_promoted_results(sender, instance, **kwargs):
+    page_cache.bump_versions([PROMOTIONS_VERSION_KEY])
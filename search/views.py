@@ -1,40 +1,49 @@
+from django.conf import settings
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import JsonResponse
 from django.template.response import TemplateResponse
 
-from wagtail.models import Page
+from .autocomplete import asuggest
+from .hits import arecord_hit
+from .results import MAX_RESULTS, acount_free_page, aload_pages, apromoted_results, asearch_page_ids, capped_ids
 
-# To enable logging of search queries for use with the "Promoted search results" module
-# <https://docs.wagtail.org/en/stable/reference/contrib/searchpromotions.html>
-# uncomment the following line and the lines indicated in the search function
-# (after adding wagtail.contrib.search_promotions to INSTALLED_APPS):
+RESULTS_PER_PAGE = 10
 
-# from wagtail.contrib.search_promotions.models import Query
+# These views are async so that, under ASGI, a slow search or database holds
+# an await rather than a worker; JSON endpoints added here should be too
 
 
-def search(request):
+async def search(request):
     search_query = request.GET.get("query", None)
     page = request.GET.get("page", 1)
 
-    # Search
+    # Log this query for the "Promoted search results" module; hits are
+    # buffered and written in batches, not once per request
     if search_query:
-        search_results = Page.objects.live().search(search_query)
-
-        # To log this query for use with the "Promoted search results" module:
-
-        # query = Query.get(search_query)
-        # query.add_hit()
+        await arecord_hit(search_query)
 
+    # Search and pagination
+    # Ranked ids come from the results cache; only the pages shown are loaded
+    if settings.SEARCH_PAGINATION == "count_free":
+        try:
+            number = max(int(page), 1)
+        except ValueError:
+            number = 1
+        search_results = await acount_free_page(search_query or "", number, RESULTS_PER_PAGE)
+        result_count = search_results.count
     else:
-        search_results = Page.objects.none()
+        ids, result_count = capped_ids(*await asearch_page_ids(search_query or "", MAX_RESULTS + 1))
+        paginator = Paginator(ids, RESULTS_PER_PAGE)
+        try:
+            search_results = paginator.page(page)
+        except PageNotAnInteger:
+            search_results = paginator.page(1)
+        except EmptyPage:
+            search_results = paginator.page(paginator.num_pages)
 
-    # Pagination
-    paginator = Paginator(search_results, 10)
-    try:
-        search_results = paginator.page(page)
-    except PageNotAnInteger:
-        search_results = paginator.page(1)
-    except EmptyPage:
-        search_results = paginator.page(paginator.num_pages)
+    # Specific pages, so results can show their own fields; the page types
+    # are fetched in one query each rather than one query per hit
+    search_results.object_list = await aload_pages(search_results.object_list)
 
     return TemplateResponse(
         request,
@@ -42,5 +51,16 @@ def search(request):
         {
             "search_query": search_query,
             "search_results": search_results,
+            "result_count": result_count,
+            "promoted_results": await apromoted_results(search_query or "") if search_results.number == 1 else [],
         },
     )
+
+
+async def autocomplete(request):
+    """Titles and tags starting with the words typed so far, as JSON"""
+    try:
+        limit = min(max(int(request.GET.get("limit", 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({"results": await asuggest(request.GET.get("query", ""), limit)})